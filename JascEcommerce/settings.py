@@ -106,10 +106,12 @@ MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware", # Soporte para CSS Azul Hermoso
     "corsheaders.middleware.CorsMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "store.instrumentacion.InstrumentacionConsultasMiddleware", # Consultas SQL y tiempos por vista
+    "store.sesiones.SesionMiddleware", # Sesiones: guarda solo si cambian y renueva a mitad de vida
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "store.perfilado.PerfiladoMiddleware", # Perfilado bajo demanda para staff (X-Perfilar)
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -181,7 +183,8 @@ STORAGES = {
 
 if not DEBUG:
     STORAGES["default"] = {
-        "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
+        # MediaCloudinaryStorage con URLs memorizadas en un LRU (store/storage.py)
+        "BACKEND": "store.storage.MediaCloudinaryStorageMemo",
     }
 
 MEDIA_URL = "/media/"
@@ -191,7 +194,7 @@ MEDIA_ROOT = BASE_DIR / "media"
 if DEBUG:
     DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
 else:
-    DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
+    DEFAULT_FILE_STORAGE = "store.storage.MediaCloudinaryStorageMemo"
 
 # Configuración Cloudinary para AVIF y Video de alta velocidad
 CLOUDINARY_STORAGE = {
@@ -200,6 +203,16 @@ CLOUDINARY_STORAGE = {
     "API_SECRET": config("CLOUDINARY_API_SECRET", default=""),
 }
 
+# Máximo de URLs de media memorizadas por proceso (store/storage.py)
+MEDIA_URL_CACHE_MAX = 5000
+
+# ================================
+# 🖼️ IMÁGENES RESPONSIVE (store/utils/imagenes.py)
+# ================================
+# Anchos (px) que genera el worker procesar_imagenes; AVIF requiere Pillow con soporte AVIF
+IMAGENES_ANCHOS = [320, 640, 960, 1280]
+IMAGENES_AVIF = config("IMAGENES_AVIF", default="False").lower() in ("true", "1", "yes")
+
 # ================================
 # 🔐 LOGIN / LOGOUT Y SESIONES (Sincronizado con URLs)
 # ================================
@@ -211,11 +224,56 @@ LOGOUT_URL = "usuario:logout"
 # Redirección tras salir (apunta al name="inicio" de tu urls.py principal)
 LOGOUT_REDIRECT_URL = "inicio"
 
-SESSION_SAVE_EVERY_REQUEST = True  
+# El carrito vive en store.Cart: la sesión solo se guarda cuando cambia y la
+# expiración se renueva a mitad de vida (store/sesiones.py)
+SESSION_ENGINE = "store.sesiones"
+SESSION_SAVE_EVERY_REQUEST = False
 SESSION_COOKIE_HTTPONLY = True
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_COOKIE_AGE = 86400  # 24 Horas de retención del cliente
 
+# Minutos que el checkout aparta el stock del cliente (store/utils/reservas.py)
+RESERVA_STOCK_MINUTOS = 15
+
+# Venta flash (store/utils/flash.py): vida del cupo en el checkout y de un
+# turno que dejó de consultar la fila
+FLASH_ADMISION_SEGUNDOS = 60 * 10
+FLASH_TURNO_SEGUNDOS = 30
+
+# ================================
+# 🗄️ CACHÉ
+# ================================
+# Con REDIS_URL la caché es compartida entre workers (las invalidaciones por
+# versión de catálogo llegan a todos); sin ella, memoria local por proceso.
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "jasc",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "jasc",
+        }
+    }
+# Sesiones calientes en caché solo si es compartida (cached_db, ver store/sesiones.py)
+SESIONES_EN_CACHE = bool(REDIS_URL)
+# Líneas del carrito en caché solo si es compartida (store/utils/carrito.py): con
+# una caché por worker, la escritura en un worker no borra la copia de los demás
+CARRITO_EN_CACHE = bool(REDIS_URL)
+# Ventas flash (store/utils/flash.py): las fichas y la fila viven en la caché y
+# solo son correctas si todos los workers y el scheduler ven la misma. Sin
+# Redis las VentaFlash se ignoran y se vende con el stock normal.
+FLASH_EN_CACHE = bool(REDIS_URL)
+# Reglas de promociones compiladas por proceso (store/utils/promociones.py): sin
+# caché compartida la invalidación no llega a los demás workers, se recompila seguido
+PROMOCIONES_REFRESCO_SEGUNDOS = 60 * 60 if REDIS_URL else 60
+
 # ================================
 # 📧 MAIL (SendGrid)
 # ================================
@@ -227,6 +285,9 @@ SENDGRID_ECHO_TO_STDOUT = True
 EMAIL_USE_TLS = True
 EMAIL_PORT = 587
 
+# En True no se llama a SendGrid (pruebas de carga, desarrollo local)
+CORREO_SIMULADO = config("CORREO_SIMULADO", default="False").lower() in ("true", "1", "yes")
+
 # ================================
 # 🆔 LLAVES PRIMARIAS Y TZ
 # ================================
@@ -237,6 +298,25 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ================================
 STATIC_VERSION = "20260204_LUZ_V2" # Cámbialo por algo nuevo
 
+# ================================
+# ⏱️ PRESUPUESTOS DE CONSULTAS (store/instrumentacion.py)
+# ================================
+# En True una vista que excede su @presupuesto_consultas lanza excepción
+# (útil en tests); en False solo se registra un warning.
+PRESUPUESTO_CONSULTAS_ESTRICTO = config("PRESUPUESTO_CONSULTAS_ESTRICTO", default="False").lower() in ("true", "1", "yes")
+
+# ================================
+# 📈 MÉTRICAS PROMETHEUS (store/metricas.py)
+# ================================
+# Token para que el scraper lea /store/metricas/ sin sesión de staff
+METRICAS_TOKEN = config("METRICAS_TOKEN", default="")
+
+# ================================
+# 🔬 PERFILADO BAJO DEMANDA (store/perfilado.py)
+# ================================
+PERFILADO_INTERVALO_SEGUNDOS = 10   # Mínimo entre dos perfilados por proceso
+PERFILADO_MAX_GUARDADOS = 50        # Tamaño del buffer circular en la base de datos
+
 # ================================
 # 📊 LOGGING
 # ================================
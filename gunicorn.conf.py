@@ -0,0 +1,21 @@
+# ================================
+# 🦄 Configuración de gunicorn (se carga sola desde la raíz del proyecto)
+# ================================
+import os
+import shutil
+
+# 📈 Métricas Prometheus en modo multiproceso (store/metricas.py).
+# La variable debe existir antes de que los workers importen prometheus_client.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/jasc_prometheus")
+
+
+def on_starting(server):
+    # Limpiamos los valores de un arranque anterior
+    carpeta = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(carpeta, ignore_errors=True)
+    os.makedirs(carpeta, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,8 @@
+from decimal import Decimal
+
+
 def calcular_total(carrito):
-    total = 0
+    total = Decimal("0")
     for item in carrito.values():
         if isinstance(item, dict):
             cantidad = int(item.get('cantidad', 0) or 0)
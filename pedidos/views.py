@@ -1,8 +1,11 @@
 from django.contrib import messages
 from django.shortcuts import redirect, render, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import Count
 from .models import Order
 from store.models import Product   # ✅ Importar el modelo correcto
+from store.utils.carrito import lineas_carrito
 from .utils import calcular_total
 
 
@@ -10,7 +13,7 @@ from .utils import calcular_total
 def confirmar_pago(request):
     if request.method == 'POST':
         metodo = request.POST.get('metodo_pago')
-        carrito = request.session.get('carrito', {})
+        carrito = lineas_carrito(request)
         print("Carrito recibido:", carrito)
 
         if not carrito:
@@ -43,8 +46,15 @@ def factura(request, order_id):
 
 @login_required
 def mis_pedidos(request):
-    pedidos = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'pedidos/mis_pedidos.html', {'pedidos': pedidos})
+    # Paginado y con el número de productos anotado en SQL (sin consultas por fila)
+    pedidos = (
+        Order.objects.filter(user=request.user)
+        .annotate(n_productos=Count('products'))
+        .order_by('-created_at', '-id')
+    )
+    paginator = Paginator(pedidos, 15)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'mis_pedidos.html', {'pedidos': page_obj})
 
 
 @login_required
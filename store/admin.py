@@ -2,13 +2,21 @@ from django.contrib import admin, messages
 from django.utils.html import format_html, format_html_join
 from django.urls import path
 from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db import models
 
 from .models import (
     Product, ProductImage, Factura, DetalleFactura, 
-    Banner, Category, Configuracion, ProductVariant
+    Banner, Category, Configuracion, ProductVariant, PerfilPeticion,
+    VentaDiariaCategoria, ResumenCliente, DiaVentasPendiente, Cart, CartLine, ReservaStock,
+    VentaFlash, Promocion,
 )
+from store.utils import flash
 from store.utils.email import enviar_factura  # ✅ Función oficial de envío
+from store.perfilado import firma_perfilado
+from store.utils.reportes import reporte_ventas
 
 # =====================================================
 # 📊 1. GESTIÓN DE INVENTARIO EN LÍNEA
@@ -202,4 +210,177 @@ class ProductVariantAdmin(admin.ModelAdmin):
 
 @admin.register(Configuracion)
 class ConfiguracionAdmin(admin.ModelAdmin):
-    list_display = ("id", "iva_activo") # Ajustado para que no de error si no hay iva_activo
\ No newline at end of file
+    list_display = ("id", "iva_activo") # Ajustado para que no de error si no hay iva_activo
+
+# =====================================================
+# 🔬 6. PERFILES DE PETICIONES (diagnóstico)
+# =====================================================
+@admin.register(PerfilPeticion)
+class PerfilPeticionAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "metodo", "ruta", "vista", "estado", "duracion_ms", "consultas", "tiempo_db_ms", "usuario")
+    list_filter = ("vista", "metodo", "perfilador")
+    search_fields = ("ruta", "vista")
+    fields = (
+        "fecha", "usuario", "metodo", "ruta", "vista", "estado",
+        "duracion_ms", "consultas", "tiempo_db_ms", "perfilador", "arbol_pre", "sql_pre",
+    )
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Enlace firmado para perfilar una página desde el navegador (vence en 10 min)
+        messages.info(
+            request,
+            f"Para perfilar una página agrega ?perfilar={firma_perfilado(request.user)} "
+            "a su URL o envía la cabecera 'X-Perfilar: 1'."
+        )
+        return super().changelist_view(request, extra_context)
+
+    def arbol_pre(self, obj):
+        return format_html('<pre style="max-height:600px; overflow:auto; font-size:11px;">{}</pre>', obj.arbol)
+    arbol_pre.short_description = "Árbol de llamadas"
+
+    def sql_pre(self, obj):
+        lineas = "\n".join(
+            f"+{c['inicio_ms']:>9.2f} ms  {c['dur_ms']:>8.2f} ms  {c['sql']}" for c in obj.sql
+        )
+        return format_html('<pre style="max-height:600px; overflow:auto; font-size:11px;">{}</pre>', lineas)
+    sql_pre.short_description = "Línea de tiempo SQL"
+
+# =====================================================
+# 📊 7. REPORTES DE VENTAS (solo leen rollups)
+# =====================================================
+@admin.register(VentaDiariaCategoria)
+class ReporteVentasAdmin(admin.ModelAdmin):
+    """
+    Reemplaza la lista por un reporte armado solo con los rollups diarios
+    (actualizar_reportes). Filtros: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD; por
+    defecto el mes en curso.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        hoy = timezone.localdate()
+        desde = _fecha_o_none(request.GET.get("desde")) or hoy.replace(day=1)
+        hasta = _fecha_o_none(request.GET.get("hasta")) or hoy
+        contexto = {
+            **self.admin_site.each_context(request),
+            "title": "Reporte de ventas",
+            "opts": self.model._meta,
+            "desde": desde,
+            "hasta": hasta,
+            "reporte": reporte_ventas(desde, hasta),
+            "dias_pendientes": DiaVentasPendiente.objects.count(),
+        }
+        return TemplateResponse(request, "admin/store/reporte_ventas.html", contexto)
+
+
+def _fecha_o_none(valor):
+    try:
+        return parse_date(valor or "")
+    except ValueError:
+        return None
+
+
+@admin.register(ResumenCliente)
+class ResumenClienteAdmin(admin.ModelAdmin):
+    list_display = ("usuario", "compras", "total_compras", "total_pagado", "ultima_compra", "pendiente")
+    list_select_related = ("usuario",)
+    list_filter = ("pendiente",)
+    search_fields = ("usuario__email", "usuario__username")
+    ordering = ("-total_compras",)
+    readonly_fields = [f.name for f in ResumenCliente._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+# =====================================================
+# 🛒 CARRITOS (persistentes; abandonados = updated_at viejo)
+# =====================================================
+class CartLineInline(admin.TabularInline):
+    model = CartLine
+    extra = 0
+    fields = ("product", "talla", "color", "cantidad", "precio")
+    readonly_fields = fields
+    can_delete = False
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ("id", "usuario", "unidades", "updated_at")
+    list_select_related = ("usuario",)
+    list_filter = ("updated_at",)
+    search_fields = ("usuario__email", "usuario__username")
+    date_hierarchy = "updated_at"
+    ordering = ("-updated_at",)
+    readonly_fields = ("usuario", "token", "created_at", "updated_at")
+    inlines = [CartLineInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(n_unidades=models.Sum("lineas__cantidad"))
+
+    @admin.display(description="Unidades", ordering="n_unidades")
+    def unidades(self, obj):
+        return obj.n_unidades or 0
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ReservaStock)
+class ReservaStockAdmin(admin.ModelAdmin):
+    list_display = ("product", "variante", "cantidad", "cart", "expira")
+    list_select_related = ("product", "variante")
+    ordering = ("-expira",)
+    readonly_fields = ("cart", "product", "variante", "cantidad", "expira")
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(VentaFlash)
+class VentaFlashAdmin(admin.ModelAdmin):
+    list_display = ("product", "inicio", "fin", "cupo_checkout", "fragmentos")
+    list_select_related = ("product",)
+    autocomplete_fields = ("product",)
+    ordering = ("-inicio",)
+
+    def _avisar_sin_cache(self, request):
+        if not flash.habilitada():
+            self.message_user(
+                request,
+                "Sin caché compartida (REDIS_URL) las ventas flash no se aplican: se vende con el stock normal.",
+                messages.WARNING,
+            )
+
+    def changelist_view(self, request, extra_context=None):
+        self._avisar_sin_cache(request)
+        return super().changelist_view(request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        if request.method == "GET":
+            self._avisar_sin_cache(request)
+        return super().changeform_view(request, object_id, form_url, extra_context)
+
+
+@admin.register(Promocion)
+class PromocionAdmin(admin.ModelAdmin):
+    list_display = ("nombre", "tipo", "valor", "codigo", "inicio", "fin", "activa")
+    list_filter = ("tipo", "activa")
+    search_fields = ("nombre", "codigo")
+    autocomplete_fields = ("productos", "categorias")
+    ordering = ("-inicio",)
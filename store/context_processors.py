@@ -1,4 +1,6 @@
-from .models import Category, ProductVariant, ProductImage
+from .models import Category
+from .utils.carrito import lineas_carrito
+from .utils.variantes import clave_variante, imagen_de_color, mapa_color_imagenes, variantes_por_clave
 from decimal import Decimal
 
 def menu_links(request):
@@ -9,7 +11,7 @@ def menu_links(request):
 
 def total_items_carrito(request):
     """Calcula totales y asegura que la imagen mostrada sea la del color elegido."""
-    carrito_sesion = request.session.get("carrito", {})
+    carrito_sesion = lineas_carrito(request)
     
     if not isinstance(carrito_sesion, dict):
         return {
@@ -22,6 +24,14 @@ def total_items_carrito(request):
     total_dinero = 0
     items_procesados = []
 
+    # Mapa de la lupa (caché por producto) y variantes de todo el carrito (antes: 2 consultas por línea)
+    ids = [
+        item.get("producto_id") for item in carrito_sesion.values()
+        if isinstance(item, dict) and item.get("producto_id")
+    ]
+    imagenes = mapa_color_imagenes(ids) if ids else {}
+    variantes = variantes_por_clave(ids) if ids else {}
+
     for key, item in carrito_sesion.items():
         if isinstance(item, dict):
             cantidad = int(item.get("cantidad", 0) or 0)
@@ -31,25 +41,18 @@ def total_items_carrito(request):
             precio = Decimal(str(item.get("precio", 0)))
 
             # 1. Sincronización con imagen por color (La Lupa)
-            img_especifica = ProductImage.objects.filter(
-                product_id=prod_id, 
-                color_vinculado__iexact=color
-            ).first()
+            img_especifica = imagen_de_color(imagenes, prod_id, color)
 
             # Prioridad: 1. Imagen del color, 2. Imagen en sesión, 3. No-image
             imagen_final = item.get("imagen_url") or item.get("imagen")
             if img_especifica:
-                imagen_final = img_especifica.image.url
+                imagen_final = img_especifica
             
             if not imagen_final:
                 imagen_final = "/static/icons/no-image.png"
 
             # 2. Verificar Stock Real
-            variante = ProductVariant.objects.filter(
-                product_id=prod_id, 
-                talla__iexact=talla, 
-                color__iexact=color
-            ).first()
+            variante = variantes.get(clave_variante(prod_id, talla, color)) if prod_id else None
             stock_real = variante.stock if variante else 0
 
             item_data = {
@@ -0,0 +1,173 @@
+"""
+Instrumentación por petición: cantidad de consultas SQL, tiempo total en la
+base de datos, consultas repetidas (huella = SQL sin parámetros) y tiempo de
+vista/plantilla, agregados por nombre de URL.
+
+- Staff recibe los valores en la cabecera ``Server-Timing`` (visible en las
+  DevTools del navegador).
+- ``resumen_metricas()`` alimenta el endpoint de métricas agregadas.
+- ``@presupuesto_consultas(n)`` declara en código el máximo de consultas de
+  una vista. Si se excede se registra un warning; con
+  ``PRESUPUESTO_CONSULTAS_ESTRICTO = True`` (pensado para los tests) se lanza
+  ``PresupuestoConsultasExcedido`` y el test falla.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from store.metricas import LATENCIA_PETICIONES
+
+logger = logging.getLogger(__name__)
+
+
+class PresupuestoConsultasExcedido(Exception):
+    """Una vista ejecutó más consultas de las declaradas en su presupuesto."""
+
+
+# ============================================================
+# 🎯 Presupuestos de consultas declarados en código
+# ============================================================
+def presupuesto_consultas(max_consultas):
+    """Marca la vista con el máximo de consultas SQL permitidas por petición."""
+    def decorador(vista):
+        vista.presupuesto_consultas = max_consultas
+        return vista
+    return decorador
+
+
+def _presupuesto_de(request):
+    match = getattr(request, "resolver_match", None)
+    if not match:
+        return None
+    # login_required y compañía usan functools.wraps, que copia el __dict__
+    return getattr(match.func, "presupuesto_consultas", None)
+
+
+# ============================================================
+# ⏱️ Registro de consultas de una petición
+# ============================================================
+class _RegistroConsultas:
+    """execute_wrapper que cuenta y cronometra cada consulta."""
+
+    def __init__(self):
+        self.total = 0
+        self.tiempo_db = 0.0
+        self.huellas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_db += time.perf_counter() - inicio
+            self.total += 1
+            self.huellas[sql] += 1
+
+    def duplicadas(self):
+        return {sql: veces for sql, veces in self.huellas.items() if veces > 1}
+
+
+# ============================================================
+# 📊 Agregado en memoria por nombre de URL (por proceso)
+# ============================================================
+_lock = threading.Lock()
+_metricas = defaultdict(lambda: {
+    "peticiones": 0,
+    "consultas": 0,
+    "max_consultas": 0,
+    "tiempo_db_ms": 0.0,
+    "tiempo_total_ms": 0.0,
+    "presupuesto_excedido": 0,
+    "duplicadas": Counter(),
+})
+
+
+def _registrar(vista, registro, total_ms, excedido):
+    with _lock:
+        m = _metricas[vista]
+        m["peticiones"] += 1
+        m["consultas"] += registro.total
+        m["max_consultas"] = max(m["max_consultas"], registro.total)
+        m["tiempo_db_ms"] += registro.tiempo_db * 1000
+        m["tiempo_total_ms"] += total_ms
+        m["presupuesto_excedido"] += int(excedido)
+        for sql, veces in registro.duplicadas().items():
+            m["duplicadas"][sql] += veces
+
+
+def resumen_metricas(top_duplicadas=5):
+    """Copia serializable de las métricas agregadas, con promedios por petición."""
+    with _lock:
+        resumen = {}
+        for vista, m in _metricas.items():
+            n = m["peticiones"] or 1
+            resumen[vista] = {
+                "peticiones": m["peticiones"],
+                "consultas_promedio": round(m["consultas"] / n, 2),
+                "max_consultas": m["max_consultas"],
+                "tiempo_db_promedio_ms": round(m["tiempo_db_ms"] / n, 2),
+                "tiempo_total_promedio_ms": round(m["tiempo_total_ms"] / n, 2),
+                "presupuesto_excedido": m["presupuesto_excedido"],
+                "duplicadas": [
+                    {"sql": sql, "veces": veces}
+                    for sql, veces in m["duplicadas"].most_common(top_duplicadas)
+                ],
+            }
+        return resumen
+
+
+def reiniciar_metricas():
+    with _lock:
+        _metricas.clear()
+
+
+# ============================================================
+# 🧩 Middleware
+# ============================================================
+class InstrumentacionConsultasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registro = _RegistroConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(registro))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        vista = match.view_name if match else "sin_resolver"
+
+        presupuesto = _presupuesto_de(request)
+        excedido = presupuesto is not None and registro.total > presupuesto
+        _registrar(vista, registro, total_ms, excedido)
+        LATENCIA_PETICIONES.labels(
+            vista=vista, metodo=request.method, estado=response.status_code
+        ).observe(total_ms / 1000)
+
+        db_ms = registro.tiempo_db * 1000
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={db_ms:.1f};desc="{registro.total} consultas"',
+                f"app;dur={max(total_ms - db_ms, 0):.1f}",
+                f"total;dur={total_ms:.1f}",
+            ])
+
+        if excedido:
+            mensaje = (
+                f"{vista}: {registro.total} consultas (presupuesto {presupuesto}). "
+                f"Repetidas: {registro.duplicadas()}"
+            )
+            if getattr(settings, "PRESUPUESTO_CONSULTAS_ESTRICTO", False):
+                raise PresupuestoConsultasExcedido(mensaje)
+            logger.warning("⚠️ Presupuesto de consultas excedido en %s", mensaje)
+
+        return response
@@ -0,0 +1,73 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from store.models import Factura
+from store.utils.reportes import procesar_pendientes, recalcular_clientes
+
+
+def _fecha(valor):
+    try:
+        fecha = parse_date(valor)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise CommandError(f"Fecha inválida: {valor} (usa AAAA-MM-DD)")
+    return fecha
+
+
+class Command(BaseCommand):
+    """
+    Actualiza los rollups de ventas (store/utils/reportes.py).
+
+    Uso normal (cron nocturno o cada pocos minutos): solo procesa los días y
+    clientes marcados por las señales de Factura.
+
+        python manage.py actualizar_reportes
+        python manage.py actualizar_reportes --dias 3          # además re-verifica los últimos 3 días
+        python manage.py actualizar_reportes --desde 2026-01-01 --hasta 2026-03-31
+        python manage.py actualizar_reportes --todo            # reconstrucción completa
+
+    Las cargas masivas (generar_catalogo, bulk_create) no disparan señales: tras
+    ellas hay que correr --todo.
+    """
+    help = "Recalcula los rollups de ventas pendientes (y opcionalmente un rango de días)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=0, help="Re-verifica también los últimos N días.")
+        parser.add_argument("--desde", type=_fecha)
+        parser.add_argument("--hasta", type=_fecha)
+        parser.add_argument("--todo", action="store_true", help="Recalcula desde la primera factura y todos los clientes.")
+
+    def handle(self, *args, **o):
+        hoy = timezone.localdate()
+        desde, hasta = o["desde"], o["hasta"] or hoy
+        if o["todo"]:
+            primera = Factura.objects.aggregate(f=Min("fecha"))["f"]
+            desde = timezone.localdate(primera) if primera else hoy
+        elif o["dias"]:
+            desde = hoy - timedelta(days=o["dias"] - 1)
+        if o["hasta"] and not desde:
+            raise CommandError("--hasta requiere --desde")
+        if desde and desde > hasta:
+            raise CommandError("--desde es posterior a --hasta")
+
+        extra = []
+        if desde:
+            extra = [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+
+        inicio = time.monotonic()
+        n_dias, n_clientes = procesar_pendientes(extra)
+        if o["todo"]:
+            ids = Factura.objects.values_list("usuario_id", flat=True).distinct().order_by()
+            recalcular_clientes(ids)
+            n_clientes = len(ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 Rollups actualizados: {n_dias} día(s), {n_clientes} cliente(s) "
+            f"en {time.monotonic() - inicio:.1f} s"
+        ))
@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store.models import Category, Factura, Product
+from store.utils.carrito import olvidar_cache
+
+
+class Command(BaseCommand):
+    """
+    Recorre las vistas principales contra la base de datos actual (idealmente
+    poblada con datos de prueba) y reporta las consultas cuyo EXPLAIN usa
+    un escaneo secuencial. Sirve para decidir índices a partir de las
+    consultas reales del código, no de suposiciones.
+
+    Todo el recorrido corre en una transacción que se revierte al final: las
+    vistas de carrito y checkout escriben CartLine y ReservaStock en el
+    carrito real del cliente elegido.
+    """
+    help = "Ejecuta las vistas principales y reporta planes EXPLAIN con escaneos secuenciales."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuario", help="Email del usuario con el que se recorren las vistas privadas.")
+        parser.add_argument("--todas", action="store_true", help="Muestra también las consultas que usan índices.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options["usuario"]:
+            usuario = User.objects.filter(email=options["usuario"]).first()
+            if not usuario:
+                raise CommandError(f"No existe el usuario {options['usuario']}")
+        else:
+            # Preferimos un cliente con facturas para que mis_facturas/dashboard tengan datos
+            factura = Factura.objects.select_related("usuario").order_by("-id").first()
+            usuario = factura.usuario if factura else User.objects.order_by("id").first()
+        if not usuario:
+            raise CommandError("La base de datos no tiene usuarios; pobla datos antes de auditar.")
+
+        producto = Product.objects.filter(is_available=True).order_by("id").first()
+        categoria = Category.objects.order_by("id").first()
+
+        try:
+            with transaction.atomic():
+                total_secuenciales = self._recorrer(usuario, producto, categoria, options["todas"])
+                transaction.set_rollback(True)
+        finally:
+            # La caché no se revierte con la transacción
+            olvidar_cache(usuario.pk)
+
+        resumen = f"\nConsultas con escaneo secuencial: {total_secuenciales}"
+        self.stdout.write(self.style.WARNING(resumen) if total_secuenciales else self.style.SUCCESS(resumen))
+
+    def _recorrer(self, usuario, producto, categoria, todas):
+        """Ejecuta las vistas y muestra los planes; devuelve cuántas consultas son secuenciales."""
+        # Si una plantilla falla seguimos con la siguiente vista: el plan de las
+        # consultas ya ejecutadas igual es útil.
+        client = Client(raise_request_exception=False)
+        client.force_login(usuario)
+
+        # Cada entrada: (nombre, método, url, datos)
+        rutas = [
+            ("store", "get", reverse("store:store"), None),
+            ("inicio", "get", reverse("inicio"), None),
+            ("dashboard", "get", reverse("usuario:dashboard"), None),
+            ("mis_facturas", "get", reverse("store:mis_facturas"), None),
+        ]
+        if categoria:
+            rutas.append(("store?category", "get", reverse("store:store"), {"category": categoria.slug}))
+            rutas.append((
+                "productos_por_categoria", "get",
+                reverse("store:productos_por_categoria", args=[categoria.slug]), None,
+            ))
+        if producto:
+            color = producto.color_list[0] if producto.color_list else "Único"
+            talla = producto.talla_list[0] if producto.talla_list else "Única"
+            rutas += [
+                ("detalle_producto", "get", reverse("store:detalle_producto", args=[producto.slug]), None),
+                ("vista_rapida", "get", reverse("store:vista_rapida", args=[producto.id]), None),
+                ("agregar_al_carrito", "post", reverse("store:agregar_al_carrito", args=[producto.id]),
+                 {"talla": talla, "color": color}),
+                ("ver_carrito", "get", reverse("store:ver_carrito"), None),
+                ("checkout", "get", reverse("store:checkout"), None),
+            ]
+
+        total_secuenciales = 0
+        for nombre, metodo, url, datos in rutas:
+            with CaptureQueriesContext(connection) as ctx:
+                respuesta = getattr(client, metodo)(url, datos or {}, secure=True)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"\n▶ {nombre} [{respuesta.status_code}] — {len(ctx.captured_queries)} consultas"
+            ))
+            for consulta in ctx.captured_queries:
+                sql = consulta["sql"]
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = self._explain(sql)
+                secuencial = self._es_secuencial(plan)
+                if secuencial:
+                    total_secuenciales += 1
+                if secuencial or todas:
+                    estilo = self.style.WARNING if secuencial else self.style.SUCCESS
+                    self.stdout.write(estilo(f"  {'⚠️ SEQ' if secuencial else '✅ IDX'} {sql[:200]}"))
+                    for linea in plan:
+                        self.stdout.write(f"      {linea}")
+        return total_secuenciales
+
+    def _explain(self, sql):
+        prefijo = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+        with connection.cursor() as cursor:
+            try:
+                # Savepoint: un EXPLAIN fallido no debe abortar la transacción del recorrido
+                with transaction.atomic():
+                    cursor.execute(prefijo + sql)
+            except Exception as e:
+                return [f"(no se pudo obtener el plan: {e})"]
+            # SQLite devuelve (id, parent, notused, detail); PostgreSQL una columna de texto
+            return [str(fila[-1]) for fila in cursor.fetchall()]
+
+    @staticmethod
+    def _es_secuencial(plan):
+        for linea in plan:
+            if "Seq Scan" in linea:
+                return True
+            # En SQLite "SCAN tabla" sin "USING INDEX" es un recorrido completo
+            if linea.startswith("SCAN ") and "USING" not in linea:
+                return True
+        return False
@@ -0,0 +1,247 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from store.models import Category, DetalleFactura, Factura, Product, ProductImage, ProductVariant
+
+PREFIJO = "gen"  # Todo lo generado lleva este prefijo en el slug/username para poder limpiarlo
+
+TALLAS = ["XS", "S", "M", "L", "XL", "XXL"]
+COLORES = ["Negro", "Blanco", "Azul", "Rojo", "Verde", "Gris", "Beige", "Rosado", "Morado", "Amarillo"]
+TIPOS = ["Camisa", "Pantalón", "Chaqueta", "Vestido", "Falda", "Buzo", "Short", "Blusa", "Jean", "Tenis"]
+ADJETIVOS = ["Clásico", "Urbano", "Deportivo", "Elegante", "Casual", "Premium", "Básico", "Vintage"]
+METODOS_PAGO = [("Contra Entrega", 45), ("Pago por banco", 35), ("Tarjeta", 20)]
+ESTADOS_PAGO = [("Pagado", 80), ("Pendiente", 15), ("Fallido", 5)]
+ESTADOS_PEDIDO = [("entregado", 60), ("enviado", 15), ("preparacion", 10), ("pendiente", 15)]
+
+
+@contextmanager
+def _sin_auto_now(*campos):
+    """Permite fijar fechas históricas en bulk_create (auto_now/auto_now_add las pisan)."""
+    previos = [(c, c.auto_now, c.auto_now_add) for c in campos]
+    for c in campos:
+        c.auto_now = c.auto_now_add = False
+    try:
+        yield
+    finally:
+        for c, auto_now, auto_now_add in previos:
+            c.auto_now, c.auto_now_add = auto_now, auto_now_add
+
+
+def _acumulados(n, exponente):
+    """Pesos acumulados tipo Zipf; con cum_weights cada sorteo es O(log n)."""
+    return list(accumulate(1 / (i + 1) ** exponente for i in range(n)))
+
+
+def _ponderado(rnd, opciones):
+    valores, pesos = zip(*opciones)
+    return rnd.choices(valores, weights=pesos)[0]
+
+
+class Command(BaseCommand):
+    """
+    Genera un catálogo sintético grande y DETERMINISTA (misma --semilla, mismos
+    datos) para pruebas de rendimiento: categorías, productos con su matriz
+    completa talla×color, imágenes, usuarios y facturas con detalles.
+
+    Todo se inserta con bulk_create por lotes: no se llama Product.save() ni
+    se disparan señales, y el stock total se calcula en memoria.
+
+        python manage.py generar_catalogo                          # 100k productos / 1M facturas
+        python manage.py generar_catalogo --productos 2000 --facturas 20000
+        python manage.py generar_catalogo --limpiar                # borra lo generado antes
+    """
+    help = "Genera un catálogo sintético determinista con inserciones masivas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semilla", type=int, default=42)
+        parser.add_argument("--categorias", type=int, default=40)
+        parser.add_argument("--productos", type=int, default=100_000)
+        parser.add_argument("--usuarios", type=int, default=20_000)
+        parser.add_argument("--facturas", type=int, default=1_000_000)
+        parser.add_argument("--dias", type=int, default=730, help="Ventana histórica de las facturas.")
+        parser.add_argument("--lote", type=int, default=5_000)
+        parser.add_argument("--limpiar", action="store_true", help="Borra los datos generados previamente y sale.")
+
+    def handle(self, *args, **o):
+        if o["limpiar"]:
+            self._limpiar()
+            return
+
+        if Product.objects.filter(slug__startswith=f"{PREFIJO}-").exists():
+            raise CommandError("Ya hay datos generados; ejecuta primero con --limpiar.")
+
+        rnd = random.Random(o["semilla"])
+        self.lote = o["lote"]
+        self.ahora = timezone.now()
+
+        inicio = time.monotonic()
+        categorias = self._categorias(o["categorias"])
+        productos = self._productos(rnd, categorias, o["productos"], o["dias"])
+        usuarios = self._usuarios(o["usuarios"])
+        self._facturas(rnd, usuarios, productos, o["facturas"], o["dias"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Catálogo generado en {time.monotonic() - inicio:.0f} s"))
+
+    # ============================================================
+    # 🧹 Limpieza
+    # ============================================================
+    def _limpiar(self):
+        User = get_user_model()
+        usuarios = User.objects.filter(username__startswith=f"{PREFIJO}-")
+        # Las facturas caen en cascada con sus usuarios; los productos con su categoría
+        self.stdout.write(f"Borrando {usuarios.count()} usuarios generados (y sus facturas)...")
+        Factura.objects.filter(usuario__in=usuarios).delete()
+        usuarios.delete()
+        self.stdout.write("Borrando categorías y productos generados...")
+        Category.objects.filter(slug__startswith=f"{PREFIJO}-").delete()
+        self.stdout.write(self.style.SUCCESS("✅ Datos generados eliminados"))
+
+    # ============================================================
+    # 📂 Catálogo
+    # ============================================================
+    def _categorias(self, cantidad):
+        objs = [
+            Category(name=f"{TIPOS[i % len(TIPOS)]} {PREFIJO.upper()} {i:03d}", slug=f"{PREFIJO}-cat-{i:03d}")
+            for i in range(cantidad)
+        ]
+        Category.objects.bulk_create(objs, batch_size=self.lote, ignore_conflicts=True)
+        ids = list(Category.objects.filter(slug__startswith=f"{PREFIJO}-cat-").order_by("slug").values_list("id", flat=True))
+        self.stdout.write(f"📂 {len(ids)} categorías")
+        return ids
+
+    def _productos(self, rnd, categorias, cantidad, dias):
+        """Devuelve [(id, precio_final, [(talla, color)...])] para generar ventas."""
+        # Pocas categorías concentran buena parte del catálogo (distribución de Pareto)
+        pesos_cat = _acumulados(len(categorias), 0.8)
+        resumen = []
+        campos_fecha = [Product._meta.get_field("date_register"), Product._meta.get_field("date_update")]
+
+        for desde in range(0, cantidad, self.lote):
+            hasta = min(desde + self.lote, cantidad)
+            productos, matrices = [], []
+            for n in range(desde, hasta):
+                tallas = sorted(rnd.sample(TALLAS, rnd.randint(1, len(TALLAS))), key=TALLAS.index)
+                colores = rnd.sample(COLORES, rnd.randint(1, 4))
+                # Precios log-normales alrededor de ~80.000 COP, redondeados a 100
+                costo = Decimal(int(rnd.lognormvariate(11.3, 0.6)) // 100 * 100 + 100)
+                descuento = _ponderado(rnd, [(0, 70), (10, 12), (20, 10), (30, 5), (50, 3)])
+                registro = self.ahora - timedelta(days=rnd.randint(0, dias), seconds=rnd.randint(0, 86_399))
+                stocks = {(t, c): (0 if rnd.random() < 0.1 else rnd.randint(1, 60)) for t in tallas for c in colores}
+                productos.append(Product(
+                    name=f"{rnd.choice(ADJETIVOS)} {rnd.choice(TIPOS)} {n:06d}"[:50],
+                    slug=f"{PREFIJO}-producto-{n:06d}",
+                    description=f"Producto sintético número {n} para pruebas de carga.",
+                    cost=costo,
+                    discount=descuento,
+                    image=f"products/{PREFIJO}/{n:06d}.jpg",
+                    stock=sum(stocks.values()),
+                    is_available=rnd.random() < 0.92,
+                    category_id=rnd.choices(categorias, cum_weights=pesos_cat)[0],
+                    destacado=rnd.random() < 0.03,
+                    nuevo=rnd.random() < 0.1,
+                    talla=",".join(tallas),
+                    color=",".join(colores),
+                    date_register=registro,
+                    date_update=registro,
+                ))
+                matrices.append(stocks)
+
+            with transaction.atomic(), _sin_auto_now(*campos_fecha):
+                Product.objects.bulk_create(productos, batch_size=self.lote)
+                variantes, imagenes = [], []
+                for producto, stocks in zip(productos, matrices):
+                    for (talla, color), stock in stocks.items():
+                        variantes.append(ProductVariant(product_id=producto.id, talla=talla, color=color, stock=stock))
+                    # Una imagen general y una por cada color (la lupa)
+                    imagenes.append(ProductImage(product_id=producto.id, image=f"products/{PREFIJO}/{producto.slug}-0.jpg"))
+                    for i, color in enumerate(sorted({c for _, c in stocks}), start=1):
+                        imagenes.append(ProductImage(
+                            product_id=producto.id, color_vinculado=color,
+                            image=f"products/{PREFIJO}/{producto.slug}-{i}.jpg",
+                        ))
+                    resumen.append((producto.id, producto.final_price, list(stocks)))
+                ProductVariant.objects.bulk_create(variantes, batch_size=self.lote)
+                ProductImage.objects.bulk_create(imagenes, batch_size=self.lote)
+            self.stdout.write(f"🛍️ Productos {hasta}/{cantidad}", ending="\r")
+        self.stdout.write(f"🛍️ {cantidad} productos con variantes e imágenes")
+        return resumen
+
+    def _usuarios(self, cantidad):
+        User = get_user_model()
+        clave = make_password("jasc-generado")  # Un solo hash: hashear 20k claves tomaría minutos
+        for desde in range(0, cantidad, self.lote):
+            User.objects.bulk_create([
+                User(
+                    name="Cliente", lastname=f"{n:06d}", username=f"{PREFIJO}-{n:06d}",
+                    email=f"{PREFIJO}-{n:06d}@jasc.test", password=clave,
+                )
+                for n in range(desde, min(desde + self.lote, cantidad))
+            ], batch_size=self.lote, ignore_conflicts=True)
+        ids = list(User.objects.filter(username__startswith=f"{PREFIJO}-").order_by("username").values_list("id", flat=True))
+        self.stdout.write(f"👤 {len(ids)} usuarios")
+        return ids
+
+    # ============================================================
+    # 🧾 Ventas
+    # ============================================================
+    def _facturas(self, rnd, usuarios, productos, cantidad, dias):
+        if not usuarios or not productos:
+            return
+        # Pocos clientes fieles compran mucho y pocos productos venden mucho (Zipf)
+        pesos_usuarios = _acumulados(len(usuarios), 0.7)
+        pesos_productos = _acumulados(len(productos), 0.9)
+        orden_usuarios = rnd.sample(usuarios, len(usuarios))
+        orden_productos = rnd.sample(productos, len(productos))
+        campo_fecha = Factura._meta.get_field("fecha")
+
+        for desde in range(0, cantidad, self.lote):
+            n = min(self.lote, cantidad - desde)
+            clientes = rnd.choices(orden_usuarios, cum_weights=pesos_usuarios, k=n)
+            facturas, lineas_por_factura = [], []
+            for usuario_id in clientes:
+                # Más ventas recientes que antiguas (crecimiento de la tienda)
+                fecha = self.ahora - timedelta(
+                    days=int(rnd.triangular(0, dias, 0)), seconds=rnd.randint(0, 86_399)
+                )
+                lineas = []
+                for producto_id, precio, combinaciones in rnd.choices(
+                    orden_productos, cum_weights=pesos_productos, k=_ponderado(rnd, [(1, 50), (2, 25), (3, 15), (4, 6), (5, 4)])
+                ):
+                    talla, color = rnd.choice(combinaciones)
+                    cantidad_linea = _ponderado(rnd, [(1, 75), (2, 18), (3, 7)])
+                    lineas.append((producto_id, talla, color, cantidad_linea, (precio * cantidad_linea).quantize(Decimal("0.01"))))
+                estado_pago = _ponderado(rnd, ESTADOS_PAGO)
+                facturas.append(Factura(
+                    usuario_id=usuario_id,
+                    fecha=fecha,
+                    total=sum(l[4] for l in lineas),
+                    metodo_pago=_ponderado(rnd, METODOS_PAGO),
+                    estado_pago=estado_pago,
+                    estado_pedido=_ponderado(rnd, ESTADOS_PEDIDO) if estado_pago == "Pagado" else "pendiente",
+                    nombre="Cliente generado",
+                    ciudad=rnd.choice(["Medellín", "Bogotá", "Cali", "Barranquilla", "Pereira"]),
+                    correo_enviado=estado_pago == "Pagado",
+                ))
+                lineas_por_factura.append(lineas)
+
+            with transaction.atomic(), _sin_auto_now(campo_fecha):
+                Factura.objects.bulk_create(facturas, batch_size=self.lote)
+                DetalleFactura.objects.bulk_create([
+                    DetalleFactura(
+                        factura_id=factura.id, producto_id=producto_id, cantidad=cantidad_linea,
+                        subtotal=subtotal, talla=talla, color=color,
+                    )
+                    for factura, lineas in zip(facturas, lineas_por_factura)
+                    for producto_id, talla, color, cantidad_linea, subtotal in lineas
+                ], batch_size=self.lote)
+            self.stdout.write(f"🧾 Facturas {desde + n}/{cantidad}", ending="\r")
+        self.stdout.write(f"🧾 {cantidad} facturas con sus detalles")
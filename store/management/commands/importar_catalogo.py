@@ -0,0 +1,62 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store.utils.catalogo import COLUMNAS, importar, leer_filas
+
+
+class Command(BaseCommand):
+    """
+    Importa catálogos de proveedores en JSON Lines o CSV (ver columnas en
+    store/utils/catalogo.py) con upserts por slug en lotes.
+
+        python manage.py importar_catalogo proveedor.jsonl
+        python manage.py importar_catalogo proveedor.csv --lote 2000 --rechazados rechazos.jsonl
+        python manage.py importar_catalogo proveedor.csv --simular
+    """
+    help = "Importa/actualiza categorías, productos y variantes desde JSONL o CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo")
+        parser.add_argument("--formato", choices=["jsonl", "csv"], help="Por defecto se deduce de la extensión.")
+        parser.add_argument("--lote", type=int, default=1000)
+        parser.add_argument("--rechazados", help="Escribe las filas rechazadas (línea y motivo) en este archivo JSONL.")
+        parser.add_argument("--simular", action="store_true", help="Valida e importa dentro de una transacción que se deshace.")
+
+    def handle(self, *args, **o):
+        formato = o["formato"] or ("csv" if o["archivo"].lower().endswith(".csv") else "jsonl")
+        inicio = time.monotonic()
+        try:
+            with open(o["archivo"], encoding="utf-8-sig", newline="") as archivo:
+                if o["simular"]:
+                    with transaction.atomic():
+                        resumen = importar(leer_filas(archivo, formato), lote=o["lote"])
+                        transaction.set_rollback(True)
+                else:
+                    resumen = importar(leer_filas(archivo, formato), lote=o["lote"])
+        except FileNotFoundError:
+            raise CommandError(f"No existe el archivo {o['archivo']}")
+
+        if o["rechazados"] and resumen.rechazadas:
+            with open(o["rechazados"], "w", encoding="utf-8") as salida:
+                for linea, motivo in resumen.rechazadas:
+                    salida.write(json.dumps({"linea": linea, "motivo": motivo}, ensure_ascii=False) + "\n")
+
+        titulo = "🧪 Simulación (sin cambios guardados)" if o["simular"] else "📦 Importación terminada"
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{titulo} en {time.monotonic() - inicio:.1f} s"))
+        self.stdout.write(f"  Filas leídas:            {resumen.filas}")
+        self.stdout.write(f"  Categorías creadas:      {resumen.categorias_creadas}")
+        self.stdout.write(f"  Productos insertados:    {resumen.productos_insertados}")
+        self.stdout.write(f"  Productos actualizados:  {resumen.productos_actualizados}")
+        self.stdout.write(f"  Variantes insertadas:    {resumen.variantes_insertadas}")
+        self.stdout.write(f"  Variantes actualizadas:  {resumen.variantes_actualizadas}")
+        estilo = self.style.WARNING if resumen.rechazadas else self.style.SUCCESS
+        self.stdout.write(estilo(f"  Filas rechazadas:        {len(resumen.rechazadas)}"))
+        for linea, motivo in resumen.rechazadas[:20]:
+            self.stdout.write(f"    línea {linea}: {motivo}")
+        if len(resumen.rechazadas) > 20 and not o["rechazados"]:
+            self.stdout.write(f"    ... usa --rechazados para ver las {len(resumen.rechazadas)} filas")
+        if not resumen.filas:
+            self.stdout.write(self.style.WARNING(f"  Archivo vacío. Columnas esperadas: {', '.join(COLUMNAS)}"))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.utils.reservas import barrer
+
+
+class Command(BaseCommand):
+    """
+    Borra las reservas de stock vencidas por lotes.
+
+    Una reserva vencida ya no descuenta stock (el cálculo de disponible filtra
+    por ``expira``); este barrido solo evita que la tabla crezca. Cada lote es
+    un DELETE corto elegido por el índice de ``expira``. Para el scheduler,
+    cada pocos minutos:
+
+        python manage.py liberar_reservas
+        python manage.py liberar_reservas --lote 1000 --pausa 0.2
+    """
+    help = "Borra reservas de stock vencidas en lotes pequeños."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=5000, help="Reservas por DELETE.")
+        parser.add_argument("--pausa", type=float, default=0.0, help="Segundos de espera entre lotes.")
+
+    def handle(self, *args, **o):
+        inicio = time.monotonic()
+        total = 0
+        while True:
+            borradas = barrer(o["lote"])
+            if not borradas:
+                break
+            total += borradas
+            if o["pausa"]:
+                time.sleep(o["pausa"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"⏳ {total} reserva(s) vencida(s) liberada(s) en {time.monotonic() - inicio:.1f} s"
+        ))
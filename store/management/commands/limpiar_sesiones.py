@@ -0,0 +1,44 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    """
+    Borra las sesiones vencidas por lotes (reemplazo de ``clearsessions``).
+
+    ``clearsessions`` lanza un único DELETE sobre toda la tabla; con muchas
+    sesiones vencidas eso bloquea filas y llena el WAL de golpe. Aquí cada lote
+    es un DELETE corto por clave primaria (usa el índice de expire_date para
+    elegirlas) y se puede pausar entre lotes. Pensado para el scheduler diario:
+
+        python manage.py limpiar_sesiones
+        python manage.py limpiar_sesiones --lote 2000 --pausa 0.5
+    """
+    help = "Borra sesiones vencidas en lotes pequeños."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=5000, help="Sesiones por DELETE.")
+        parser.add_argument("--pausa", type=float, default=0.0, help="Segundos de espera entre lotes.")
+
+    def handle(self, *args, **o):
+        ahora = timezone.now()
+        inicio = time.monotonic()
+        total = 0
+        while True:
+            claves = list(
+                Session.objects.filter(expire_date__lt=ahora)
+                .values_list("session_key", flat=True)[:o["lote"]]
+            )
+            if not claves:
+                break
+            borradas, _ = Session.objects.filter(session_key__in=claves).delete()
+            total += borradas
+            if o["pausa"]:
+                time.sleep(o["pausa"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🧹 {total} sesión(es) vencida(s) borrada(s) en {time.monotonic() - inicio:.1f} s"
+        ))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.utils.imagenes import encolar_todas, procesar_pendientes
+
+
+class Command(BaseCommand):
+    """
+    Worker de imágenes responsive (ver store/utils/imagenes.py). En producción
+    corre como proceso aparte (línea 'worker' del Procfile).
+
+        python manage.py procesar_imagenes                 # bucle infinito
+        python manage.py procesar_imagenes --una-vez       # vacía la cola y termina
+        python manage.py procesar_imagenes --todas --una-vez   # backfill del catálogo existente
+    """
+    help = "Genera las derivadas WebP/AVIF de las imágenes encoladas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true", help="Procesa lo pendiente y termina.")
+        parser.add_argument("--todas", action="store_true", help="Encola antes todas las imágenes sin derivadas al día.")
+        parser.add_argument("--lote", type=int, default=20)
+        parser.add_argument("--intervalo", type=float, default=5.0, help="Segundos de espera con la cola vacía.")
+
+    def handle(self, *args, **o):
+        if o["todas"]:
+            self.stdout.write(f"🗂️  Encoladas {encolar_todas()} imagen(es)")
+
+        total = 0
+        while True:
+            tomadas, hechas, fallidas = procesar_pendientes(lote=o["lote"])
+            total += hechas
+            if hechas or fallidas:
+                self.stdout.write(f"🖼️  {hechas} procesada(s), {fallidas} con error")
+            if not tomadas:
+                if o["una_vez"]:
+                    break
+                time.sleep(o["intervalo"])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} imagen(es) con derivadas nuevas"))
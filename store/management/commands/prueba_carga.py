@@ -0,0 +1,249 @@
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from store.models import Category, DetalleFactura, Product, ProductVariant
+
+PASSWORD_CARGA = "carga-jasc-2026"
+SLUG_ULTIMA_UNIDAD = "carga-ultima-unidad"
+SLUG_COMPRA = "carga-compra"
+
+
+class Command(BaseCommand):
+    """
+    Prueba de carga de extremo a extremo contra un servidor local ya corriendo:
+
+        DEBUG=True CORREO_SIMULADO=True python manage.py runserver      # o gunicorn
+        python manage.py prueba_carga --url http://127.0.0.1:8000 --usuarios 20 --duracion 60
+
+    Cada usuario virtual inicia sesión y repite su escenario hasta que se acaba
+    el tiempo. Los productos y usuarios de la prueba se crean (o reinician)
+    antes de empezar, así dos corridas con la misma --semilla hacen lo mismo.
+    CORREO_SIMULADO evita llamar a SendGrid y el pago es contra entrega, por lo
+    que no se toca ninguna pasarela real.
+
+    Escenarios:
+      navegacion    store → detalle_producto (solo lectura)
+      compra        store → detalle → agregar → carrito → checkout → factura → PDF
+      ultima_unidad todos compiten por un stock de --stock unidades; mide sobreventa
+      mixto         70% navegacion / 30% compra
+    """
+    help = "Prueba de carga browse → carrito → checkout con p50/p95/p99, throughput y sobreventa."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--usuarios", type=int, default=10, help="Usuarios virtuales concurrentes.")
+        parser.add_argument("--duracion", type=int, default=30, help="Segundos por escenario.")
+        parser.add_argument(
+            "--escenario", action="append",
+            choices=["navegacion", "compra", "ultima_unidad", "mixto"],
+            help="Repetible. Por defecto se corren todos.",
+        )
+        parser.add_argument("--stock", type=int, default=5, help="Unidades en el escenario ultima_unidad.")
+        parser.add_argument("--semilla", type=int, default=2026)
+
+    def handle(self, *args, **options):
+        base = options["url"].rstrip("/")
+        try:
+            requests.get(f"{base}/store/", timeout=10)
+        except requests.RequestException as e:
+            raise CommandError(f"No hay servidor en {base}: {e}")
+
+        usuarios = self._preparar_usuarios(options["usuarios"])
+        escenarios = options["escenario"] or ["navegacion", "compra", "ultima_unidad", "mixto"]
+
+        for escenario in escenarios:
+            self._preparar_productos(options["stock"])
+            navegables = list(Product.objects.filter(is_available=True).values_list("id", "slug")[:200])
+            self.ids_carga = dict(
+                Product.objects.filter(slug__in=[SLUG_COMPRA, SLUG_ULTIMA_UNIDAD]).values_list("slug", "id")
+            )
+            inicio_escenario = time.time()
+
+            resultados = _Resultados()
+            fin = time.monotonic() + options["duracion"]
+            hilos = [
+                threading.Thread(
+                    target=self._usuario_virtual,
+                    args=(base, email, escenario, navegables, resultados, fin,
+                          random.Random(options["semilla"] + n)),
+                )
+                for n, email in enumerate(usuarios)
+            ]
+            t0 = time.monotonic()
+            for h in hilos:
+                h.start()
+            for h in hilos:
+                h.join()
+            transcurrido = time.monotonic() - t0
+
+            sobreventa = self._sobreventa(escenario, options["stock"], inicio_escenario)
+            self._reportar(escenario, resultados, transcurrido, sobreventa)
+
+    # ============================================================
+    # 🧪 Datos de la prueba
+    # ============================================================
+    def _preparar_usuarios(self, cantidad):
+        User = get_user_model()
+        emails = []
+        for n in range(cantidad):
+            email = f"carga{n}@jasc.test"
+            user = User.objects.filter(email=email).first()
+            if not user:
+                user = User.objects.create_user(
+                    name="Carga", lastname=str(n), username=f"carga{n}", email=email
+                )
+            user.set_password(PASSWORD_CARGA)
+            user.save()
+            emails.append(email)
+        return emails
+
+    def _preparar_productos(self, stock_ultima_unidad):
+        categoria, _ = Category.objects.get_or_create(slug="carga", defaults={"name": "Carga"})
+        for slug, nombre, stock in [
+            (SLUG_COMPRA, "Carga compra", 1_000_000),
+            (SLUG_ULTIMA_UNIDAD, "Carga última unidad", stock_ultima_unidad),
+        ]:
+            producto, _ = Product.objects.update_or_create(
+                slug=slug,
+                defaults={
+                    "name": nombre, "description": "Producto de la prueba de carga",
+                    "cost": Decimal("50000"), "discount": 0, "category": categoria,
+                    "talla": "M", "color": "Negro", "is_available": True,
+                    # Los listados exigen imagen; basta con la ruta, no se descarga
+                    "image": "products/carga.jpg",
+                },
+            )
+            ProductVariant.objects.update_or_create(
+                product=producto, talla="M", color="Negro", defaults={"stock": stock}
+            )
+            producto.actualizar_stock_total()
+
+    def _sobreventa(self, escenario, stock_inicial, desde):
+        if escenario != "ultima_unidad":
+            return None
+        vendidas = DetalleFactura.objects.filter(
+            producto__slug=SLUG_ULTIMA_UNIDAD,
+            factura__fecha__gte=datetime.fromtimestamp(desde, tz=timezone.utc),
+        ).aggregate(total=Sum("cantidad"))["total"] or 0
+        return max(0, vendidas - stock_inicial)
+
+    # ============================================================
+    # 👤 Usuario virtual
+    # ============================================================
+    def _usuario_virtual(self, base, email, escenario, navegables, resultados, fin, rnd):
+        s = requests.Session()
+        try:
+            s.get(f"{base}/account/login/", timeout=30)
+            s.post(
+                f"{base}/account/login/",
+                data={"username": email, "password": PASSWORD_CARGA,
+                      "csrfmiddlewaretoken": s.cookies.get("csrftoken", "")},
+                headers={"Referer": f"{base}/account/login/"},
+                timeout=30,
+            )
+            while time.monotonic() < fin:
+                actual = escenario
+                if escenario == "mixto":
+                    actual = "compra" if rnd.random() < 0.3 else "navegacion"
+                if actual == "navegacion":
+                    self._navegar(s, base, navegables, resultados, rnd)
+                elif actual == "compra":
+                    self._comprar(s, base, SLUG_COMPRA, resultados, rnd, navegables)
+                else:
+                    self._comprar(s, base, SLUG_ULTIMA_UNIDAD, resultados, rnd, navegables)
+        finally:
+            s.close()
+
+    def _pedir(self, s, resultados, paso, metodo, url, **kwargs):
+        kwargs.setdefault("timeout", 60)
+        if metodo == "post":
+            headers = kwargs.setdefault("headers", {})
+            headers["X-CSRFToken"] = s.cookies.get("csrftoken", "")
+            headers["Referer"] = url
+        t0 = time.perf_counter()
+        try:
+            r = getattr(s, metodo)(url, **kwargs)
+            ok = r.status_code < 400
+        except requests.RequestException:
+            r, ok = None, False
+        resultados.agregar(paso, time.perf_counter() - t0, ok)
+        return r
+
+    def _navegar(self, s, base, navegables, resultados, rnd):
+        self._pedir(s, resultados, "store", "get", f"{base}/store/")
+        if navegables:
+            _, slug = rnd.choice(navegables)
+            self._pedir(s, resultados, "detalle_producto", "get", f"{base}/store/producto/{slug}/")
+
+    def _comprar(self, s, base, slug, resultados, rnd, navegables):
+        self._navegar(s, base, navegables, resultados, rnd)
+        producto_id = self.ids_carga[slug]
+        self._pedir(s, resultados, "agregar_al_carrito", "post",
+                    f"{base}/store/agregar/{producto_id}/", data={"talla": "M", "color": "Negro"})
+        self._pedir(s, resultados, "ver_carrito", "get", f"{base}/store/carrito/")
+        self._pedir(s, resultados, "checkout", "get", f"{base}/store/checkout/")
+        r = self._pedir(s, resultados, "generar_factura", "post", f"{base}/store/generar-factura/", data={
+            "nombre": "Carga", "telefono": "3000000000", "direccion": "Calle 1",
+            "ciudad": "Medellín", "departamento": "Antioquia", "metodo_pago": "Contra Entrega",
+        })
+        match = re.search(r"Factura #(\d+)", r.text) if r is not None else None
+        if match:
+            self._pedir(s, resultados, "generar_factura_pdf", "get",
+                        f"{base}/store/factura/pdf/{match.group(1)}/")
+
+    # ============================================================
+    # 📊 Reporte
+    # ============================================================
+    def _reportar(self, escenario, resultados, transcurrido, sobreventa):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n▶ Escenario: {escenario} ({transcurrido:.1f} s)"))
+        self.stdout.write(f"  {'paso':<22}{'n':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+        todas = []
+        for paso, (tiempos, errores) in sorted(resultados.por_paso.items()):
+            todas += tiempos
+            self.stdout.write(self._fila(paso, tiempos, errores, transcurrido))
+        errores_totales = sum(e for _, e in resultados.por_paso.values())
+        self.stdout.write(self._fila("TOTAL", todas, errores_totales, transcurrido))
+        if sobreventa is not None:
+            estilo = self.style.ERROR if sobreventa else self.style.SUCCESS
+            self.stdout.write(estilo(f"  Sobreventa: {sobreventa} unidad(es)"))
+
+    @staticmethod
+    def _fila(paso, tiempos, errores, transcurrido):
+        if not tiempos:
+            return f"  {paso:<22}{0:>7}{errores:>6}"
+        ms = sorted(t * 1000 for t in tiempos)
+        if len(ms) > 1:
+            cortes = statistics.quantiles(ms, n=100, method="inclusive")
+            p50, p95, p99 = cortes[49], cortes[94], cortes[98]
+        else:
+            p50 = p95 = p99 = ms[0]
+        return (
+            f"  {paso:<22}{len(ms):>7}{errores:>6}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}"
+            f"{len(ms) / transcurrido:>9.1f}"
+        )
+
+
+class _Resultados:
+    """Latencias y errores por paso, compartidos entre hilos."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.por_paso = defaultdict(lambda: [[], 0])
+
+    def agregar(self, paso, segundos, ok):
+        with self.lock:
+            registro = self.por_paso[paso]
+            registro[0].append(segundos)
+            if not ok:
+                registro[1] += 1
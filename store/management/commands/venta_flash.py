@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.models import VentaFlash
+from store.utils import flash
+
+
+class Command(BaseCommand):
+    """
+    Mantiene las ventas flash (ver store/utils/flash.py). Para el scheduler,
+    cada minuto:
+
+        python manage.py venta_flash
+
+    - Venta que empezó sin fichas: reparte su stock en fichas.
+    - Venta en curso: descuenta de ProductVariant.stock lo vendido en fichas.
+    - Venta terminada con fichas: descuenta lo último vendido y borra las claves.
+    """
+    help = "Carga, concilia y cierra las fichas de las ventas flash."
+
+    def handle(self, *args, **o):
+        if not flash.habilitada():
+            self.stdout.write(self.style.WARNING(
+                "⚠️ Ventas flash desactivadas: requieren caché compartida (REDIS_URL / FLASH_EN_CACHE)."
+            ))
+            return
+        ahora = timezone.now()
+        for venta in VentaFlash.objects.select_related("product"):
+            pid = venta.product_id
+            if venta.inicio <= ahora < venta.fin:
+                if flash.cargada(pid):
+                    flash.conciliar(venta)
+                    accion = "conciliada"
+                else:
+                    unidades = flash.cargar_fichas(venta)
+                    accion = f"cargada ({unidades} unidades)"
+            elif venta.fin <= ahora and flash.cargada(pid):
+                flash.conciliar(venta, cerrar=True)
+                accion = "cerrada"
+            else:
+                continue
+            self.stdout.write(f"⚡ {venta.product.name}: {accion}")
+
+        flash.invalidar_ventas()
+        self.stdout.write(self.style.SUCCESS("✅ Ventas flash al día"))
@@ -0,0 +1,73 @@
+"""
+Registro de métricas en formato Prometheus.
+
+Con varios workers de gunicorn cada proceso tiene su propia memoria, así que
+usamos el modo multiproceso de prometheus_client: si existe la variable
+``PROMETHEUS_MULTIPROC_DIR`` cada worker escribe sus valores en esa carpeta y
+el endpoint los suma al exportar (ver gunicorn.conf.py). Sin la variable
+(runserver, tests) funciona en memoria del proceso.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY,
+    generate_latest, multiprocess,
+)
+
+# ============================================================
+# 📈 Métricas
+# ============================================================
+LATENCIA_PETICIONES = Histogram(
+    "jasc_http_request_duration_seconds",
+    "Latencia de las peticiones HTTP por nombre de URL.",
+    ["vista", "metodo", "estado"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+CHECKOUT = Counter(
+    "jasc_checkout_total",
+    "Intentos de compra por resultado (exito, rechazado, sin_stock).",
+    ["resultado"],
+)
+
+CONFLICTOS_STOCK = Counter(
+    "jasc_stock_conflicts_total",
+    "Líneas del carrito recortadas o descartadas por falta de stock.",
+    ["vista"],
+)
+
+ENVIO_CORREO = Histogram(
+    "jasc_email_send_duration_seconds",
+    "Tiempo de envío de correos vía SendGrid.",
+    ["tipo", "resultado"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+RENDER_PDF = Histogram(
+    "jasc_pdf_render_duration_seconds",
+    "Tiempo de generación de PDFs con ReportLab.",
+    ["documento"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+@contextmanager
+def cronometrar(histograma, **labels):
+    """Observa en el histograma la duración del bloque."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma.labels(**labels).observe(time.perf_counter() - inicio)
+
+
+def exportar():
+    """Devuelve (contenido, content_type) en formato de texto Prometheus."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:57
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_remove_productimage_color_vinculado_new'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['usuario', '-fecha'], name='factura_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['usuario', 'estado_pago'], name='factura_usuario_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_available', 'destacado'], name='product_disp_destacado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'is_available'], name='product_cat_disp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(models.F('product'), django.db.models.functions.text.Upper('color_vinculado'), name='productimage_prod_color_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(models.F('product'), django.db.models.functions.text.Upper('talla'), django.db.models.functions.text.Upper('color'), name='variant_prod_talla_color_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_indices_consultas_frecuentes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerfilPeticion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('ruta', models.CharField(max_length=500)),
+                ('vista', models.CharField(blank=True, max_length=200)),
+                ('metodo', models.CharField(max_length=10)),
+                ('estado', models.PositiveIntegerField(default=0)),
+                ('duracion_ms', models.FloatField(default=0)),
+                ('consultas', models.PositiveIntegerField(default=0)),
+                ('tiempo_db_ms', models.FloatField(default=0)),
+                ('perfilador', models.CharField(default='cProfile', max_length=20)),
+                ('arbol', models.TextField(blank=True)),
+                ('sql', models.JSONField(blank=True, default=list)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Perfil de petición',
+                'verbose_name_plural': 'Perfiles de peticiones',
+                'ordering': ['-fecha'],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_perfilpeticion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaVentasPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facturas', models.PositiveIntegerField(default=0)),
+                ('compras', models.PositiveIntegerField(default=0)),
+                ('total_compras', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_pagado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('primera_compra', models.DateTimeField(blank=True, null=True)),
+                ('ultima_compra', models.DateTimeField(blank=True, null=True)),
+                ('pendiente', models.BooleanField(db_index=True, default=False)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen de cliente',
+                'verbose_name_plural': 'Resúmenes de clientes',
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('facturas', models.PositiveIntegerField(default=0)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('ventas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Reporte de ventas',
+                'verbose_name_plural': 'Reporte de ventas',
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaMetodoPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('metodo_pago', models.CharField(max_length=30)),
+                ('facturas', models.PositiveIntegerField(default=0)),
+                ('ventas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('ventas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['fecha'], name='factura_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumencliente',
+            name='usuario',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='resumen_ventas', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='ventadiariacategoria',
+            name='categoria',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.category'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ventadiariametodopago',
+            unique_together={('dia', 'metodo_pago')},
+        ),
+        migrations.AddField(
+            model_name='ventadiariaproducto',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ventadiariacategoria',
+            unique_together={('dia', 'categoria')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='ventadiariaproducto',
+            unique_together={('dia', 'producto')},
+        ),
+    ]
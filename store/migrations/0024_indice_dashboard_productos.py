@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_rollups_ventas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_available', 'id'], name='product_disp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_indice_dashboard_productos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='image_derivadas',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_derivadas',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='video_thumb_derivadas',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_derivadas',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.CreateModel(
+            name='TareaImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=50)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('campo', models.CharField(max_length=50)),
+                ('creada', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('modelo', 'objeto_id', 'campo')},
+            },
+        ),
+    ]
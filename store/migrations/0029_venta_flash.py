@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0028_reservas_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaFlash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('cupo_checkout', models.PositiveIntegerField(default=50, help_text='Clientes a la vez en el checkout.')),
+                ('fragmentos', models.PositiveSmallIntegerField(default=8, help_text='Contadores en que se reparte el stock de cada variante.')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='venta_flash', to='store.product')),
+            ],
+            options={
+                'verbose_name': 'Venta flash',
+                'verbose_name_plural': 'Ventas flash',
+            },
+        ),
+    ]
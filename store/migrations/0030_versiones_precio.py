@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0029_venta_flash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartline',
+            name='precio_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='precio_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
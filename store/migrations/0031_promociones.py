@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0030_versiones_precio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallefactura',
+            name='descuento',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='detallefactura',
+            name='promocion',
+            field=models.CharField(blank=True, default='', max_length=120),
+        ),
+        migrations.AddField(
+            model_name='factura',
+            name='cupon',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='factura',
+            name='descuento',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Promocion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=120)),
+                ('tipo', models.CharField(choices=[('porcentaje', 'Porcentaje'), ('fijo', 'Valor fijo por unidad'), ('lleva_paga', 'Compra X, lleva Y gratis')], default='porcentaje', max_length=12)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, help_text='Porcentaje (0-100) o valor a rebajar por unidad. No aplica a compra X lleva Y.', max_digits=10)),
+                ('compra', models.PositiveSmallIntegerField(default=0, help_text='X: unidades que se pagan.')),
+                ('gratis', models.PositiveSmallIntegerField(default=0, help_text='Y: unidades de regalo por cada X.')),
+                ('codigo', models.CharField(blank=True, help_text='Cupón. Vacío: se aplica sola.', max_length=40, null=True, unique=True)),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+                ('activa', models.BooleanField(default=True)),
+                ('categorias', models.ManyToManyField(blank=True, related_name='promociones', to='store.category')),
+                ('productos', models.ManyToManyField(blank=True, related_name='promociones', to='store.product')),
+            ],
+            options={
+                'verbose_name': 'Promoción',
+                'verbose_name_plural': 'Promociones',
+            },
+        ),
+    ]
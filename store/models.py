@@ -1,6 +1,8 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings
 from django.db.models import Sum, F
+from django.db.models.functions import Upper
 from decimal import Decimal
 
 # ------------------------------------------------------------------
@@ -63,6 +65,24 @@ class Product(models.Model):
     video_file = models.FileField(upload_to="videos/products/", blank=True, null=True)
     video_thumb = models.ImageField(upload_to="video_thumbs/", blank=True, null=True)
 
+    # Versiones redimensionadas (WebP/AVIF) que genera procesar_imagenes
+    image_derivadas = models.JSONField(default=dict, blank=True, editable=False)
+    video_thumb_derivadas = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Sube cuando cambia cost o discount: el carrito reprecia solo las líneas
+    # guardadas con una versión anterior (store/utils/carrito.py)
+    precio_version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        indexes = [
+            # Tienda/portada: filter(is_available=True, destacado=True)
+            models.Index(fields=["is_available", "destacado"], name="product_disp_destacado_idx"),
+            # Listado por categoría: filter(category=..., is_available=True)
+            models.Index(fields=["category", "is_available"], name="product_cat_disp_idx"),
+            # Dashboard: filter(is_available=True, id__gt=cursor).order_by("id")
+            models.Index(fields=["is_available", "id"], name="product_disp_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -72,8 +92,21 @@ class Product(models.Model):
             Product.objects.filter(pk=self.pk).update(stock=total)
             self.stock = total
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Precio con el que se leyó (None si el campo vino diferido)
+        instancia._precio_leido = (instancia.__dict__.get("cost"), instancia.__dict__.get("discount"))
+        return instancia
+
     def save(self, *args, **kwargs):
+        leido = getattr(self, "_precio_leido", (None, None))
+        if None not in leido and leido != (self.cost, self.discount):
+            self.precio_version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "precio_version"}
         super().save(*args, **kwargs)
+        self._precio_leido = (self.cost, self.discount)
         if self.pk:
             self.actualizar_stock_total()
 
@@ -131,6 +164,20 @@ class Factura(models.Model):
     estado_pedido = models.CharField(max_length=20, choices=ESTADOS_PEDIDO, default='pendiente')
     correo_enviado = models.BooleanField(default=False)
 
+    # Promociones aplicadas al generar la factura (total ya las descuenta)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    cupon = models.CharField(max_length=40, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # mis_facturas y dashboard: filter(usuario=...).order_by('-fecha')
+            models.Index(fields=["usuario", "-fecha"], name="factura_usuario_fecha_idx"),
+            # dashboard: filter(usuario=..., estado_pago="Pagado").aggregate(Sum('total'))
+            models.Index(fields=["usuario", "estado_pago"], name="factura_usuario_estado_idx"),
+            # Rollups de ventas: recalcular un día = rango por fecha
+            models.Index(fields=["fecha"], name="factura_fecha_idx"),
+        ]
+
     def __str__(self):
         return f"Factura {self.id} - {self.usuario}"
 
@@ -141,6 +188,9 @@ class DetalleFactura(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     talla = models.CharField(max_length=20, blank=True, null=True)
     color = models.CharField(max_length=30, blank=True, null=True)
+    # subtotal ya va neto de la promoción; descuento guarda cuánto se rebajó
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    promocion = models.CharField(max_length=120, blank=True, default="")
     
     # Campo que faltaba en Railway
     imagen_url = models.URLField(max_length=500, blank=True, null=True)
@@ -162,6 +212,7 @@ class Banner(models.Model):
     title = models.CharField(max_length=200, default="Bienvenido a JascShop")
     subtitle = models.CharField(max_length=300, blank=True, null=True)
     image = models.ImageField(upload_to="banners/", blank=True, null=True)
+    image_derivadas = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.title
@@ -170,6 +221,15 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name="images", on_delete=models.CASCADE)
     image = models.ImageField(upload_to="products/", blank=True, null=True)
     color_vinculado = models.CharField(max_length=50, blank=True, null=True)
+    image_derivadas = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # La lupa: filter(product_id=..., color_vinculado__iexact=color).
+            # En PostgreSQL iexact se traduce a UPPER(col::text) = UPPER(%s),
+            # por eso el índice de expresión usa Upper y no Lower.
+            models.Index(F("product"), Upper("color_vinculado"), name="productimage_prod_color_idx"),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.color_vinculado or 'General'}"
@@ -184,6 +244,273 @@ class ProductVariant(models.Model):
         verbose_name = "Variante de Stock"
         verbose_name_plural = "Variantes de Stock"
         unique_together = ('product', 'talla', 'color')
+        indexes = [
+            # Carrito/checkout/factura: filter(product=..., talla__iexact=..., color__iexact=...)
+            models.Index(F("product"), Upper("talla"), Upper("color"), name="variant_prod_talla_color_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} | {self.talla or 'N/A'} - {self.color or 'N/A'}"
+
+# ------------------------------------------------------------------
+# IMÁGENES RESPONSIVE (cola de store/utils/imagenes.py)
+# ------------------------------------------------------------------
+
+class TareaImagen(models.Model):
+    """Imagen subida/cambiada cuyas derivadas faltan; la consume procesar_imagenes."""
+    modelo = models.CharField(max_length=50)  # "store.product"
+    objeto_id = models.PositiveBigIntegerField()
+    campo = models.CharField(max_length=50)
+    creada = models.DateTimeField(auto_now_add=True, db_index=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("modelo", "objeto_id", "campo")
+
+    def __str__(self):
+        return f"{self.modelo}#{self.objeto_id}.{self.campo}"
+
+# ------------------------------------------------------------------
+# REPORTES (rollups de ventas, ver store/utils/reportes.py)
+# ------------------------------------------------------------------
+
+class VentaDiariaCategoria(models.Model):
+    dia = models.DateField()
+    categoria = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True)
+    facturas = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Reporte de ventas"
+        verbose_name_plural = "Reporte de ventas"
+        unique_together = ("dia", "categoria")
+
+    def __str__(self):
+        return f"{self.dia} · {self.categoria or 'Sin categoría'}"
+
+
+class VentaDiariaProducto(models.Model):
+    dia = models.DateField()
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE)
+    unidades = models.PositiveIntegerField(default=0)
+    ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("dia", "producto")
+
+
+class VentaDiariaMetodoPago(models.Model):
+    dia = models.DateField()
+    metodo_pago = models.CharField(max_length=30)
+    facturas = models.PositiveIntegerField(default=0)
+    ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("dia", "metodo_pago")
+
+
+class ResumenCliente(models.Model):
+    """Totales históricos por cliente; 'pendiente' indica que cambió una factura suya."""
+    usuario = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="resumen_ventas")
+    facturas = models.PositiveIntegerField(default=0)
+    compras = models.PositiveIntegerField(default=0)
+    total_compras = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_pagado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    primera_compra = models.DateTimeField(blank=True, null=True)
+    ultima_compra = models.DateTimeField(blank=True, null=True)
+    pendiente = models.BooleanField(default=False, db_index=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumen de cliente"
+        verbose_name_plural = "Resúmenes de clientes"
+
+    def __str__(self):
+        return f"{self.usuario} · {self.compras} compras"
+
+
+class DiaVentasPendiente(models.Model):
+    """Días con facturas creadas/modificadas desde el último recálculo de rollups."""
+    dia = models.DateField(unique=True)
+
+    def __str__(self):
+        return str(self.dia)
+
+# ------------------------------------------------------------------
+# DIAGNÓSTICO
+# ------------------------------------------------------------------
+
+class PerfilPeticion(models.Model):
+    """
+    Perfil (árbol de llamadas + línea de tiempo SQL) de una petición puntual
+    pedida por staff. Se conservan solo los últimos PERFILADO_MAX_GUARDADOS.
+    """
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True)
+    ruta = models.CharField(max_length=500)
+    vista = models.CharField(max_length=200, blank=True)
+    metodo = models.CharField(max_length=10)
+    estado = models.PositiveIntegerField(default=0)
+    duracion_ms = models.FloatField(default=0)
+    consultas = models.PositiveIntegerField(default=0)
+    tiempo_db_ms = models.FloatField(default=0)
+    perfilador = models.CharField(max_length=20, default="cProfile")
+    arbol = models.TextField(blank=True)
+    sql = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        verbose_name = "Perfil de petición"
+        verbose_name_plural = "Perfiles de peticiones"
+        ordering = ["-fecha"]
+
+    def __str__(self):
+        return f"{self.metodo} {self.ruta} ({self.duracion_ms:.0f} ms)"
+
+# ------------------------------------------------------------------
+# CARRITO (persistente, ver store/utils/carrito.py)
+# ------------------------------------------------------------------
+
+class Cart(models.Model):
+    """Carrito de un cliente registrado (usuario) o de un visitante (token en su sesión)."""
+    usuario = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, blank=True, null=True, related_name="carrito"
+    )
+    token = models.CharField(max_length=32, unique=True, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Última modificación de una línea: base de las consultas de carritos abandonados
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Sube con cada escritura: ETag de carrito-json (304 si no cambió nada)
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Carrito"
+        verbose_name_plural = "Carritos"
+
+    def __str__(self):
+        return f"Carrito {self.id} - {self.usuario or 'Visitante'}"
+
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(Cart, related_name="lineas", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    talla = models.CharField(max_length=50, blank=True, default="")
+    color = models.CharField(max_length=50, blank=True, default="")
+    cantidad = models.PositiveIntegerField(default=1)
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    # Product.precio_version con la que se fijó ``precio`` (0 = repreciar siempre)
+    precio_version = models.PositiveIntegerField(default=0)
+    imagen_url = models.URLField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Línea de carrito"
+        verbose_name_plural = "Líneas de carrito"
+        unique_together = ("cart", "product", "talla", "color")
+
+    @property
+    def item_key(self):
+        # Misma llave que usaba el carrito en sesión (URLs de eliminar/actualizar)
+        return f"{self.product_id}|{self.talla}|{self.color}"
+
+    def __str__(self):
+        return f"{self.product_id} x {self.cantidad} ({self.talla}/{self.color})"
+
+
+class ReservaStock(models.Model):
+    """
+    Unidades apartadas por un carrito mientras su dueño está en el checkout
+    (ver store/utils/reservas.py). Vencida, deja de contar sola; el barrido
+    ``manage.py liberar_reservas`` solo limpia la tabla.
+    """
+    cart = models.ForeignKey(Cart, related_name="reservas", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name="reservas", on_delete=models.CASCADE)
+    # Nula: el producto no tiene matriz y la reserva es sobre su stock general
+    variante = models.ForeignKey(
+        ProductVariant, related_name="reservas", on_delete=models.CASCADE, blank=True, null=True
+    )
+    cantidad = models.PositiveIntegerField()
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Reserva de stock"
+        verbose_name_plural = "Reservas de stock"
+
+    def __str__(self):
+        return f"{self.product_id}/{self.variante_id or '-'} x {self.cantidad} hasta {self.expira:%H:%M}"
+
+
+class VentaFlash(models.Model):
+    """
+    Producto en venta flash: mientras dura, su stock vive en fichas repartidas
+    en la caché y el checkout tiene fila de admisión (store/utils/flash.py).
+    """
+    product = models.OneToOneField(Product, related_name="venta_flash", on_delete=models.CASCADE)
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField()
+    cupo_checkout = models.PositiveIntegerField(default=50, help_text="Clientes a la vez en el checkout.")
+    fragmentos = models.PositiveSmallIntegerField(
+        default=8, help_text="Contadores en que se reparte el stock de cada variante."
+    )
+
+    class Meta:
+        verbose_name = "Venta flash"
+        verbose_name_plural = "Ventas flash"
+
+    def __str__(self):
+        return f"Flash {self.product} ({self.inicio:%d/%m %H:%M} - {self.fin:%d/%m %H:%M})"
+
+
+class Promocion(models.Model):
+    """
+    Regla de descuento. Sin productos ni categorías aplica a toda la tienda;
+    con ``codigo`` solo cuenta cuando el cliente ingresa ese cupón. Se compila
+    en memoria y se evalúa por carrito en store/utils/promociones.py.
+    """
+    PORCENTAJE = "porcentaje"
+    FIJO = "fijo"
+    LLEVA_PAGA = "lleva_paga"
+    TIPOS = [
+        (PORCENTAJE, "Porcentaje"),
+        (FIJO, "Valor fijo por unidad"),
+        (LLEVA_PAGA, "Compra X, lleva Y gratis"),
+    ]
+
+    nombre = models.CharField(max_length=120)
+    tipo = models.CharField(max_length=12, choices=TIPOS, default=PORCENTAJE)
+    valor = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0,
+        help_text="Porcentaje (0-100) o valor a rebajar por unidad. No aplica a compra X lleva Y.",
+    )
+    compra = models.PositiveSmallIntegerField(default=0, help_text="X: unidades que se pagan.")
+    gratis = models.PositiveSmallIntegerField(default=0, help_text="Y: unidades de regalo por cada X.")
+
+    productos = models.ManyToManyField(Product, related_name="promociones", blank=True)
+    categorias = models.ManyToManyField(Category, related_name="promociones", blank=True)
+    codigo = models.CharField(
+        max_length=40, unique=True, null=True, blank=True,
+        help_text="Cupón. Vacío: se aplica sola.",
+    )
+
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField(blank=True, null=True)
+    activa = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = "Promoción"
+        verbose_name_plural = "Promociones"
+
+    def clean(self):
+        if self.codigo:
+            self.codigo = self.codigo.strip().upper()
+        if self.tipo == self.PORCENTAJE and not 0 < self.valor <= 100:
+            raise ValidationError({"valor": "El porcentaje debe estar entre 0 y 100."})
+        if self.tipo == self.FIJO and self.valor <= 0:
+            raise ValidationError({"valor": "El valor a rebajar debe ser mayor que cero."})
+        if self.tipo == self.LLEVA_PAGA and (self.compra < 1 or self.gratis < 1):
+            raise ValidationError("Compra X lleva Y necesita X e Y mayores que cero.")
+        if self.fin and self.fin <= self.inicio:
+            raise ValidationError({"fin": "La promoción debe terminar después de empezar."})
 
     def __str__(self):
-        return f"{self.product.name} | {self.talla or 'N/A'} - {self.color or 'N/A'}"
\ No newline at end of file
+        return f"{self.nombre} ({self.codigo})" if self.codigo else self.nombre
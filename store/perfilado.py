@@ -0,0 +1,159 @@
+"""
+Perfilado bajo demanda de una petición puntual (solo staff).
+
+Se activa con la cabecera ``X-Perfilar: 1`` o con ``?perfilar=<firma>``, donde
+la firma la genera ``firma_perfilado(usuario)`` (se muestra en el admin de
+"Perfiles de peticiones") y vence a los 10 minutos. El resultado se guarda en
+``PerfilPeticion`` y la respuesta lleva ``X-Perfil-Id``.
+
+Límites para que no se pueda abusar:
+- solo un perfilado a la vez por proceso (el perfilador es global);
+- como mínimo PERFILADO_INTERVALO_SEGUNDOS entre perfilados;
+- se conservan solo los últimos PERFILADO_MAX_GUARDADOS (buffer circular).
+"""
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+
+try:  # Opcional: árbol de llamadas más legible si está instalado
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:
+    _Pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+_SALT = "store.perfilado"
+_FIRMA_MAX_EDAD = 600
+_lock = threading.Lock()
+
+
+def firma_perfilado(usuario):
+    """Firma para ?perfilar=...; ligada al usuario staff que la pidió."""
+    return signing.TimestampSigner(salt=_SALT).sign(str(usuario.pk))
+
+
+def _pide_perfilado(request):
+    user = getattr(request, "user", None)
+    if user is None or not user.is_staff:
+        return False
+    if request.headers.get("X-Perfilar") == "1":
+        return True
+    firma = request.GET.get("perfilar")
+    if not firma:
+        return False
+    try:
+        pk = signing.TimestampSigner(salt=_SALT).unsign(firma, max_age=_FIRMA_MAX_EDAD)
+    except signing.BadSignature:
+        return False
+    return pk == str(user.pk)
+
+
+def _turno_disponible():
+    intervalo = getattr(settings, "PERFILADO_INTERVALO_SEGUNDOS", 10)
+    # cache.add es atómico: solo un perfilado por intervalo
+    return cache.add("perfilado:ultimo", True, timeout=intervalo)
+
+
+class _LineaTiempoSQL:
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            t1 = time.perf_counter()
+            self.consultas.append({
+                "inicio_ms": round((t0 - self.inicio) * 1000, 2),
+                "dur_ms": round((t1 - t0) * 1000, 2),
+                "sql": sql[:2000],
+            })
+
+
+class PerfiladoMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _pide_perfilado(request):
+            return self.get_response(request)
+        if not _lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            if not _turno_disponible():
+                return self.get_response(request)
+            return self._perfilar(request)
+        finally:
+            _lock.release()
+
+    def _perfilar(self, request):
+        from store.models import PerfilPeticion
+
+        inicio = time.perf_counter()
+        linea = _LineaTiempoSQL(inicio)
+
+        if _Pyinstrument is not None:
+            perfilador, nombre = _Pyinstrument(), "pyinstrument"
+        else:
+            perfilador, nombre = cProfile.Profile(), "cProfile"
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(linea))
+            if nombre == "cProfile":
+                perfilador.enable()
+            else:
+                perfilador.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                if nombre == "cProfile":
+                    perfilador.disable()
+                else:
+                    perfilador.stop()
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+
+        if nombre == "cProfile":
+            salida = io.StringIO()
+            pstats.Stats(perfilador, stream=salida).sort_stats("cumulative").print_stats(60)
+            arbol = salida.getvalue()
+        else:
+            arbol = perfilador.output_text(unicode=True, color=False)
+
+        match = getattr(request, "resolver_match", None)
+        perfil = PerfilPeticion.objects.create(
+            usuario=request.user,
+            ruta=request.get_full_path()[:500],
+            vista=match.view_name if match else "",
+            metodo=request.method,
+            estado=response.status_code,
+            duracion_ms=duracion_ms,
+            consultas=len(linea.consultas),
+            tiempo_db_ms=sum(c["dur_ms"] for c in linea.consultas),
+            perfilador=nombre,
+            arbol=arbol[:200_000],
+            sql=linea.consultas[:500],
+        )
+        _recortar_buffer()
+        response["X-Perfil-Id"] = str(perfil.pk)
+        logger.info("🔬 Perfil #%s guardado para %s (%.0f ms)", perfil.pk, perfil.ruta, duracion_ms)
+        return response
+
+
+def _recortar_buffer():
+    from store.models import PerfilPeticion
+
+    maximo = getattr(settings, "PERFILADO_MAX_GUARDADOS", 50)
+    sobrantes = PerfilPeticion.objects.order_by("-fecha", "-id").values_list("id", flat=True)[maximo:]
+    PerfilPeticion.objects.filter(id__in=list(sobrantes)).delete()
@@ -0,0 +1,55 @@
+"""
+Sesiones con escritura mínima.
+
+- ``SessionStore``: con caché compartida (``SESIONES_EN_CACHE``, es decir
+  Redis) es el backend ``cached_db`` de Django: las sesiones calientes se leen
+  de la caché y cada guardado escribe en la base y en la caché. Con caché
+  local por proceso se usa ``db`` (una caché por worker quedaría desfasada).
+- Solo se guarda la sesión cuando algo la modificó
+  (``SESSION_SAVE_EVERY_REQUEST = False``): un crawler o una página que solo
+  lee no hace UPDATE.
+- ``SesionMiddleware`` renueva la expiración de forma perezosa: si la última
+  escritura (``_renovada`` dentro de la sesión) tiene más de la mitad de
+  ``SESSION_COOKIE_AGE``, marca la sesión como modificada y el
+  SessionMiddleware de Django la guarda y reenvía la cookie. Un cliente activo
+  no pierde la sesión y se escribe como mucho una vez cada 12 h (con 24 h de
+  vida) en lugar de en cada petición.
+
+Las sesiones vencidas se borran por lotes con ``manage.py limpiar_sesiones``.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db, db
+from django.contrib.sessions.middleware import SessionMiddleware
+
+CLAVE_RENOVADA = "_renovada"
+
+_Base = cached_db.SessionStore if getattr(settings, "SESIONES_EN_CACHE", False) else db.SessionStore
+
+
+class SessionStore(_Base):
+    def save(self, must_create=False):
+        self._session[CLAVE_RENOVADA] = int(time.time())
+        super().save(must_create=must_create)
+
+    def necesita_renovar(self):
+        renovada = self.get(CLAVE_RENOVADA, 0)
+        return time.time() - renovada > self.get_session_cookie_age() / 2
+
+
+class SesionMiddleware(SessionMiddleware):
+    """SessionMiddleware que además renueva la expiración a mitad de vida."""
+
+    def process_response(self, request, response):
+        sesion = getattr(request, "session", None)
+        if (
+            sesion is not None
+            and sesion.accessed
+            and not sesion.modified
+            and not sesion.is_empty()
+            and getattr(sesion, "necesita_renovar", None)
+            and sesion.necesita_renovar()
+        ):
+            sesion.modified = True
+        return super().process_response(request, response)
@@ -1,7 +1,15 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from store.models import Factura
+from store.models import Banner, Category, Factura, Product, ProductImage, ProductVariant, Promocion, VentaFlash
 from store.utils.email import enviar_correo  # ✅ usa SendGrid API
+from store.utils.reportes import marcar_pendiente
+from store.utils.cache import invalidar_catalogo, invalidar_producto
+from store.utils.carrito import fusionar_al_login
+from store.utils.flash import invalidar_ventas
+from store.utils.imagenes import encolar_si_cambio
+from store.utils.promociones import invalidar_promociones
+from store.utils.variantes import invalidar_mapa_colores, invalidar_matriz_stock
 
 @receiver(post_save, sender=Factura)
 def enviar_actualizacion_estado(sender, instance, created, **kwargs):
@@ -22,4 +30,73 @@ def enviar_actualizacion_estado(sender, instance, created, **kwargs):
             enviar_correo(instance.email, asunto, mensaje)
             print(f"✅ Correo de actualización enviado para pedido #{instance.id} con estado {instance.estado_pago}")
         else:
-            print(f"⚠️ No se envió correo de actualización para pedido #{instance.id} porque el estado es {instance.estado_pago}")
\ No newline at end of file
+            print(f"⚠️ No se envió correo de actualización para pedido #{instance.id} porque el estado es {instance.estado_pago}")
+
+
+@receiver(post_save, sender=Factura)
+@receiver(post_delete, sender=Factura)
+def marcar_reportes_pendientes(sender, instance, **kwargs):
+    """Marca el día de la factura y el resumen del cliente para actualizar_reportes."""
+    marcar_pendiente(instance)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def invalidar_cache_catalogo(sender, instance, update_fields=None, **kwargs):
+    """
+    Editar un producto o una categoría invalida las cachés versionadas
+    (store/utils/cache.py). Guardar solo el stock de un producto (cada venta)
+    invalida únicamente sus fragmentos.
+    """
+    if sender is Product and update_fields and set(update_fields) == {"stock"}:
+        invalidar_producto(instance.pk)
+    else:
+        invalidar_catalogo()
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidar_cache_producto(sender, instance, **kwargs):
+    """Variantes e imágenes de la galería solo aparecen en los fragmentos de su producto."""
+    invalidar_producto(instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Banner)
+def encolar_derivadas_imagen(sender, instance, **kwargs):
+    """Si cambió el archivo de imagen, encola sus derivadas para procesar_imagenes."""
+    encolar_si_cambio(instance)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidar_mapa_lupa(sender, instance, **kwargs):
+    """Al tocar una imagen se rearma el mapa color → imágenes de su producto."""
+    invalidar_mapa_colores(instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def invalidar_matriz_variantes(sender, instance, **kwargs):
+    """Stock o combinaciones nuevas: se rearma la matriz talla × color del producto."""
+    invalidar_matriz_stock(instance.product_id)
+
+
+@receiver(user_logged_in)
+def fusionar_carrito_visitante(sender, request, user, **kwargs):
+    """Lo que el visitante agregó antes de iniciar sesión pasa a su carrito."""
+    if request is not None:
+        fusionar_al_login(request, user)
+
+
+@receiver([post_save, post_delete], sender=VentaFlash)
+def invalidar_ventas_flash(sender, **kwargs):
+    """Editar una venta flash (fechas, cupo) se ve en el próximo request."""
+    invalidar_ventas()
+
+
+@receiver([post_save, post_delete], sender=Promocion)
+@receiver(m2m_changed, sender=Promocion.productos.through)
+@receiver(m2m_changed, sender=Promocion.categorias.through)
+def recompilar_promociones(sender, **kwargs):
+    """Cada proceso recompila sus reglas en el próximo checkout."""
+    invalidar_promociones()
@@ -9,6 +9,8 @@ document.addEventListener("DOMContentLoaded", () => {
     initSliders(); 
     initHoverVideoEnGrid();
     inicializarCarritoModal();
+    initCarritoPagina();
+    initContadorCarrito();
 });
 
 function getCSRFToken() { 
@@ -116,27 +118,118 @@ function renderizarSideCart(items, total) {
 
 function eliminarItemCarrito(itemKey) {
     if(!confirm("¿Deseas eliminar este producto?")) return;
-    const encodedKey = encodeURIComponent(itemKey);
 
-    fetch(`/store/carrito/eliminar/${encodedKey}/`, {
-        method: "GET",
-        headers: { "X-Requested-With": "XMLHttpRequest" }
+    operarCarrito([{ op: "eliminar", item_key: itemKey }])
+    .then(() => {
+        mostrarToast("Producto eliminado 🗑️");
+        abrirSideCart();
+    })
+    .catch(err => console.error("Error:", err));
+}
+
+/* =====================================================
+    API DEL CARRITO (operaciones en lote, respuesta delta)
+===================================================== */
+function operarCarrito(ops) {
+    return fetch('/store/carrito/api/', {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            "X-CSRFToken": getCSRFToken(),
+            "X-Requested-With": "XMLHttpRequest"
+        },
+        body: JSON.stringify({ ops })
     })
     .then(res => res.json())
     .then(data => {
-        if (data.status === 'ok') {
-            mostrarToast("Producto eliminado 🗑️");
-            const badge = document.querySelector(".cart-count");
-            if (badge) badge.innerText = data.cart_count;
-            if (typeof abrirSideCart === "function") {
-                abrirSideCart(); 
-            } else {
-                renderizarSideCart(data.carrito_completo || data.items || {}, data.total_carrito);
-            }
-            if(window.location.pathname.includes('carrito')) location.reload();
+        if (data.status !== "ok") throw new Error(data.message || "Error en el carrito");
+        document.querySelectorAll(".cart-count").forEach(b => b.innerText = data.totales.unidades);
+        if (data.avisos && data.avisos.length) mostrarToast(data.avisos.join(" "));
+        aplicarDeltaCarrito(data);
+        return data;
+    });
+}
+
+// Pinta en la página del carrito solo las líneas que devolvió la API
+function aplicarDeltaCarrito(data) {
+    const seccion = document.querySelector(".cart-section[data-carrito-api]");
+    if (!seccion) return;
+
+    let recargar = data.totales.unidades === 0;  // el estado vacío lo arma el servidor
+    Object.entries(data.lineas).forEach(([key, linea]) => {
+        const fila = [...seccion.querySelectorAll(".cart-item")].find(f => f.dataset.itemKey === key);
+        if (!fila) return;
+        if (!linea) { fila.remove(); return; }
+        if (!linea.disponible && !fila.classList.contains("item-agotado")) { recargar = true; return; }
+
+        fila.dataset.stock = linea.stock_max;
+        pintarCantidadFila(fila, linea.cantidad);
+        const subtotal = fila.querySelector(".subtotal-price");
+        if (subtotal) subtotal.innerText = `$${linea.subtotal_formateado}`;
+    });
+    if (recargar) { location.reload(); return; }
+
+    const total = seccion.querySelector(".total-amount");
+    if (total) total.innerText = `$${data.totales.total_formateado}`;
+    const finalizar = seccion.querySelector(".js-finalizar");
+    if (finalizar) finalizar.classList.toggle("disabled", Number(data.totales.total) === 0);
+}
+
+function pintarCantidadFila(fila, cantidad) {
+    const stock = parseInt(fila.dataset.stock, 10) || 0;
+    const span = fila.querySelector(".cantidad-item");
+    if (span) span.innerText = cantidad;
+    const restar = fila.querySelector('button[value="restar"]');
+    if (restar) restar.disabled = cantidad <= 1;
+    const sumar = fila.querySelector('button[value="sumar"]');
+    if (sumar) sumar.disabled = cantidad >= stock;
+    const aviso = fila.querySelector(".badge-stock");
+    if (aviso) aviso.classList.toggle("d-none", cantidad < stock);
+}
+
+// Los toques seguidos en +/- se juntan en un solo POST (una operación por línea)
+const cantidadesPendientes = new Map();
+let temporizadorCantidades = null;
+
+function encolarCantidad(itemKey, cantidad) {
+    cantidadesPendientes.set(itemKey, cantidad);
+    clearTimeout(temporizadorCantidades);
+    temporizadorCantidades = setTimeout(() => {
+        const ops = [...cantidadesPendientes].map(([item_key, cant]) => ({ op: "cantidad", item_key, cantidad: cant }));
+        cantidadesPendientes.clear();
+        operarCarrito(ops).catch(err => { console.error("Error:", err); location.reload(); });
+    }, 300);
+}
+
+function initCarritoPagina() {
+    const seccion = document.querySelector(".cart-section[data-carrito-api]");
+    if (!seccion) return;
+
+    seccion.addEventListener("submit", (e) => {
+        const form = e.target;
+        if (form.classList.contains("js-cantidad")) {
+            e.preventDefault();
+            const fila = form.closest(".cart-item");
+            const actual = parseInt(fila.querySelector(".cantidad-item").innerText, 10) || 1;
+            const nueva = actual + (e.submitter && e.submitter.value === "restar" ? -1 : 1);
+            if (nueva < 1 || nueva > (parseInt(fila.dataset.stock, 10) || 0)) return;
+            pintarCantidadFila(fila, nueva);  // respuesta inmediata; la API confirma o corrige
+            encolarCantidad(fila.dataset.itemKey, nueva);
+        } else if (form.classList.contains("js-vaciar")) {
+            e.preventDefault();
+            if (!confirm(form.dataset.confirmar)) return;
+            operarCarrito([{ op: "vaciar" }]).catch(() => form.submit());
         }
-    })
-    .catch(err => console.error("Error:", err));
+    });
+
+    seccion.addEventListener("click", (e) => {
+        const enlace = e.target.closest(".js-eliminar-linea");
+        if (!enlace) return;
+        e.preventDefault();
+        if (!confirm(enlace.dataset.confirmar)) return;
+        operarCarrito([{ op: "eliminar", item_key: enlace.closest(".cart-item").dataset.itemKey }])
+        .catch(() => { window.location.href = enlace.href; });
+    });
 }
 
 /* =====================================================
@@ -316,7 +409,12 @@ if (imgPrincipal) {
                 // --- Inicialización: Simular clic en el primer color disponible ---
                 if (botonesColor.length > 0) {
                     // Si ya hay uno con clase 'seleccionado' de servidor, usamos ese, si no el primero
-                    const btnInicial = cont.querySelector('.color-chip.seleccionado') || botonesColor[0];
+                    // (saltando los colores agotados en todas las tallas)
+                    const nodoMatriz = cont.querySelector('#matriz-stock-rapida');
+                    const matriz = nodoMatriz ? JSON.parse(nodoMatriz.textContent) : null;
+                    const btnInicial = cont.querySelector('.color-chip.seleccionado')
+                        || Array.from(botonesColor).find(b => window.hayStock(matriz, "", b.dataset.value))
+                        || botonesColor[0];
                     btnInicial.click(); 
                 }
 
@@ -345,6 +443,21 @@ function cerrarVistaRapida() {
     }
 }
 
+/* =====================================================
+    MATRIZ DE STOCK (talla × color, ver store/utils/variantes.py)
+===================================================== */
+// ¿Queda stock para la talla/color? Un valor vacío es "cualquiera" y una
+// combinación que la matriz no conoce no se bloquea (la valida el servidor).
+window.hayStock = function(matriz, talla, color) {
+    if (!matriz || !matriz.tallas || !matriz.tallas.length) return true;
+    const norm = v => (v || "").toString().trim().toUpperCase();
+    const i = matriz.tallas.findIndex(t => norm(t) === norm(talla));
+    const j = matriz.colores.findIndex(c => norm(c) === norm(color));
+    if ((talla && i === -1) || (color && j === -1)) return true;
+    const filas = talla ? [matriz.stock[i]] : matriz.stock;
+    return filas.some(fila => (color ? [fila[j]] : fila).some(n => n > 0));
+};
+
 /* =====================================================
     SINCRONIZACIÓN MAESTRA (IMAGEN -> COLOR -> FORM)
 ===================================================== */
@@ -365,6 +478,28 @@ window.initVistaRapida = function(cont) {
     let tallaOK = chipsTallas.length === 0 || (inputTallaHidden && inputTallaHidden.value !== "");
     let colorOK = chipsColores.length === 0 || (inputColorHidden && inputColorHidden.value !== "");
 
+    const nodoMatriz = contenedor.querySelector("#matriz-stock-rapida");
+    const matriz = nodoMatriz ? JSON.parse(nodoMatriz.textContent) : null;
+
+    // Deshabilita las combinaciones agotadas según lo ya elegido
+    const marcarAgotados = () => {
+        const talla = inputTallaHidden ? inputTallaHidden.value : "";
+        const color = inputColorHidden ? inputColorHidden.value : "";
+        chipsTallas.forEach(t => {
+            t.disabled = !window.hayStock(matriz, t.dataset.value, color);
+            if (t.disabled && t.classList.contains("seleccionado")) {
+                t.classList.remove("seleccionado");
+                t.style.backgroundColor = "";
+                t.style.color = "";
+                if (inputTallaHidden) inputTallaHidden.value = "";
+                tallaOK = false;
+            }
+        });
+        chipsColores.forEach(c => {
+            c.disabled = !window.hayStock(matriz, talla, c.dataset.value);
+        });
+    };
+
     const actualizarEstadoBoton = () => {
         if (!btnAgregar) return;
         if (tallaOK && colorOK) {
@@ -389,6 +524,7 @@ window.initVistaRapida = function(cont) {
             this.style.color = "white";
             if(inputTallaHidden) inputTallaHidden.value = this.dataset.value || this.innerText.trim();
             tallaOK = true;
+            marcarAgotados();
             actualizarEstadoBoton();
         }
     });
@@ -402,6 +538,7 @@ window.initVistaRapida = function(cont) {
             this.style.color = "white";
             if(inputColorHidden) inputColorHidden.value = this.dataset.value || this.innerText.trim();
             colorOK = true;
+            marcarAgotados();
             actualizarEstadoBoton();
         }
     });
@@ -428,6 +565,7 @@ window.initVistaRapida = function(cont) {
             }
         };
     });
+    marcarAgotados();
     actualizarEstadoBoton();
 };
 
@@ -539,6 +677,21 @@ function obtenerCarritoActualizado() {
     .catch(err => console.error("Error:", err));
 }
 
+// Contador del navbar: modo resumen + ETag (el navegador revalida y recibe 304 si nada cambió)
+function refrescarContadorCarrito() {
+    fetch('/store/carrito-json/?resumen=1', { headers: { "X-Requested-With": "XMLHttpRequest" }})
+    .then(res => res.json())
+    .then(data => document.querySelectorAll(".cart-count").forEach(b => b.innerText = data.cart_count))
+    .catch(err => console.error("Error:", err));
+}
+
+function initContadorCarrito() {
+    // Otra pestaña pudo cambiar el carrito: se revisa al volver a esta
+    document.addEventListener("visibilitychange", () => {
+        if (document.visibilityState === "visible") refrescarContadorCarrito();
+    });
+}
+
 function initEventosGlobales() {
     document.body.addEventListener("click", (e) => {
         const btnQuick = e.target.closest(".quick-view");
@@ -0,0 +1,79 @@
+"""
+Storages de media con URLs memorizadas.
+
+Con Cloudinary cada ``{{ producto.image.url }}`` arma la URL con
+CloudinaryResource (prefijo, tipo de recurso, firma de la config...). En un
+listado de 48 tarjetas, más el carrito y el checkout que piden ``.image.url``
+dentro de bucles, eso se nota en el tiempo de render. La URL de un nombre
+dado no cambia (un archivo nuevo siempre trae un nombre nuevo), así que se
+guarda en un LRU acotado por proceso (MEDIA_URL_CACHE_MAX entradas).
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from cloudinary_storage.storage import MediaCloudinaryStorage
+
+
+class LRUAcotado:
+    """Diccionario LRU con tope de tamaño y seguro entre hilos."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = self.fallos = 0
+
+    def get(self, clave):
+        with self._lock:
+            try:
+                self._datos.move_to_end(clave)
+            except KeyError:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            return self._datos[clave]
+
+    def put(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            if len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def pop(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def __len__(self):
+        return len(self._datos)
+
+
+_urls = LRUAcotado(getattr(settings, "MEDIA_URL_CACHE_MAX", 5000))
+
+
+class URLMemorizadaMixin:
+    """Memoriza storage.url(name) por (clase de storage, tipo de recurso, nombre)."""
+
+    def _clave_url(self, name):
+        return (type(self).__name__, getattr(self, "RESOURCE_TYPE", ""), name)
+
+    def url(self, name):
+        clave = self._clave_url(name)
+        url = _urls.get(clave)
+        if url is None:
+            url = super().url(name)
+            _urls.put(clave, url)
+        return url
+
+    def delete(self, name):
+        _urls.pop(self._clave_url(name))
+        return super().delete(name)
+
+
+class MediaCloudinaryStorageMemo(URLMemorizadaMixin, MediaCloudinaryStorage):
+    pass
+
+
+def estadisticas_urls():
+    return {"entradas": len(_urls), "aciertos": _urls.aciertos, "fallos": _urls.fallos}
@@ -0,0 +1,56 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from store.utils.imagenes import url_derivada, url_original
+
+register = template.Library()
+
+
+def _srcset(entradas):
+    return ", ".join(f"{url} {ancho}w" for ancho, url, *_ in entradas)
+
+
+@register.simple_tag
+def imagen_responsive(archivo, derivadas=None, alt="", sizes="100vw", clase="", estilo="", lazy=True, **extra):
+    """
+    <img> con srcset WebP (y <picture> con AVIF si existe) a partir de
+    ``<campo>_derivadas``. Sin derivadas todavía, cae al original. Mientras
+    carga muestra el color dominante y la vista previa difuminada (lqip).
+    Los argumentos extra se copian como atributos (data_src → data-src).
+
+        {% imagen_responsive product.image product.image_derivadas alt=product.name sizes="(min-width: 992px) 25vw, 50vw" clase="product-img w-100" %}
+    """
+    original = url_original(archivo)
+    derivadas = derivadas or {}
+    if derivadas.get("color"):
+        fondo = f"background:{derivadas['color']}"
+        if derivadas.get("lqip"):
+            fondo += f" url({derivadas['lqip']}) center/cover no-repeat"
+        estilo = f"{fondo};{estilo}" if estilo else fondo
+    atributos = [("src", original), ("alt", alt)]
+    if derivadas.get("webp"):
+        atributos += [("srcset", _srcset(derivadas["webp"])), ("sizes", sizes)]
+    if derivadas.get("ancho"):
+        # Evita saltos de layout: el navegador reserva la proporción real
+        atributos += [("width", derivadas["ancho"]), ("height", derivadas["alto"])]
+    if clase:
+        atributos.append(("class", clase))
+    if estilo:
+        atributos.append(("style", estilo))
+    if lazy:
+        atributos += [("loading", "lazy"), ("decoding", "async")]
+    atributos += [(nombre.replace("_", "-"), valor) for nombre, valor in extra.items()]
+
+    img = format_html("<img {}>", format_html_join(" ", '{}="{}"', atributos))
+    if not derivadas.get("avif"):
+        return img
+    return format_html(
+        '<picture><source type="image/avif" srcset="{}" sizes="{}">{}</picture>',
+        _srcset(derivadas["avif"]), sizes, img,
+    )
+
+
+@register.simple_tag
+def imagen_url(archivo, derivadas=None, ancho=1280):
+    """URL WebP más chica que cubre ``ancho`` px (para background-image)."""
+    return url_derivada(archivo, derivadas, ancho)
@@ -1,3 +1,732 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import (
+    Cart, CartLine, Category, Product, ProductVariant, Factura, DetalleFactura, Promocion, ReservaStock, TareaImagen,
+    VentaFlash,
+)
+from .sesiones import CLAVE_RENOVADA, SessionStore
+from .utils import carrito as carrito_db, flash, promociones
+from .utils.cache import etag_fragmento, version_catalogo
+from .utils.catalogo import importar
+from .utils.exportacion import filas_catalogo
+from .utils.imagenes import MAX_INTENTOS, procesar_pendientes
+
+User = get_user_model()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CORREO_SIMULADO=True, PRESUPUESTO_CONSULTAS_ESTRICTO=True)
+class FlujoCompraTest(TestCase):
+    def setUp(self):
+        # Crear usuario de prueba (el login es con email)
+        self.user = User.objects.create_user(
+            name="Jairo", lastname="Prueba", username="jairo",
+            email="jairo@test.com", password="12345",
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        # Crear producto de prueba con su matriz de inventario
+        categoria = Category.objects.create(name="Camisas", slug="camisas")
+        self.producto = Product.objects.create(
+            name="Camisa Elegante",
+            slug="camisa-elegante",
+            description="Camisa de prueba",
+            cost=Decimal("40000"),
+            discount=5,
+            talla="S,M,L,XL",
+            color="Blanco,Negro,Rojo",
+            category=categoria,
+            image="products/camisa.jpg",
+            is_available=True,
+        )
+        ProductVariant.objects.create(product=self.producto, talla="M", color="Negro", stock=10)
+
+    def test_agregar_al_carrito_y_generar_factura(self):
+        # 1. Agregar producto al carrito (respuesta JSON para el AJAX)
+        url = reverse("store:agregar_al_carrito", args=[self.producto.id])
+        for _ in range(2):
+            response = self.client.post(url, {"talla": "M", "color": "Negro"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cart_count"], 2)
+
+        # 2. Ver carrito
+        response = self.client.get(reverse("store:ver_carrito"))
+        self.assertContains(response, "Camisa Elegante")
+
+        # 3. Generar factura (una venta solo invalida los fragmentos de su producto)
+        version, etag = version_catalogo(), etag_fragmento("vista_rapida", self.producto.id)
+        response = self.client.post(reverse("store:generar_factura"), {
+            "nombre": "Jairo",
+            "telefono": "3000000000",
+            "direccion": "Calle 1",
+            "ciudad": "Medellín",
+            "departamento": "Antioquia",
+            "metodo_pago": "Contra Entrega",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "store/confirmacion_pago.html")
+
+        # 4. Validar que la factura se creó
+        factura = Factura.objects.get()
+        self.assertEqual(factura.usuario, self.user)
+        self.assertEqual(factura.total, Decimal("76000"))
+
+        # 5. Validar detalle de factura y descuento de stock
+        detalle = DetalleFactura.objects.get()
+        self.assertEqual(detalle.producto, self.producto)
+        self.assertEqual(detalle.talla, "M")
+        self.assertEqual(detalle.color, "Negro")
+        self.assertEqual(detalle.cantidad, 2)
+        self.assertEqual(ProductVariant.objects.get().stock, 8)
+        self.assertEqual(version_catalogo(), version)
+        self.assertNotEqual(etag_fragmento("vista_rapida", self.producto.id), etag)
+
+    def test_promociones_y_cupon_en_factura(self):
+        # El índice compilado vive en memoria y sobrevive al rollback del test
+        self.addCleanup(promociones.invalidar_promociones)
+        ayer, manana = timezone.now() - timedelta(days=1), timezone.now() + timedelta(days=1)
+        Promocion.objects.create(nombre="Toda la tienda", valor=50, inicio=manana)  # aún no empieza
+        camisas = Promocion.objects.create(nombre="Camisas -10%", valor=10, inicio=ayer)
+        camisas.categorias.add(self.producto.category)
+        dos_por_uno = Promocion.objects.create(
+            nombre="2x1", tipo=Promocion.LLEVA_PAGA, compra=1, gratis=1, codigo="DOSXUNO", inicio=ayer,
+        )
+        dos_por_uno.productos.add(self.producto)
+
+        url = reverse("store:agregar_al_carrito", args=[self.producto.id])
+        for _ in range(2):
+            self.client.post(url, {"talla": "M", "color": "Negro"})
+
+        # Sin cupón gana la promoción de la categoría; con cupón, la mejor por línea
+        response = self.client.get(reverse("store:checkout"))
+        self.assertEqual(response.context["descuento_promociones"], Decimal("7600"))
+        self.client.post(reverse("store:aplicar_cupon"), {"codigo": " dosxuno "})
+        response = self.client.get(reverse("store:checkout"))
+        self.assertEqual(response.context["descuento_promociones"], Decimal("38000"))
+        self.assertEqual(response.context["total"], Decimal("38000"))
+
+        self.client.post(reverse("store:generar_factura"), {
+            "nombre": "Jairo", "telefono": "3000000000", "direccion": "Calle 1",
+            "ciudad": "Medellín", "departamento": "Antioquia",
+        })
+        factura = Factura.objects.get()
+        self.assertEqual((factura.total, factura.descuento, factura.cupon), (Decimal("38000"), Decimal("38000"), "DOSXUNO"))
+        detalle = DetalleFactura.objects.get()
+        self.assertEqual((detalle.subtotal, detalle.promocion), (Decimal("38000"), "2x1"))
+
+        response = self.client.get(reverse("store:generar_factura_pdf", args=[factura.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_promocion_que_termina_antes_de_pagar_vuelve_al_checkout(self):
+        self.addCleanup(promociones.invalidar_promociones)
+        promo = Promocion.objects.create(nombre="Camisas -10%", valor=10, inicio=timezone.now() - timedelta(days=1))
+        promo.productos.add(self.producto)
+        self.client.post(reverse("store:agregar_al_carrito", args=[self.producto.id]), {"talla": "M", "color": "Negro"})
+        self.assertEqual(self.client.get(reverse("store:checkout")).context["total"], Decimal("34200"))
+
+        promo.activa = False
+        promo.save()
+        datos = {"nombre": "Jairo", "direccion": "Calle 1"}
+        response = self.client.post(reverse("store:generar_factura"), datos)
+        self.assertRedirects(response, reverse("store:checkout"), fetch_redirect_response=False)
+        self.assertFalse(Factura.objects.exists())
+
+        # Visto el total nuevo, se cobra ese
+        self.assertEqual(self.client.get(reverse("store:checkout")).context["total"], Decimal("38000"))
+        self.client.post(reverse("store:generar_factura"), datos)
+        self.assertEqual(Factura.objects.get().total, Decimal("38000"))
+
+    def test_mis_facturas_cuenta_sin_depender_del_rollup(self):
+        # bulk_create no dispara señales: el rollup del cliente queda desfasado
+        Factura.objects.bulk_create([Factura(usuario=self.user, total=Decimal("1000")) for _ in range(9)])
+        response = self.client.get(reverse("store:mis_facturas"), {"page": 2})
+        self.assertEqual(response.context["total_pedidos"], 9)
+        self.assertEqual(len(response.context["facturas"].object_list), 1)
+
+    def test_descargar_factura_pdf(self):
+        # Crear factura manualmente
+        factura = Factura.objects.create(
+            usuario=self.user,
+            total=Decimal("38000"),
+            metodo_pago="Tarjeta",
+            estado_pago="Pagado",
+            banco="Bancolombia"
+        )
+        DetalleFactura.objects.create(
+            factura=factura,
+            producto=self.producto,
+            cantidad=1,
+            subtotal=Decimal("38000"),
+            talla="L",
+            color="Blanco"
+        )
+
+        # Descargar PDF
+        response = self.client.get(reverse("store:generar_factura_pdf", args=[factura.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT=False,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "flash-tests"}},
+    FLASH_EN_CACHE=True,  # los tests corren en un solo proceso: la LocMemCache hace de compartida
+)
+class VentaFlashTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        categoria = Category.objects.create(name="Tenis", slug="tenis")
+        self.producto = Product.objects.create(
+            name="Tenis Flash", slug="tenis-flash", cost=Decimal("100000"), category=categoria, is_available=True,
+        )
+        self.variante = ProductVariant.objects.create(product=self.producto, talla="40", color="Blanco", stock=5)
+        ahora = timezone.now()
+        self.venta = VentaFlash.objects.create(
+            product=self.producto, inicio=ahora - timedelta(minutes=1), fin=ahora + timedelta(hours=1),
+            cupo_checkout=2, fragmentos=3,
+        )
+
+    def test_fichas_no_sobrevenden_y_se_concilian(self):
+        self.assertEqual(flash.cargar_fichas(self.venta), 5)
+        pid = self.producto.id
+        self.assertTrue(all(flash.reclamar(pid, "40", "blanco", 1) for _ in range(5)))
+        self.assertFalse(flash.reclamar(pid, "40", "Blanco", 1))
+        self.assertEqual(flash.restantes(pid, "40", "Blanco"), 0)
+
+        flash.devolver(pid, "40", "Blanco", 2)
+        self.assertFalse(flash.reclamar(pid, "40", "Blanco", 3))  # todo o nada
+        self.assertEqual(flash.restantes(pid, "40", "Blanco"), 2)
+
+        flash.conciliar(self.venta)
+        self.assertEqual(ProductVariant.objects.get().stock, 2)
+
+    def test_conciliar_respeta_reposicion_durante_la_venta(self):
+        flash.cargar_fichas(self.venta)
+        pid = self.producto.id
+        self.assertTrue(flash.reclamar(pid, "40", "Blanco", 2))
+
+        self.variante.stock += 10  # el admin repone mientras corre la venta
+        self.variante.save()
+        flash.conciliar(self.venta)
+        self.assertEqual(ProductVariant.objects.get().stock, 13)
+        flash.conciliar(self.venta)  # sin ventas nuevas no cambia nada
+        self.assertEqual(ProductVariant.objects.get().stock, 13)
+
+        self.assertTrue(flash.reclamar(pid, "40", "Blanco", 1))
+        etag = etag_fragmento("vista_rapida", pid)
+        flash.conciliar(self.venta, cerrar=True)
+        self.assertNotEqual(etag_fragmento("vista_rapida", pid), etag)  # la vista rápida no queda con el stock viejo
+        self.assertEqual((ProductVariant.objects.get().stock, Product.objects.get().stock), (12, 12))
+        self.assertFalse(flash.cargada(pid))
+
+    def test_factura_con_fichas_cargadas_no_toca_la_base(self):
+        flash.cargar_fichas(self.venta)
+        cache.set(flash.CLAVE_ACTIVAS, {}, flash.ACTIVAS_TTL)  # la caché de ventas aún no se entera
+        usuario = User.objects.create_user(
+            name="Flash", lastname="x", username="flash", email="flash@test.com", password="12345",
+        )
+        cliente = Client()
+        cliente.force_login(usuario)
+        cliente.post(reverse("store:agregar_al_carrito", args=[self.producto.id]), {"talla": "40", "color": "Blanco"})
+
+        response = cliente.post(reverse("store:generar_factura"), {"nombre": "Flash", "direccion": "Calle 1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(flash.restantes(self.producto.id, "40", "Blanco"), 4)
+        self.assertEqual(ProductVariant.objects.get().stock, 5)
+
+        flash.conciliar(self.venta)
+        self.assertEqual(ProductVariant.objects.get().stock, 4)
+
+    def test_sin_cache_compartida_se_vende_con_el_stock_normal(self):
+        flash.cargar_fichas(self.venta)
+        with self.settings(FLASH_EN_CACHE=False):
+            self.assertEqual(flash.ventas_activas(), {})
+            self.assertEqual(flash.cargadas([self.producto.id]), set())
+            self.assertFalse(flash.cargada(self.producto.id))
+
+    def test_fila_admite_hasta_el_cupo(self):
+        url = reverse("store:fila_flash", args=[self.producto.id])
+        clientes = []
+        for n in range(3):
+            usuario = User.objects.create_user(
+                name=f"u{n}", lastname="x", username=f"u{n}", email=f"u{n}@test.com", password="12345",
+            )
+            cliente = Client()
+            cliente.force_login(usuario)
+            clientes.append(cliente)
+
+        estados = [c.get(url, HTTP_X_REQUESTED_WITH="XMLHttpRequest").json() for c in clientes]
+        self.assertEqual([e["admitido"] for e in estados], [True, True, False])
+
+        # Un admitido termina su compra: el siguiente de la fila entra
+        peticion = RequestFactory().get(url)
+        peticion.session = clientes[0].session
+        flash.salir(peticion, self.producto.id)
+        peticion.session.save()
+        self.assertTrue(clientes[2].get(url, HTTP_X_REQUESTED_WITH="XMLHttpRequest").json()["admitido"])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CORREO_SIMULADO=True, PRESUPUESTO_CONSULTAS_ESTRICTO=True)
+class ReservasTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        categoria = Category.objects.create(name="Gorras", slug="gorras")
+        self.producto = Product.objects.create(
+            name="Gorra", slug="gorra", description="x", cost=Decimal("20000"), category=categoria,
+        )
+        self.variante = ProductVariant.objects.create(product=self.producto, talla="U", color="Azul", stock=1)
+        self.ana, self.beto = (self._cliente(nombre) for nombre in ("ana", "beto"))
+
+    def _cliente(self, nombre):
+        usuario = User.objects.create_user(
+            name=nombre, lastname="Prueba", username=nombre, email=f"{nombre}@test.com", password="12345",
+        )
+        cliente = Client()
+        cliente.force_login(usuario)
+        return cliente
+
+    def _agregar(self, cliente, veces=1):
+        for _ in range(veces):
+            cliente.post(reverse("store:agregar_al_carrito", args=[self.producto.id]), {"talla": "U", "color": "Azul"})
+
+    def _comprar(self, cliente):
+        return cliente.post(reverse("store:generar_factura"), {
+            "nombre": "Cliente", "telefono": "3000000000", "direccion": "Calle 1",
+            "ciudad": "Medellín", "departamento": "Antioquia",
+        })
+
+    def _stock(self):
+        return ProductVariant.objects.get().stock
+
+    def test_no_se_vende_lo_apartado_por_otro_carrito(self):
+        self._agregar(self.ana)
+        self._agregar(self.beto)
+        self.ana.get(reverse("store:checkout"))  # ana aparta la única unidad
+
+        response = self._comprar(self.beto)
+        self.assertRedirects(response, reverse("store:checkout"), fetch_redirect_response=False)
+        self.assertFalse(Factura.objects.exists())
+        self.assertEqual(self._stock(), 1)
+
+        # En el checkout de beto la línea agotada sale del carrito
+        self.beto.get(reverse("store:checkout"))
+        self.assertFalse(CartLine.objects.filter(cart__usuario__username="beto").exists())
+
+        self.assertEqual(self._comprar(self.ana).status_code, 200)
+        self.assertEqual(DetalleFactura.objects.get().cantidad, 1)
+        self.assertEqual((self._stock(), Product.objects.get().stock), (0, 0))
+        self.assertFalse(ReservaStock.objects.exists())
+
+    def test_reserva_vencida_deja_comprar_a_otro(self):
+        self._agregar(self.ana)
+        self._agregar(self.beto)
+        self.ana.get(reverse("store:checkout"))
+        ReservaStock.objects.update(expira=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(self._comprar(self.beto).status_code, 200)
+        self.assertEqual(self._stock(), 0)
+
+        # Ana llega tarde: sin factura ni stock negativo
+        response = self._comprar(self.ana)
+        self.assertRedirects(response, reverse("store:checkout"), fetch_redirect_response=False)
+        self.assertEqual(Factura.objects.count(), 1)
+        self.assertEqual(self._stock(), 0)
+
+    def test_checkout_guarda_la_cantidad_recortada(self):
+        self.variante.stock = 3
+        self.variante.save()
+        self._agregar(self.ana, veces=3)
+        self.variante.stock = 2
+        self.variante.save()
+
+        response = self.ana.get(reverse("store:checkout"))
+        self.assertEqual(response.context["items"][0]["cantidad"], 2)
+        self.assertEqual(CartLine.objects.get().cantidad, 2)
+        avisos = [str(m) for m in response.context["messages"]]
+        self.assertIn("Solo quedan 2 unidades de Gorra; ajustamos tu carrito.", avisos)
+
+        self.assertEqual(self._comprar(self.ana).status_code, 200)
+        self.assertEqual(DetalleFactura.objects.get().cantidad, 2)
+        self.assertEqual(self._stock(), 0)
+
+    def test_confirmacion_de_pago_respeta_las_reservas(self):
+        self._agregar(self.ana)
+        self.ana.get(reverse("store:checkout"))
+        usuario_beto = User.objects.get(username="beto")
+        factura = Factura.objects.create(usuario=usuario_beto, total=Decimal("20000"))
+        DetalleFactura.objects.create(
+            factura=factura, producto=self.producto, cantidad=1, subtotal=Decimal("20000"), talla="U", color="Azul",
+        )
+        url = reverse("store:confirmacion_pago")
+        # Solo interesan stock y estado: store/factura.html trae un filtro inválido (widthratio)
+        self.enterContext(mock.patch("store.views.render", return_value=HttpResponse()))
+
+        self.beto.get(url, {"status": "APPROVED", "reference": factura.id})
+        factura.refresh_from_db()
+        self.assertEqual((factura.estado_pago, self._stock()), ("Sin stock", 1))
+
+        factura = Factura.objects.create(usuario=User.objects.get(username="ana"), total=Decimal("20000"))
+        DetalleFactura.objects.create(
+            factura=factura, producto=self.producto, cantidad=1, subtotal=Decimal("20000"), talla="U", color="Azul",
+        )
+        self.ana.get(url, {"status": "APPROVED", "reference": factura.id})
+        factura.refresh_from_db()
+        self.assertEqual((factura.estado_pago, self._stock()), ("Pagado", 0))
+
+
+class CatalogoTest(TestCase):
+    def test_reimportar_producto_sin_matriz_no_crea_variante(self):
+        categoria = Category.objects.create(name="Gorras", slug="gorras")
+        sin_matriz = Product.objects.create(name="Gorra", slug="gorra", cost=Decimal("20000"), category=categoria)
+        Product.objects.filter(pk=sin_matriz.pk).update(stock=7)
+        con_matriz = Product.objects.create(name="Buzo", slug="buzo", cost=Decimal("90000"), category=categoria)
+        ProductVariant.objects.create(product=con_matriz, talla="M", color="Gris", stock=4)
+
+        filas = list(filas_catalogo())
+        Product.objects.filter(pk=sin_matriz.pk).update(stock=0)
+        resumen = importar(enumerate(filas, start=1))
+
+        self.assertEqual(resumen.rechazadas, [])
+        self.assertFalse(ProductVariant.objects.filter(product=sin_matriz).exists())
+        self.assertEqual(Product.objects.get(pk=sin_matriz.pk).stock, 7)
+        self.assertEqual(Product.objects.get(pk=con_matriz.pk).stock, 4)
+
+
+class ColaImagenesTest(TestCase):
+    def test_tarea_fallida_queda_en_cola_hasta_agotar_intentos(self):
+        TareaImagen.objects.create(modelo="store.product", objeto_id=999999, campo="image")  # objeto borrado
+        TareaImagen.objects.create(modelo="store.inexistente", objeto_id=1, campo="image")
+
+        with self.assertLogs("store.utils.imagenes", "ERROR"):
+            self.assertEqual(procesar_pendientes(), (2, 0, 1))
+        tarea = TareaImagen.objects.get()
+        self.assertEqual((tarea.modelo, tarea.intentos), ("store.inexistente", 1))
+
+        with self.assertLogs("store.utils.imagenes", "ERROR"):
+            for _ in range(MAX_INTENTOS - 1):
+                procesar_pendientes()
+        self.assertFalse(TareaImagen.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CarritoTest(TestCase):
+    def setUp(self):
+        cache.clear()  # la caché del carrito va por id de usuario y los ids se reutilizan entre tests
+        categoria = Category.objects.create(name="Medias", slug="medias")
+        self.producto = Product.objects.create(
+            name="Medias", slug="medias", description="x", cost=Decimal("10000"), category=categoria,
+        )
+        self.variante = ProductVariant.objects.create(product=self.producto, talla="M", color="Negro", stock=5)
+        self.user = User.objects.create_user(
+            name="Ana", lastname="Prueba", username="ana", email="ana@test.com", password="12345",
+        )
+        self.url_agregar = reverse("store:agregar_al_carrito", args=[self.producto.id])
+        self.datos = {"talla": "M", "color": "Negro"}
+        self.key = f"{self.producto.id}|M|Negro"
+
+    def _unidades(self, cliente):
+        return cliente.get(reverse("store:carrito_json"), {"resumen": 1}).json()["cart_count"]
+
+    def _api(self, cliente, datos):
+        return cliente.post(reverse("store:carrito_api"), json.dumps(datos), content_type="application/json")
+
+    def test_fusion_al_iniciar_sesion(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, self.datos)
+        cliente.logout()
+
+        for _ in range(2):  # como visitante
+            cliente.post(self.url_agregar, self.datos)
+        cliente.force_login(self.user)
+
+        self.assertEqual(self._unidades(cliente), 3)
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(CartLine.objects.get().cantidad, 3)
+
+    def test_importa_carrito_viejo_de_sesion_una_vez(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        sesion = cliente.session
+        sesion["carrito"] = {
+            "a": {"producto_id": self.producto.id, "talla": "M", "color": "Negro", "cantidad": 2, "precio": 10000.0},
+            "b": {"producto_id": 999999, "talla": "", "color": "", "cantidad": 1, "precio": 1.0},  # ya no existe
+        }
+        sesion.save()
+
+        self.assertEqual(self._unidades(cliente), 2)
+        self.assertNotIn("carrito", cliente.session)
+        self.assertEqual(self._unidades(cliente), 2)
+        self.assertEqual(CartLine.objects.get().cantidad, 2)
+
+    @override_settings(CARRITO_EN_CACHE=True)
+    def test_escrituras_borran_la_cache(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, self.datos)
+        self.assertEqual(self._unidades(cliente), 1)  # queda en caché
+        cliente.post(self.url_agregar, self.datos)
+        self.assertEqual(self._unidades(cliente), 2)
+        self._api(cliente, {"op": "cantidad", "item_key": self.key, "cantidad": 4})
+        self.assertEqual(self._unidades(cliente), 4)
+        cliente.post(reverse("store:vaciar_carrito"))
+        self.assertEqual(self._unidades(cliente), 0)
+
+    @override_settings(CARRITO_EN_CACHE=True)
+    def test_factura_lee_la_base_y_no_la_cache(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, self.datos)
+        self.assertEqual(self._unidades(cliente), 1)
+        # Otro worker cambió la línea: su escritura no borró esta copia en caché
+        CartLine.objects.update(cantidad=3)
+        self.assertEqual(self._unidades(cliente), 1)
+
+        cliente.post(reverse("store:generar_factura"), {"nombre": "Ana", "direccion": "Calle 1"})
+        self.assertEqual(DetalleFactura.objects.get().cantidad, 3)
+
+    def test_sin_cache_compartida_lee_siempre_la_base(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, self.datos)
+        self.assertEqual(self._unidades(cliente), 1)
+        CartLine.objects.update(cantidad=3)
+        self.assertEqual(self._unidades(cliente), 3)
+
+    def test_linea_creada_en_paralelo_se_suma(self):
+        cart = Cart.objects.create(usuario=self.user)
+        CartLine.objects.create(cart=cart, product=self.producto, talla="M", color="Negro", cantidad=1, precio=1)
+        update, llamadas = QuerySet.update, []
+
+        def update_que_no_ve_la_linea(qs, **kwargs):
+            # El primer UPDATE corre "antes" de que la otra petición cree la línea
+            llamadas.append(kwargs)
+            return 0 if len(llamadas) == 1 else update(qs, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", update_que_no_ve_la_linea):
+            carrito_db._sumar_linea(cart, self.producto.id, "M", "Negro", 2, Decimal("10000"), "")
+        self.assertEqual(CartLine.objects.get().cantidad, 3)
+
+    def test_cambio_de_precio_reprecia_y_vuelve_al_checkout(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        for _ in range(2):
+            cliente.post(self.url_agregar, self.datos)
+
+        producto = Product.objects.get()
+        producto.discount = 20
+        producto.save()
+        datos_envio = {"nombre": "Ana", "telefono": "3000000000", "direccion": "Calle 1",
+                       "ciudad": "Medellín", "departamento": "Antioquia"}
+
+        response = cliente.post(reverse("store:generar_factura"), datos_envio)
+        self.assertRedirects(response, reverse("store:checkout"), fetch_redirect_response=False)
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)],
+            ["El precio de Medias cambió de $10.000 a $8.000."],
+        )
+        self.assertFalse(Factura.objects.exists())
+        linea = CartLine.objects.get()
+        self.assertEqual((linea.precio, linea.precio_version), (Decimal("8000"), producto.precio_version))
+
+        # Ya con el precio nuevo la factura sale por el total que mostró el checkout
+        self.assertEqual(cliente.get(reverse("store:checkout")).context["total"], Decimal("16000"))
+        self.assertEqual(cliente.post(reverse("store:generar_factura"), datos_envio).status_code, 200)
+        self.assertEqual(Factura.objects.get().total, Decimal("16000"))
+
+    def test_carrito_json_revalida_con_etag(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, self.datos)
+        url = reverse("store:carrito_json")
+
+        response = cliente.get(url, {"resumen": 1})
+        etag = response["ETag"]
+        self.assertEqual(response.json(), {"total_carrito": "10.000", "cart_count": 1, "status": "ok"})
+        self.assertEqual(cliente.get(url, {"resumen": 1}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(cliente.get(url)["ETag"], etag)  # el carrito completo tiene su propio ETag
+
+        # Cualquier escritura cambia la versión del carrito
+        self._api(cliente, {"op": "cantidad", "item_key": self.key, "cantidad": 2})
+        response = cliente.get(url, {"resumen": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cart_count"], 2)
+
+    def test_fusion_al_login_cambia_el_etag_del_carrito(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, self.datos)
+        cliente.logout()
+        cliente.post(self.url_agregar, self.datos)  # como visitante
+        url = reverse("store:carrito_json")
+        etag = cliente.get(url, {"resumen": 1})["ETag"]
+
+        cliente.force_login(self.user)
+        response = cliente.get(url, {"resumen": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cart_count"], 2)
+
+    def test_api_aplica_lote_y_responde_solo_lo_tocado(self):
+        otra = ProductVariant.objects.create(product=self.producto, talla="L", color="Negro", stock=0)
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, {"talla": "S", "color": "Blanco"})  # sin variante: no se toca
+
+        datos = self._api(cliente, {"ops": [
+            {"op": "agregar", "producto_id": self.producto.id, "talla": "M", "color": "Negro", "cantidad": 9},
+            {"op": "agregar", "producto_id": self.producto.id, "talla": otra.talla, "color": otra.color},
+            {"op": "eliminar", "item_key": f"{self.producto.id}|S|Blanco"},
+            {"op": "volar"},
+        ]}).json()
+
+        self.assertEqual(set(datos["lineas"]), {self.key, f"{self.producto.id}|L|Negro", f"{self.producto.id}|S|Blanco"})
+        self.assertEqual(datos["lineas"][self.key]["cantidad"], 5)  # ajustada al stock
+        self.assertEqual(datos["lineas"][self.key]["subtotal"], "50000.00")
+        self.assertIsNone(datos["lineas"][f"{self.producto.id}|L|Negro"])  # nueva y agotada: descartada
+        self.assertIsNone(datos["lineas"][f"{self.producto.id}|S|Blanco"])  # eliminada
+        self.assertEqual(datos["totales"]["unidades"], 5)
+        self.assertTrue(datos["totales"]["valido"])
+        self.assertEqual(len(datos["avisos"]), 3)
+
+    def test_api_no_sube_una_linea_agotada(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        cliente.post(self.url_agregar, self.datos)
+        ProductVariant.objects.filter(pk=self.variante.pk).update(stock=0)
+
+        datos = self._api(cliente, {"op": "cantidad", "item_key": self.key, "cantidad": 3}).json()
+        self.assertEqual(datos["lineas"][self.key]["cantidad"], 1)
+        self.assertFalse(datos["lineas"][self.key]["disponible"])
+        self.assertEqual(CartLine.objects.get().cantidad, 1)
+
+    def test_api_limites(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        url = reverse("store:carrito_api")
+        self.assertEqual(cliente.post(url, "no es json", content_type="application/json").status_code, 400)
+        self.assertEqual(self._api(cliente, {"ops": []}).status_code, 400)
+        demasiadas = [{"op": "vaciar"}] * (carrito_db.MAX_OPERACIONES + 1)
+        self.assertEqual(self._api(cliente, {"ops": demasiadas}).status_code, 400)
+        self.assertEqual(cliente.get(url).status_code, 405)
+
+    def test_api_recorta_cantidades_enormes_antes_de_escribir(self):
+        cliente = Client()
+        cliente.force_login(self.user)
+        enorme = 10 ** 10  # no cabe en el integer de Postgres
+        with mock.patch.object(carrito_db, "agregar", wraps=carrito_db.agregar) as agregar:
+            response = self._api(cliente, {"op": "agregar", "producto_id": self.producto.id,
+                                           "talla": "M", "color": "Negro", "cantidad": enorme})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(agregar.call_args.args[-1], carrito_db.MAX_CANTIDAD)
+        self.assertEqual(CartLine.objects.get().cantidad, 5)  # después manda el stock
+
+        with mock.patch.object(carrito_db, "cambiar_cantidad", wraps=carrito_db.cambiar_cantidad) as cambiar:
+            self._api(cliente, {"op": "cantidad", "item_key": self.key, "cantidad": enorme})
+        self.assertEqual(cambiar.call_args_list[0].args[-1], carrito_db.MAX_CANTIDAD)
+        self.assertEqual(CartLine.objects.get().cantidad, 5)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SesionesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            name="Sofi", lastname="Prueba", username="sofi", email="sofi@test.com", password="12345",
+        )
+        self.client.force_login(self.user)
+        self.url = reverse("store:mis_facturas")  # solo lee la sesión (usuario autenticado)
+
+    def _fila(self):
+        return Session.objects.values_list("session_data", "expire_date").get(
+            session_key=self.client.session.session_key
+        )
+
+    def test_peticion_de_solo_lectura_no_escribe_la_sesion(self):
+        antes = self._fila()
+        with mock.patch.object(SessionStore, "save", autospec=True, side_effect=SessionStore.save) as guardar:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        guardar.assert_not_called()
+        self.assertEqual(self._fila(), antes)
+
+    def test_renovada_vieja_guarda_una_vez_y_extiende_la_expiracion(self):
+        sesion = self.client.session
+        sesion.save()  # deja _renovada con la hora actual...
+        Session.objects.filter(session_key=sesion.session_key).update(
+            session_data=SessionStore().encode({**sesion._session, CLAVE_RENOVADA: 0}),  # ...y la envejece
+            expire_date=timezone.now() + timedelta(hours=1),
+        )
+        with mock.patch.object(SessionStore, "save", autospec=True, side_effect=SessionStore.save) as guardar:
+            self.client.get(self.url)
+            self.client.get(self.url)  # ya renovada: no vuelve a escribir
+        self.assertEqual(guardar.call_count, 1)
+        _, expira = self._fila()
+        self.assertGreater(expira, timezone.now() + timedelta(hours=23))
+
+    def test_limpiar_sesiones_borra_vencidas_por_lotes(self):
+        vencida = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([
+            Session(session_key=f"vieja{n}", session_data="", expire_date=vencida) for n in range(5)
+        ])
+        salida = StringIO()
+        with CaptureQueriesContext(connection) as consultas:
+            call_command("limpiar_sesiones", lote=2, stdout=salida)
+        borrados = [c for c in consultas.captured_queries if c["sql"].startswith("DELETE")]
+        self.assertEqual(len(borrados), 3)  # 2 + 2 + 1
+        self.assertIn("5 sesión(es)", salida.getvalue())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), [self.client.session.session_key])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FragmentosTest(TestCase):
+    def setUp(self):
+        cache.clear()  # fragmentos y versiones por producto viven en la caché
+        categoria = Category.objects.create(name="Buzos", slug="buzos")
+        self.producto = Product.objects.create(
+            name="Buzo", slug="buzo", description="x", cost=Decimal("50000"), category=categoria,
+            image="products/buzo.jpg", is_available=True,
+        )
+        self.variante = ProductVariant.objects.create(product=self.producto, talla="L", color="Gris", stock=4)
+        self.urls = [
+            reverse("store:vista_rapida", args=[self.producto.id]),
+            reverse("store:carrito_modal", args=[self.producto.id]),
+        ]
+
+    def test_visitante_recibe_fragmento_sin_token_y_con_cookie_csrf(self):
+        for url in self.urls:
+            response = Client().get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, "csrfmiddlewaretoken")
+            self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+    def test_etag_revalida_y_cambia_con_variantes_y_stock(self):
+        for talla_nueva, url in zip(("M", "S"), self.urls):
+            etag = self.client.get(url)["ETag"]
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+            self.variante.stock -= 1
+            self.variante.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+            etag = response["ETag"]
+            ProductVariant.objects.create(product=self.producto, talla=talla_nueva, color="Gris", stock=2)
+            self.assertNotEqual(self.client.get(url)["ETag"], etag)
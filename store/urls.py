@@ -18,11 +18,14 @@ urlpatterns = [
     path('carrito/eliminar/<str:item_key>/', views.eliminar_del_carrito, name='eliminar_del_carrito'),
     path('carrito/actualizar/<str:item_key>/', views.actualizar_cantidad, name='actualizar_cantidad'),
     path('carrito-json/', views.obtener_carrito_json, name='carrito_json'),
+    path('carrito/api/', views.carrito_api, name='carrito_api'),
     path('carrito-modal/<int:product_id>/', views.carrito_modal, name='carrito_modal'),
 
     # 💳 Proceso de Pago (Checkout)
     # Si te da 404, asegúrate de que el enlace en el HTML sea {% url 'store:checkout' %}
-    path('checkout/', views.checkout, name='checkout'), 
+    path('checkout/', views.checkout, name='checkout'),
+    path('fila-flash/<int:product_id>/', views.fila_flash, name='fila_flash'), 
+    path('checkout/cupon/', views.aplicar_cupon, name='aplicar_cupon'),
     path('pago-banco/', views.pago_banco_widget, name='pago_banco_widget'),
     path('simular-pago-banco/', views.simular_pago_banco, name='simular_pago_banco'),
     path('confirmacion-pago/', views.confirmacion_pago, name='confirmacion_pago'),
@@ -37,5 +40,10 @@ urlpatterns = [
     # 👤 Información y Cuentas
     path('nosotros/', views.nosotros, name='nosotros'),
     path('contacto/', views.contacto, name='contacto'),
+
+    # ⏱️ Métricas y exportaciones internas (solo staff)
+    path('metricas/consultas/', views.metricas_consultas, name='metricas_consultas'),
+    path('metricas/', views.metricas_prometheus, name='metricas_prometheus'),
+    path('exportar/<str:tipo>/', views.exportar_datos, name='exportar_datos'),
     path('pedidos/', include('pedidos.urls')), # Verifica que pedidos.urls no tenga rutas que choquen
 ]
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Versión del catálogo para invalidar cachés derivadas de productos.
+
+Las claves de caché incluyen ``version_catalogo()``; al editar un producto o
+una categoría (señales en store/signals.py) se incrementa la versión y las
+claves viejas dejan de leerse (expiran solas por TTL).
+
+Los fragmentos de un producto (vista rápida, carrito modal) llevan además
+``version_producto``. Los cambios que solo tocan ese producto (stock de cada
+venta, variantes, imágenes de la galería) suben solo esa versión: un pedido
+no vacía las páginas ni los fragmentos del resto del catálogo.
+"""
+import time
+
+from django.core.cache import cache
+
+CLAVE_VERSION = "catalogo:version"
+FRAGMENTOS_TTL = 60 * 60
+
+
+def version_catalogo():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Valor inicial basado en el reloj: tras vaciar la caché no se reutiliza
+        # una versión vieja cuyas entradas pudieran seguir vivas en otro nodo.
+        cache.add(CLAVE_VERSION, int(time.time()), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_catalogo():
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, int(time.time()), timeout=None)
+
+
+def _clave_producto(product_id):
+    return f"catalogo:producto:{int(product_id)}"
+
+
+def _versiones(product_id):
+    """(versión del catálogo, versión del producto) en un solo viaje a la caché."""
+    clave = _clave_producto(product_id)
+    valores = cache.get_many([CLAVE_VERSION, clave])
+    if clave not in valores:
+        cache.add(clave, int(time.time()), timeout=FRAGMENTOS_TTL * 24)
+        valores[clave] = cache.get(clave)
+    catalogo = valores[CLAVE_VERSION] if CLAVE_VERSION in valores else version_catalogo()
+    return catalogo, valores[clave]
+
+
+def invalidar_producto(*product_ids):
+    """Cambio que solo afecta a estos productos (stock, variantes, galería)."""
+    for pid in product_ids:
+        try:
+            cache.incr(_clave_producto(pid))
+        except ValueError:
+            cache.set(_clave_producto(pid), int(time.time()), timeout=FRAGMENTOS_TTL * 24)
+
+
+def etag_fragmento(nombre, product_id):
+    """ETag de un fragmento de producto: cambia con el catálogo o con el producto."""
+    catalogo, producto = _versiones(product_id)
+    return f'"{nombre}-{catalogo}-{producto}-{int(product_id)}"'
+
+
+def fragmento_producto(nombre, product_id, renderizar):
+    """
+    HTML prerenderizado de un modal de producto (vista rápida, carrito modal).
+    ``renderizar`` se llama solo si no está en caché; debe ser independiente
+    del usuario (sin csrf_token ni context processors).
+    """
+    catalogo, producto = _versiones(product_id)
+    clave = f"fragmento:{nombre}:{catalogo}:{producto}:{int(product_id)}"
+    html = cache.get(clave)
+    if html is None:
+        html = renderizar()
+        cache.set(clave, html, FRAGMENTOS_TTL)
+    return html
@@ -0,0 +1,314 @@
+"""
+Importación masiva del catálogo (JSON Lines o CSV) con upserts por slug.
+
+Formato de cada fila (las mismas columnas usa la exportación):
+
+    slug, name, description, cost, discount, category, category_name,
+    is_available, destacado, nuevo, talla, color,
+    variante_talla, variante_color, stock, product_stock
+
+Cada fila es el registro completo del producto: los campos ausentes quedan
+vacíos/por defecto al actualizar. Una fila con ``stock`` pero sin talla/color
+crea la variante única ("", ""), igual que la acción del admin.
+``product_stock`` es el stock de un producto SIN matriz de variantes (así lo
+exporta exportar_catalogo): se guarda en el producto y no crea variante.
+
+En JSON Lines una fila puede traer además ``"variantes": [{"talla", "color",
+"stock"}, ...]``. En CSV cada fila aporta como mucho una variante; varias filas
+con el mismo slug se combinan.
+
+Se procesa por lotes de tamaño fijo (memoria constante): validar → categorías
+→ productos → variantes, cada uno con un bulk_create(update_conflicts=True).
+No se llama Product.save() ni se disparan señales; el stock total de los
+productos tocados se recalcula una sola vez al final con un UPDATE.
+"""
+import csv
+import json
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from store.models import Category, Product, ProductVariant
+from store.utils.cache import invalidar_catalogo
+from store.utils.variantes import invalidar_matriz_stock
+
+COLUMNAS = [
+    "slug", "name", "description", "cost", "discount", "category", "category_name",
+    "is_available", "destacado", "nuevo", "talla", "color",
+    "variante_talla", "variante_color", "stock", "product_stock",
+]
+CAMPOS_PRODUCTO = [
+    "name", "description", "cost", "discount", "category", "is_available",
+    "destacado", "nuevo", "talla", "color",
+]
+
+_SLUG = re.compile(r"^[-a-zA-Z0-9_]+$")
+_VERDADERO = {"1", "true", "si", "sí", "yes", "y", "x"}
+
+
+class FilaInvalida(ValueError):
+    pass
+
+
+@dataclass
+class ResumenImportacion:
+    filas: int = 0
+    categorias_creadas: int = 0
+    productos_insertados: int = 0
+    productos_actualizados: int = 0
+    variantes_insertadas: int = 0
+    variantes_actualizadas: int = 0
+    rechazadas: list = field(default_factory=list)  # [(linea, motivo)]
+
+
+# ============================================================
+# 📥 Lectura en streaming
+# ============================================================
+def leer_filas(archivo, formato):
+    """Genera (numero_linea, dict) sin cargar el archivo completo."""
+    if formato == "csv":
+        for n, fila in enumerate(csv.DictReader(archivo), start=2):
+            yield n, fila
+        return
+    for n, linea in enumerate(archivo, start=1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield n, json.loads(linea)
+        except json.JSONDecodeError as e:
+            yield n, FilaInvalida(f"JSON inválido: {e}")
+
+
+# ============================================================
+# ✅ Validación
+# ============================================================
+def _texto(fila, clave, maximo=None, requerido=False):
+    valor = fila.get(clave)
+    valor = "" if valor is None else str(valor).strip()
+    if requerido and not valor:
+        raise FilaInvalida(f"'{clave}' es obligatorio")
+    if maximo and len(valor) > maximo:
+        raise FilaInvalida(f"'{clave}' supera {maximo} caracteres")
+    return valor
+
+
+def _booleano(fila, clave, defecto):
+    valor = fila.get(clave)
+    if valor is None or valor == "":
+        return defecto
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() in _VERDADERO
+
+
+def _entero(valor, clave, minimo=0, maximo=None):
+    try:
+        numero = int(str(valor).strip())
+    except (TypeError, ValueError):
+        raise FilaInvalida(f"'{clave}' debe ser un entero")
+    if numero < minimo or (maximo is not None and numero > maximo):
+        raise FilaInvalida(f"'{clave}' fuera de rango")
+    return numero
+
+
+def validar_fila(fila):
+    """Normaliza una fila o lanza FilaInvalida con el motivo."""
+    if isinstance(fila, Exception):
+        raise fila
+    slug = _texto(fila, "slug", 100, requerido=True)
+    if not _SLUG.match(slug):
+        raise FilaInvalida("'slug' solo admite letras, números, guiones y guion bajo")
+
+    try:
+        costo = Decimal(str(fila.get("cost", "")).strip())
+    except InvalidOperation:
+        raise FilaInvalida("'cost' no es un número")
+    if costo < 0 or costo >= Decimal("100000000"):
+        raise FilaInvalida("'cost' fuera de rango")
+
+    categoria = _texto(fila, "category", 140, requerido=True)
+    if not _SLUG.match(categoria):
+        raise FilaInvalida("'category' debe ser el slug de la categoría")
+
+    variantes = []
+    for v in fila.get("variantes") or []:
+        variantes.append((
+            _texto(v, "talla", 50), _texto(v, "color", 50),
+            _entero(v.get("stock", 0), "stock"),
+        ))
+    if fila.get("variante_talla") or fila.get("variante_color") or fila.get("stock") not in (None, ""):
+        variantes.append((
+            _texto(fila, "variante_talla", 50), _texto(fila, "variante_color", 50),
+            _entero(fila.get("stock", 0), "stock"),
+        ))
+
+    return {
+        "slug": slug,
+        "name": _texto(fila, "name", 50, requerido=True),
+        "description": _texto(fila, "description"),
+        "cost": costo.quantize(Decimal("0.01")),
+        "discount": _entero(fila.get("discount") or 0, "discount", 0, 100),
+        "category": categoria,
+        "category_name": _texto(fila, "category_name", 120) or categoria.replace("-", " ").title(),
+        "is_available": _booleano(fila, "is_available", True),
+        "destacado": _booleano(fila, "destacado", False),
+        "nuevo": _booleano(fila, "nuevo", False),
+        "talla": _texto(fila, "talla", 200),
+        "color": _texto(fila, "color", 200),
+        "variantes": variantes,
+        "stock_general": (
+            None if variantes or fila.get("product_stock") in (None, "")
+            else _entero(fila.get("product_stock"), "product_stock")
+        ),
+    }
+
+
+# ============================================================
+# 🔁 Upsert por lotes
+# ============================================================
+def importar(filas, lote=1000, resumen=None):
+    """
+    Importa un iterable de (numero_linea, fila). Devuelve ResumenImportacion.
+    Cada lote va en su propia transacción; un lote con error de base de datos
+    no deshace los anteriores.
+    """
+    resumen = resumen or ResumenImportacion()
+    tocados = set()  # ids de productos con variantes importadas
+    pendientes = []
+    for numero, fila in filas:
+        resumen.filas += 1
+        try:
+            pendientes.append((numero, validar_fila(fila)))
+        except FilaInvalida as e:
+            resumen.rechazadas.append((numero, str(e)))
+        if len(pendientes) >= lote:
+            _procesar_lote(pendientes, resumen, tocados)
+            pendientes = []
+    if pendientes:
+        _procesar_lote(pendientes, resumen, tocados)
+
+    recalcular_stock(tocados)
+    invalidar_catalogo()  # bulk_create no dispara señales
+    invalidar_matriz_stock(*tocados)
+    return resumen
+
+
+def _procesar_lote(pendientes, resumen, tocados):
+    # Varias filas con el mismo slug se combinan: gana la última, variantes se acumulan
+    por_slug = {}
+    for numero, datos in pendientes:
+        previo = por_slug.get(datos["slug"])
+        if previo:
+            datos["variantes"] = previo[1]["variantes"] + datos["variantes"]
+            if datos["variantes"]:
+                datos["stock_general"] = None
+        por_slug[datos["slug"]] = (numero, datos)
+
+    # Nombre único: rechazamos filas cuyo nombre ya usa OTRO slug (aquí o en la DB)
+    nombres = {}
+    for slug, (numero, datos) in list(por_slug.items()):
+        if datos["name"] in nombres:
+            resumen.rechazadas.append((numero, f"nombre repetido con el slug '{nombres[datos['name']]}'"))
+            del por_slug[slug]
+        else:
+            nombres[datos["name"]] = slug
+    en_uso = dict(
+        Product.objects.filter(name__in=list(nombres)).exclude(slug__in=list(por_slug))
+        .values_list("name", "slug")
+    )
+    for nombre, otro_slug in en_uso.items():
+        numero, _ = por_slug.pop(nombres[nombre])
+        resumen.rechazadas.append((numero, f"el nombre ya pertenece al producto '{otro_slug}'"))
+    if not por_slug:
+        return
+
+    with transaction.atomic():
+        # 1. Categorías faltantes
+        slugs_cat = {d["category"]: d["category_name"] for _, d in por_slug.values()}
+        categorias = dict(Category.objects.filter(slug__in=list(slugs_cat)).values_list("slug", "id"))
+        nuevas = [Category(slug=s, name=n) for s, n in slugs_cat.items() if s not in categorias]
+        if nuevas:
+            Category.objects.bulk_create(nuevas, ignore_conflicts=True)
+            categorias = dict(Category.objects.filter(slug__in=list(slugs_cat)).values_list("slug", "id"))
+            resumen.categorias_creadas += len(nuevas)
+
+        # 2. Productos (upsert por slug)
+        existentes = {
+            slug: (cost, discount)
+            for slug, cost, discount in Product.objects.filter(slug__in=list(por_slug)).values_list("slug", "cost", "discount")
+        }
+        productos = []
+        for slug, (numero, d) in por_slug.items():
+            if d["category"] not in categorias:
+                resumen.rechazadas.append((numero, f"no se pudo crear la categoría '{d['category']}'"))
+                continue
+            productos.append(Product(
+                slug=slug, name=d["name"], description=d["description"], cost=d["cost"],
+                discount=d["discount"], category_id=categorias[d["category"]],
+                is_available=d["is_available"], destacado=d["destacado"], nuevo=d["nuevo"],
+                talla=d["talla"], color=d["color"],
+            ))
+        Product.objects.bulk_create(
+            productos,
+            update_conflicts=True,
+            unique_fields=["slug"],
+            update_fields=CAMPOS_PRODUCTO,
+        )
+        for p in productos:
+            if p.slug in existentes:
+                resumen.productos_actualizados += 1
+            else:
+                resumen.productos_insertados += 1
+        # bulk_create no pasa por Product.save(): la versión de precio se sube aquí
+        cambiaron_precio = [p.slug for p in productos if existentes.get(p.slug, (p.cost, p.discount)) != (p.cost, p.discount)]
+        if cambiaron_precio:
+            Product.objects.filter(slug__in=cambiaron_precio).update(precio_version=F("precio_version") + 1)
+
+        ids = dict(Product.objects.filter(slug__in=[p.slug for p in productos]).values_list("slug", "id"))
+
+        # Stock de productos sin matriz: va en el producto (un UPDATE por valor distinto).
+        # Si el producto ya tiene variantes en la base, manda la suma de ellas.
+        por_stock = {}
+        for p in productos:
+            stock = por_slug[p.slug][1]["stock_general"]
+            if stock is not None:
+                por_stock.setdefault(stock, []).append(ids[p.slug])
+        for stock, pids in por_stock.items():
+            Product.objects.filter(id__in=pids, variants_stock__isnull=True).update(stock=stock)
+
+        # 3. Variantes (upsert por producto+talla+color)
+        variantes = {}
+        for p in productos:
+            for talla, color, stock in por_slug[p.slug][1]["variantes"]:
+                variantes[(ids[p.slug], talla, color)] = stock
+        if variantes:
+            previas = set(
+                ProductVariant.objects.filter(product_id__in=[k[0] for k in variantes])
+                .values_list("product_id", "talla", "color")
+            )
+            ProductVariant.objects.bulk_create(
+                [ProductVariant(product_id=pid, talla=t, color=c, stock=s) for (pid, t, c), s in variantes.items()],
+                update_conflicts=True,
+                unique_fields=["product", "talla", "color"],
+                update_fields=["stock"],
+            )
+            actualizadas = sum(1 for k in variantes if k in previas)
+            resumen.variantes_actualizadas += actualizadas
+            resumen.variantes_insertadas += len(variantes) - actualizadas
+            tocados.update(k[0] for k in variantes)
+
+
+def recalcular_stock(product_ids, lote=5000):
+    """Stock total = suma de variantes, en un UPDATE por cada lote de productos."""
+    ids = list(product_ids)
+    suma = (
+        ProductVariant.objects.filter(product=OuterRef("pk"))
+        .values("product").annotate(total=Sum("stock")).values("total")
+    )
+    for i in range(0, len(ids), lote):
+        Product.objects.filter(id__in=ids[i:i + lote]).update(stock=Coalesce(Subquery(suma), 0))
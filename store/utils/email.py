@@ -1,9 +1,14 @@
+import time
+
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
+from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.timezone import localtime
 from decouple import config
 
+from store.metricas import ENVIO_CORREO
+
 # ============================================================
 # 📧 Enviar correo simple (texto plano)
 # ============================================================
@@ -14,6 +19,11 @@ def enviar_correo(destinatario, asunto, mensaje):
     - asunto: título del correo
     - mensaje: contenido en texto plano
     """
+    if getattr(settings, "CORREO_SIMULADO", False):
+        ENVIO_CORREO.labels(tipo="simple", resultado="simulado").observe(0)
+        print(f"✉️ (simulado) Correo para {destinatario}: {asunto}")
+        return 202
+
     sg = SendGridAPIClient(api_key=config("SENDGRID_API_KEY"))
     email = Mail(
         from_email=config("DEFAULT_FROM_EMAIL"),
@@ -21,11 +31,14 @@ def enviar_correo(destinatario, asunto, mensaje):
         subject=asunto,
         plain_text_content=mensaje
     )
+    inicio = time.perf_counter()
     try:
         response = sg.send(email)
+        ENVIO_CORREO.labels(tipo="simple", resultado="ok").observe(time.perf_counter() - inicio)
         print("✅ Correo enviado:", response.status_code)
         return response.status_code
     except Exception as e:
+        ENVIO_CORREO.labels(tipo="simple", resultado="error").observe(time.perf_counter() - inicio)
         print("❌ Error al enviar correo:", e)
         return None
 
@@ -54,6 +67,11 @@ def enviar_factura(factura, contexto=None):
         **(contexto or {})
     })
 
+    if getattr(settings, "CORREO_SIMULADO", False):
+        ENVIO_CORREO.labels(tipo="factura", resultado="simulado").observe(0)
+        print(f"✉️ (simulado) Factura #{factura.id} para {factura.usuario.email}")
+        return 202
+
     message = Mail(
         from_email=config("DEFAULT_FROM_EMAIL"),
         to_emails=factura.usuario.email,
@@ -62,11 +80,14 @@ def enviar_factura(factura, contexto=None):
         html_content=html_content
     )
 
+    inicio = time.perf_counter()
     try:
         sg = SendGridAPIClient(config("SENDGRID_API_KEY"))
         response = sg.send(message)
+        ENVIO_CORREO.labels(tipo="factura", resultado="ok").observe(time.perf_counter() - inicio)
         print(f"✅ Factura #{factura.id} enviada con estado {response.status_code}")
         return response.status_code
     except Exception as e:
+        ENVIO_CORREO.labels(tipo="factura", resultado="error").observe(time.perf_counter() - inicio)
         print("❌ Error al enviar factura:", e)
         return None
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Exportaciones en streaming del catálogo (stock) y de las ventas.
+
+Todo se recorre con ``.values(...).iterator(chunk_size=...)`` (cursor del lado
+del servidor en PostgreSQL) y se serializa fila por fila, así la memoria no
+crece con la cantidad de filas. El catálogo usa las mismas columnas que
+importar_catalogo, de modo que un archivo exportado se puede reimportar.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime, time
+
+from django.utils import timezone
+
+from store.models import DetalleFactura, Product, ProductVariant
+from store.utils.catalogo import COLUMNAS
+
+CHUNK = 2000
+
+COLUMNAS_VENTAS = [
+    "factura_id", "fecha", "usuario_email", "nombre", "ciudad", "metodo_pago",
+    "estado_pago", "estado_pedido", "total_factura", "producto_slug", "producto",
+    "categoria", "talla", "color", "cantidad", "subtotal",
+]
+
+
+# ============================================================
+# 📦 Catálogo
+# ============================================================
+def filas_catalogo(categoria=None):
+    """
+    Una fila por variante; los productos sin matriz salen con una fila sin
+    variante y su stock en ``product_stock`` (al reimportar no crean variante).
+    """
+    campos_producto = {
+        "slug": "product__slug", "name": "product__name", "description": "product__description",
+        "cost": "product__cost", "discount": "product__discount", "category": "product__category__slug",
+        "category_name": "product__category__name", "is_available": "product__is_available",
+        "destacado": "product__destacado", "nuevo": "product__nuevo",
+        "talla": "product__talla", "color": "product__color",
+        "variante_talla": "talla", "variante_color": "color", "stock": "stock",
+    }
+    variantes = ProductVariant.objects.order_by("product_id", "id")
+    if categoria:
+        variantes = variantes.filter(product__category__slug=categoria)
+    for fila in variantes.values(*campos_producto.values()).iterator(chunk_size=CHUNK):
+        datos = {col: fila[origen] for col, origen in campos_producto.items()}
+        datos["product_stock"] = ""
+        yield datos
+
+    sin_matriz = Product.objects.filter(variants_stock__isnull=True).order_by("id")
+    if categoria:
+        sin_matriz = sin_matriz.filter(category__slug=categoria)
+    campos = {
+        "slug": "slug", "name": "name", "description": "description", "cost": "cost",
+        "discount": "discount", "category": "category__slug", "category_name": "category__name",
+        "is_available": "is_available", "destacado": "destacado", "nuevo": "nuevo",
+        "talla": "talla", "color": "color", "product_stock": "stock",
+    }
+    for fila in sin_matriz.values(*campos.values()).iterator(chunk_size=CHUNK):
+        datos = {col: fila[origen] for col, origen in campos.items()}
+        datos["variante_talla"] = datos["variante_color"] = datos["stock"] = ""
+        yield datos
+
+
+# ============================================================
+# 🧾 Ventas
+# ============================================================
+def filas_ventas(desde=None, hasta=None, categoria=None):
+    """Una fila por DetalleFactura con los datos de su factura."""
+    campos = {
+        "factura_id": "factura_id", "fecha": "factura__fecha", "usuario_email": "factura__usuario__email",
+        "nombre": "factura__nombre", "ciudad": "factura__ciudad", "metodo_pago": "factura__metodo_pago",
+        "estado_pago": "factura__estado_pago", "estado_pedido": "factura__estado_pedido",
+        "total_factura": "factura__total", "producto_slug": "producto__slug", "producto": "producto__name",
+        "categoria": "producto__category__slug", "talla": "talla", "color": "color",
+        "cantidad": "cantidad", "subtotal": "subtotal",
+    }
+    detalles = DetalleFactura.objects.order_by("factura_id", "id")
+    if desde:
+        detalles = detalles.filter(factura__fecha__gte=_inicio_del_dia(desde))
+    if hasta:
+        detalles = detalles.filter(factura__fecha__lte=_fin_del_dia(hasta))
+    if categoria:
+        detalles = detalles.filter(producto__category__slug=categoria)
+    for fila in detalles.values(*campos.values()).iterator(chunk_size=CHUNK):
+        datos = {col: fila[origen] for col, origen in campos.items()}
+        datos["fecha"] = timezone.localtime(datos["fecha"]).isoformat()
+        yield datos
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def _fin_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.max))
+
+
+# ============================================================
+# 🔤 Serialización en streaming
+# ============================================================
+class _Eco:
+    """Buffer falso para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def serializar(filas, formato, columnas):
+    """Genera texto (CSV con encabezado o JSON Lines) fila por fila."""
+    if formato == "csv":
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(columnas)
+        for fila in filas:
+            yield escritor.writerow([fila.get(c, "") for c in columnas])
+    else:
+        for fila in filas:
+            yield json.dumps(fila, ensure_ascii=False, default=str) + "\n"
+
+
+def codificar(partes, comprimir=False):
+    """Pasa el texto a bytes UTF-8 y, si se pide, a gzip en streaming."""
+    if not comprimir:
+        for parte in partes:
+            yield parte.encode("utf-8")
+        return
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 → formato gzip
+    pendiente = []
+    tamano = 0
+    for parte in partes:
+        pendiente.append(parte.encode("utf-8"))
+        tamano += len(pendiente[-1])
+        # Agrupamos ~64 KB antes de comprimir para no emitir bloques diminutos
+        if tamano >= 65536:
+            bloque = gz.compress(b"".join(pendiente))
+            pendiente, tamano = [], 0
+            if bloque:
+                yield bloque
+    yield gz.compress(b"".join(pendiente)) + gz.flush()
+
+
+# Nombre → (generador de filas, columnas del CSV)
+EXPORTACIONES = {
+    "catalogo": (filas_catalogo, COLUMNAS),
+    "ventas": (filas_ventas, COLUMNAS_VENTAS),
+}
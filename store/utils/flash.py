@@ -0,0 +1,346 @@
+"""
+Ventas flash: stock en fichas y fila de admisión al checkout.
+
+Cuando sale una promoción todos los compradores pelean por la misma fila de
+ProductVariant en ``generar_factura`` y la base los atiende de a uno (además
+de agotar el pool de conexiones). Para los productos con VentaFlash vigente:
+
+1. **Fichas.** Al empezar la venta (``cargar_fichas``) el stock de cada
+   variante se reparte en ``fragmentos`` contadores de la caché. Comprar es un
+   ``decr`` atómico sobre un contador elegido al azar (si queda negativo se
+   devuelve y se prueba otro): nadie bloquea filas y el sobreventa es
+   imposible. ``manage.py venta_flash`` descuenta lo vendido de
+   ProductVariant.stock cada minuto y al cerrar la venta (un UPDATE por
+   variante en lugar de uno por compra). Se aplica la diferencia contra lo
+   cargado, no el valor absoluto, para no pisar reposiciones o ajustes del
+   admin hechos durante la venta. Mientras hay fichas cargadas, los demás
+   caminos de compra no tocan el stock de ese producto (``cargadas``).
+2. **Fila.** Entrar al checkout exige un cupo: hay ``cupo_checkout`` cupos
+   (claves con TTL, se liberan solos si el cliente se va) y quien llega pide
+   un turno numerado. Un turno se mantiene vivo mientras su página consulta
+   el estado; la posición es cuántos turnos vivos tiene delante. Así la base
+   ve como mucho ``cupo_checkout`` checkouts a la vez por producto.
+
+Todo usa operaciones atómicas del backend de caché (add/incr/decr/get_many)
+y exige una caché compartida (``FLASH_EN_CACHE``, es decir Redis): con
+LocMemCache cada worker cargaría sus propias fichas (se vendería el stock
+una vez por worker) y ``manage.py venta_flash`` no vería ninguna. Sin ella
+``ventas_activas`` y ``cargadas`` quedan vacías y todo se vende con el stock
+normal. Las claves ``flash:*`` no deben expulsarse por memoria
+(noeviction); vencen solas ``MARGEN_CIERRE`` después del fin de la venta.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from store.models import Product, ProductVariant, VentaFlash
+from store.utils.cache import invalidar_producto
+from store.utils.variantes import invalidar_matriz_stock
+
+CLAVE_ACTIVAS = "flash:activas"
+ACTIVAS_TTL = 60
+SESION = "flash"  # {"<product_id>": {"turno": n, "cupo": i | None}}
+VENTANA_MAX = 1000  # turnos que se revisan para calcular la posición
+MARGEN_CIERRE = 60 * 15  # vida de las fichas tras el fin: tiempo para que el scheduler las cierre
+
+
+def habilitada():
+    return getattr(settings, "FLASH_EN_CACHE", False)
+
+
+def _admision_ttl():
+    return getattr(settings, "FLASH_ADMISION_SEGUNDOS", 60 * 10)
+
+
+def _turno_ttl():
+    return getattr(settings, "FLASH_TURNO_SEGUNDOS", 30)
+
+
+# ============================================================
+# 📋 Ventas vigentes (caché corta; la señal la borra al editar)
+# ============================================================
+def ventas_activas():
+    """{product_id: {"cupo": n, "fragmentos": n}} de las ventas flash en curso."""
+    if not habilitada():
+        return {}
+    activas = cache.get(CLAVE_ACTIVAS)
+    if activas is None:
+        ahora = timezone.now()
+        activas = {
+            pid: {"cupo": cupo, "fragmentos": fragmentos}
+            for pid, cupo, fragmentos in VentaFlash.objects.filter(inicio__lte=ahora, fin__gt=ahora)
+            .values_list("product_id", "cupo_checkout", "fragmentos")
+        }
+        cache.set(CLAVE_ACTIVAS, activas, ACTIVAS_TTL)
+    return activas
+
+
+def invalidar_ventas():
+    cache.delete(CLAVE_ACTIVAS)
+
+
+# ============================================================
+# 🎟️ Fichas de stock (contadores repartidos)
+# ============================================================
+def _clave_fichas(product_id, clave, indice):
+    return f"flash:{product_id}:fichas:{clave}:{indice}"
+
+
+def _clave_indice(product_id):
+    return f"flash:{product_id}:variantes"
+
+
+def _llave_variante(talla, color):
+    return f"{(talla or '').strip().upper()}|{(color or '').strip().upper()}"
+
+
+def _ttl(venta):
+    """Segundos hasta un poco después del fin: un índice olvidado no deja el producto en fichas."""
+    return max(int((venta.fin - timezone.now()).total_seconds()) + MARGEN_CIERRE, 1)
+
+
+def cargar_fichas(venta):
+    """
+    Reparte el stock actual del producto en fichas. Sin matriz de variantes
+    se usa el stock general (clave "p"). El índice guarda cuánto se cargó
+    por variante para que ``conciliar`` aplique solo lo vendido. Devuelve las
+    unidades cargadas.
+    """
+    pid, n = venta.product_id, max(venta.fragmentos, 1)
+    variantes = list(ProductVariant.objects.filter(product_id=pid).order_by("id").values_list("id", "talla", "color", "stock"))
+    indice, valores, cargadas, total = {}, {}, {}, 0
+    if variantes:
+        for vid, talla, color, stock in variantes:
+            indice.setdefault(_llave_variante(talla, color), vid)
+        # Variantes repetidas (misma talla/color): manda la primera, como en variantes_por_clave
+        variantes = [v for v in variantes if indice[_llave_variante(v[1], v[2])] == v[0]]
+    else:
+        stock = Product.objects.filter(pk=pid).values_list("stock", flat=True).first() or 0
+        variantes = [("p", "", "", stock)]
+    for clave, _, _, stock in variantes:
+        base, resto = divmod(max(stock, 0), n)
+        for i in range(n):
+            valores[_clave_fichas(pid, clave, i)] = base + (1 if i < resto else 0)
+        cargadas[clave] = max(stock, 0)
+        total += max(stock, 0)
+    cache.set_many(valores, timeout=_ttl(venta))
+    cache.set(_clave_indice(pid), {"n": n, "variantes": indice, "cargadas": cargadas}, timeout=_ttl(venta))
+    return total
+
+
+def asegurar_fichas(product_id):
+    """Carga las fichas si la venta empezó y el comando programado aún no pasó."""
+    if not habilitada() or cache.get(_clave_indice(product_id)) is not None:
+        return
+    if cache.add(f"flash:{product_id}:cargando", 1, 30):  # solo un worker carga
+        venta = VentaFlash.objects.filter(product_id=product_id).first()
+        if venta:
+            cargar_fichas(venta)
+
+
+def cargada(product_id):
+    return habilitada() and cache.get(_clave_indice(product_id)) is not None
+
+
+def cargadas(product_ids):
+    """Los productos (de ``product_ids``) con fichas cargadas, en un solo get_many."""
+    if not habilitada():
+        return set()
+    llaves = {_clave_indice(pid): pid for pid in set(product_ids)}
+    return {llaves[llave] for llave in cache.get_many(list(llaves))}
+
+
+def _fichas_de(product_id, talla, color):
+    """(clave, n) de las fichas de una línea; None si la venta no está cargada."""
+    datos = cache.get(_clave_indice(product_id))
+    if datos is None:
+        return None
+    if not datos["variantes"]:
+        return "p", datos["n"]
+    vid = datos["variantes"].get(_llave_variante(talla, color))
+    return (vid, datos["n"]) if vid else None
+
+
+def restantes(product_id, talla, color):
+    fichas = _fichas_de(product_id, talla, color)
+    if fichas is None:
+        return 0
+    clave, n = fichas
+    return sum(cache.get_many([_clave_fichas(product_id, clave, i) for i in range(n)]).values())
+
+
+def _tomar_una(product_id, clave, n):
+    for i in random.sample(range(n), n):
+        llave = _clave_fichas(product_id, clave, i)
+        try:
+            if cache.decr(llave) >= 0:
+                return llave
+            cache.incr(llave)  # estaba vacío: se devuelve y se prueba otro
+        except ValueError:
+            continue
+    return None
+
+
+def reclamar(product_id, talla, color, cantidad):
+    """Toma ``cantidad`` fichas (todas o ninguna). Devuelve True si alcanzó."""
+    fichas = _fichas_de(product_id, talla, color)
+    if fichas is None:
+        return False
+    tomadas = []
+    for _ in range(cantidad):
+        llave = _tomar_una(product_id, *fichas)
+        if llave is None:
+            for devuelta in tomadas:
+                cache.incr(devuelta)
+            return False
+        tomadas.append(llave)
+    return True
+
+
+def devolver(product_id, talla, color, cantidad):
+    """Devuelve fichas (compra que falló después de reclamar)."""
+    fichas = _fichas_de(product_id, talla, color)
+    if fichas is None or cantidad <= 0:
+        return
+    clave, n = fichas
+    cache.incr(_clave_fichas(product_id, clave, random.randrange(n)), cantidad)
+
+
+def conciliar(venta, cerrar=False):
+    """
+    Descuenta de la base lo vendido desde la última conciliación (cargadas −
+    quedan; un UPDATE por variante que cambió) y deja ``quedan`` como nueva
+    referencia. Con ``cerrar`` además borra las claves de la venta.
+    """
+    pid = venta.product_id
+    if not cache.add(f"flash:{pid}:conciliando", 1, 60):  # dos pasadas a la vez descontarían doble
+        return 0
+    try:
+        datos = cache.get(_clave_indice(pid))
+        if datos is None:
+            return 0
+        n, cargadas = datos["n"], datos.setdefault("cargadas", {})
+        claves = list(datos["variantes"].values()) or ["p"]
+        llaves = [_clave_fichas(pid, clave, i) for clave in claves for i in range(n)]
+        valores = cache.get_many(llaves)
+        cambio = False
+        for clave in claves:
+            quedan = sum(valores.get(_clave_fichas(pid, clave, i), 0) for i in range(n))
+            vendidas = cargadas.get(clave, quedan) - quedan  # negativa si se devolvieron fichas
+            cargadas[clave] = quedan
+            if not vendidas:
+                continue
+            filas = Product.objects.filter(pk=pid) if clave == "p" else ProductVariant.objects.filter(pk=clave)
+            filas.update(stock=Greatest(F("stock") - vendidas, 0))
+            cambio = True
+        if cambio:
+            if datos["variantes"]:
+                venta.product.actualizar_stock_total()
+            # update() no dispara señales: matriz y fragmentos (vista rápida) a mano
+            invalidar_matriz_stock(pid)
+            invalidar_producto(pid)
+        if cerrar:
+            cache.delete_many(llaves + [_clave_indice(pid), _clave_turnos(pid), _clave_base(pid)])
+        else:
+            ttl = _ttl(venta)  # sigue al fin de la venta aunque lo hayan movido
+            cache.set(_clave_indice(pid), datos, timeout=ttl)
+            for llave in llaves:
+                cache.touch(llave, ttl)
+        return len(claves)
+    finally:
+        cache.delete(f"flash:{pid}:conciliando")
+
+
+# ============================================================
+# 🚦 Fila de admisión al checkout
+# ============================================================
+def _clave_turnos(pid):
+    return f"flash:{pid}:turnos"
+
+
+def _clave_base(pid):
+    return f"flash:{pid}:base"
+
+
+def _clave_vivo(pid, turno):
+    return f"flash:{pid}:vivo:{turno}"
+
+
+def _clave_cupo(pid, indice):
+    return f"flash:{pid}:cupo:{indice}"
+
+
+def _turno_de(request, pid):
+    return request.session.get(SESION, {}).get(str(pid))
+
+
+def _guardar_turno(request, pid, datos):
+    fila = dict(request.session.get(SESION, {}))
+    if datos is None:
+        fila.pop(str(pid), None)
+    else:
+        fila[str(pid)] = datos
+    request.session[SESION] = fila
+
+
+def admitido(request, product_id):
+    """True si el cliente tiene un cupo vigente para el checkout de este producto."""
+    datos = _turno_de(request, product_id)
+    if not datos or datos.get("cupo") is None:
+        return False
+    return cache.get(_clave_cupo(product_id, datos["cupo"])) == datos["turno"]
+
+
+def _adelante(pid, turno):
+    """Turnos vivos antes de ``turno``; de paso adelanta la base sobre los muertos."""
+    base = cache.get(_clave_base(pid)) or 1
+    revisar = range(base, min(turno, base + VENTANA_MAX))
+    vivos = cache.get_many([_clave_vivo(pid, t) for t in revisar])
+    primero_vivo = next((t for t in revisar if _clave_vivo(pid, t) in vivos), revisar.stop)
+    if primero_vivo > base:
+        cache.set(_clave_base(pid), primero_vivo, timeout=None)
+    # Más allá de la ventana se asume que todos siguen en la fila
+    return len(vivos) + max(turno - revisar.stop, 0)
+
+
+def hacer_fila(request, product_id, cupo):
+    """
+    Pide turno (si no tiene) e intenta entrar. Devuelve
+    {"admitido": bool, "adelante": n} para la página de espera.
+    """
+    if admitido(request, product_id):
+        return {"admitido": True, "adelante": 0}
+
+    datos = _turno_de(request, product_id)
+    if not datos or datos.get("cupo") is not None:  # sin turno, o su cupo ya venció: a la cola
+        cache.add(_clave_turnos(product_id), 0, timeout=None)
+        datos = {"turno": cache.incr(_clave_turnos(product_id)), "cupo": None}
+        _guardar_turno(request, product_id, datos)
+    turno = datos["turno"]
+    cache.set(_clave_vivo(product_id, turno), 1, _turno_ttl())
+
+    adelante = _adelante(product_id, turno)
+    ocupados = cache.get_many([_clave_cupo(product_id, i) for i in range(cupo)])
+    libres = [i for i in range(cupo) if _clave_cupo(product_id, i) not in ocupados]
+    if adelante < len(libres):
+        for i in libres:
+            if cache.add(_clave_cupo(product_id, i), turno, _admision_ttl()):
+                cache.delete(_clave_vivo(product_id, turno))
+                _guardar_turno(request, product_id, {"turno": turno, "cupo": i})
+                return {"admitido": True, "adelante": 0}
+    return {"admitido": False, "adelante": adelante}
+
+
+def salir(request, product_id):
+    """Libera el cupo y el turno (compra terminada)."""
+    datos = _turno_de(request, product_id)
+    if not datos:
+        return
+    if datos.get("cupo") is not None and admitido(request, product_id):
+        cache.delete(_clave_cupo(product_id, datos["cupo"]))
+    cache.delete(_clave_vivo(product_id, datos["turno"]))
+    _guardar_turno(request, product_id, None)
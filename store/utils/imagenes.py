@@ -0,0 +1,259 @@
+"""
+Derivadas responsive de las imágenes del catálogo (WebP y, opcional, AVIF).
+
+Flujo:
+1. Al guardar un Product/ProductImage/Banner (señal en store/signals.py) se
+   compara el archivo actual con ``<campo>_derivadas["origen"]``; si cambió se
+   encola una TareaImagen. Guardar no procesa nada: el admin no se pone lento.
+2. El worker ``manage.py procesar_imagenes`` lee el original con el storage
+   del propio campo (FileSystemStorage o Cloudinary), genera un ancho por cada
+   valor de IMAGENES_ANCHOS que no supere el original y guarda los archivos en
+   ``derivadas/`` con ese mismo storage.
+3. Las URLs resultantes quedan en ``<campo>_derivadas`` y el tag
+   ``{% imagen_responsive %}`` (templatetags/imagenes.py) arma srcset/sizes;
+   ``url_derivada`` elige una URL suelta (tag ``imagen_url``, mapa de la lupa).
+
+Formato de ``<campo>_derivadas``::
+
+    {"v": 2, "origen": "products/x.jpg", "ancho": 1600, "alto": 2000,
+     "lqip": "data:image/webp;base64,...", "color": "#a1b2c3",
+     "webp": [[320, url, nombre], ...], "avif": [[320, url, nombre], ...]}
+
+``lqip`` (vista previa de 16 px en base64) y ``color`` (color dominante) se
+pintan como fondo del <img> mientras carga: no cuestan peticiones extra.
+Subir ``VERSION`` hace que ``--todas`` vuelva a procesar lo ya generado.
+"""
+import base64
+import logging
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.models import TareaImagen
+from store.utils.cache import invalidar_catalogo
+from store.utils import variantes  # módulo: variantes importa url_derivada de aquí
+
+logger = logging.getLogger(__name__)
+
+# "app.modelo" → campos de imagen con su JSONField <campo>_derivadas
+CAMPOS_IMAGEN = {
+    "store.product": ["image", "video_thumb"],
+    "store.productimage": ["image"],
+    "store.banner": ["image"],
+}
+MAX_INTENTOS = 3
+VERSION = 2  # 1: solo derivadas; 2: + lqip y color dominante
+
+
+def _anchos():
+    return sorted(getattr(settings, "IMAGENES_ANCHOS", [320, 640, 960, 1280]))
+
+
+def _formatos():
+    from PIL import features
+
+    formatos = ["webp"]
+    if getattr(settings, "IMAGENES_AVIF", False) and features.check("avif"):
+        formatos.append("avif")
+    return formatos
+
+
+# ============================================================
+# 🔗 URLs
+# ============================================================
+def url_original(archivo):
+    """Acepta un FieldFile o una URL ya resuelta (filas cacheadas del dashboard)."""
+    if not archivo:
+        return ""
+    return archivo if isinstance(archivo, str) else archivo.url
+
+
+def url_derivada(archivo, derivadas=None, ancho=1280):
+    """URL WebP más chica que cubre ``ancho`` px; sin derivadas, el original."""
+    entradas = (derivadas or {}).get("webp") or []
+    for a, url, *_ in entradas:
+        if a >= ancho:
+            return url
+    if entradas:
+        return entradas[-1][1]
+    return url_original(archivo)
+
+
+# ============================================================
+# 📥 Encolado (señal post_save)
+# ============================================================
+def _al_dia(nombre, meta):
+    meta = meta or {}
+    if not nombre:
+        return not meta.get("origen")
+    return nombre == meta.get("origen") and meta.get("v") == VERSION
+
+
+def encolar_si_cambio(instancia):
+    etiqueta = instancia._meta.label_lower
+    tareas = []
+    for campo in CAMPOS_IMAGEN.get(etiqueta, []):
+        nombre = getattr(instancia, campo).name or ""
+        if not _al_dia(nombre, getattr(instancia, f"{campo}_derivadas")):
+            tareas.append(TareaImagen(modelo=etiqueta, objeto_id=instancia.pk, campo=campo))
+    if tareas:
+        TareaImagen.objects.bulk_create(tareas, ignore_conflicts=True)
+
+
+def encolar_todas():
+    """Encola cada imagen cuyo archivo no coincide con sus derivadas (backfill)."""
+    total = 0
+    for etiqueta, campos in CAMPOS_IMAGEN.items():
+        modelo = apps.get_model(etiqueta)
+        for campo in campos:
+            filas = modelo.objects.values_list("pk", campo, f"{campo}_derivadas").iterator(chunk_size=2000)
+            tareas = [
+                TareaImagen(modelo=etiqueta, objeto_id=pk, campo=campo)
+                for pk, nombre, meta in filas
+                if not _al_dia(nombre, meta)
+            ]
+            TareaImagen.objects.bulk_create(tareas, ignore_conflicts=True, batch_size=1000)
+            total += len(tareas)
+    return total
+
+
+# ============================================================
+# 🖼️ Generación
+# ============================================================
+def _nombre_derivada(original, ancho, formato):
+    raiz, _ = os.path.splitext(original)
+    return f"derivadas/{raiz}-v{VERSION}-{ancho}w.{formato}"
+
+
+def generar_derivadas(archivo):
+    """Lee un FieldFile y devuelve el dict de derivadas (sube los archivos)."""
+    from PIL import Image, ImageOps
+
+    if not archivo:
+        return {}
+    storage = archivo.storage
+    with archivo.open("rb") as f:
+        imagen = Image.open(f)
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen.load()
+    if imagen.mode not in ("RGB", "RGBA"):
+        # LA/PA traen el alfa como banda; P/L con "transparency" como color transparente
+        con_alfa = "A" in imagen.getbands() or "transparency" in imagen.info
+        imagen = imagen.convert("RGBA" if con_alfa else "RGB")
+
+    ancho, alto = imagen.size
+    anchos = [a for a in _anchos() if a < ancho] + [min(ancho, _anchos()[-1])]
+    meta = {
+        "v": VERSION, "origen": archivo.name, "ancho": ancho, "alto": alto,
+        "lqip": _lqip(imagen), "color": _color_dominante(imagen),
+    }
+    for formato in _formatos():
+        meta[formato] = []
+        for a in sorted(set(anchos)):
+            copia = imagen if a == ancho else imagen.resize((a, round(alto * a / ancho)), Image.LANCZOS)
+            buffer = BytesIO()
+            copia.save(buffer, formato.upper(), quality=80 if formato == "webp" else 55)
+            nombre = storage.save(_nombre_derivada(archivo.name, a, formato), ContentFile(buffer.getvalue()))
+            meta[formato].append([a, storage.url(nombre), nombre])
+    return meta
+
+
+def _lqip(imagen):
+    """Vista previa de 16 px como data URI (~200 bytes); el navegador la difumina al escalar."""
+    mini = imagen.copy()
+    mini.thumbnail((16, 16))
+    buffer = BytesIO()
+    mini.save(buffer, "WEBP", quality=40)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def _color_dominante(imagen):
+    """Color más frecuente tras reducir a 5 colores sobre una copia de 64 px."""
+    from PIL import Image
+
+    mini = imagen.convert("RGB")
+    mini.thumbnail((64, 64))
+    paleta = mini.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    _, indice = max(paleta.getcolors())
+    r, g, b = paleta.getpalette()[indice * 3:indice * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _borrar_derivadas(storage, meta, conservar):
+    for formato in ("webp", "avif"):
+        for _, _, nombre in meta.get(formato, []):
+            if nombre not in conservar:
+                try:
+                    storage.delete(nombre)
+                except Exception:  # el archivo viejo puede no existir ya
+                    logger.warning("No se pudo borrar la derivada %s", nombre)
+
+
+def procesar_tarea(tarea):
+    """Genera y guarda las derivadas de una tarea. Devuelve True si hubo cambios."""
+    modelo = apps.get_model(tarea.modelo)
+    instancia = modelo.objects.filter(pk=tarea.objeto_id).first()
+    if instancia is None:
+        return False
+    archivo = getattr(instancia, tarea.campo)
+    previa = getattr(instancia, f"{tarea.campo}_derivadas") or {}
+    if _al_dia(archivo.name, previa):
+        return False
+
+    meta = generar_derivadas(archivo)
+    # update() y no save(): no vuelve a disparar la señal ni toca date_update
+    modelo.objects.filter(pk=instancia.pk).update(**{f"{tarea.campo}_derivadas": meta})
+    nuevas = {n for f in ("webp", "avif") for _, _, n in meta.get(f, [])}
+    _borrar_derivadas(archivo.storage, previa, nuevas)
+    if tarea.modelo == "store.productimage":
+        variantes.invalidar_mapa_colores(instancia.product_id)  # el mapa guarda la URL de 960 px
+    return True
+
+
+def procesar_pendientes(lote=20):
+    """
+    Procesa hasta ``lote`` tareas, de a una por transacción. La fila se toma
+    con ``select_for_update(skip_locked=True)`` (otro worker salta a la
+    siguiente) y se borra en la misma transacción solo si salió bien: si el
+    proceso muere a mitad de camino la tarea sigue en la cola. Si la imagen
+    cambia mientras tanto, el INSERT de la señal espera al COMMIT y encola
+    una tarea nueva. Un error suma un intento y manda la tarea al final.
+    Devuelve (tomadas, hechas, fallidas); las tomadas ya al día no cuentan como hechas.
+    """
+    tomadas = hechas = fallidas = 0
+    vistas = []  # una tarea fallida no se reintenta en la misma pasada
+    for _ in range(lote):
+        with transaction.atomic():
+            tarea = (
+                TareaImagen.objects.select_for_update(skip_locked=True)
+                .exclude(pk__in=vistas).order_by("creada").first()
+            )
+            if tarea is None:
+                break
+            vistas.append(tarea.pk)
+            tomadas += 1
+            try:
+                with transaction.atomic():  # savepoint: un error de base no arruina la transacción
+                    hecha = procesar_tarea(tarea)
+            except Exception:
+                fallidas += 1
+                logger.exception("Falló la derivada de %s", tarea)
+                if tarea.intentos + 1 < MAX_INTENTOS:
+                    TareaImagen.objects.filter(pk=tarea.pk).update(
+                        intentos=F("intentos") + 1, creada=timezone.now(),
+                    )
+                else:
+                    tarea.delete()
+                continue
+            tarea.delete()
+            if hecha:
+                hechas += 1
+    if hechas:
+        invalidar_catalogo()  # las páginas cacheadas traen las URLs nuevas
+    return tomadas, hechas, fallidas
@@ -0,0 +1,237 @@
+"""
+Promociones y cupones compilados en memoria.
+
+Evaluar Promocion con consultas por línea del carrito (¿tiene promo este
+producto? ¿y su categoría? ¿el cupón aplica?) sumaría varias consultas por
+línea al checkout. En cambio:
+
+1. **Compilar.** Las promociones activas y no vencidas se leen una vez (tres
+   consultas: reglas + las dos tablas M2M) y se indexan en un ``Indice``:
+   reglas por producto, por categoría y generales (sin alcance), más los
+   cupones por código. Cada proceso guarda su índice en memoria.
+2. **Refrescar.** Guardar o borrar una promoción (señales en
+   store/signals.py) incrementa ``promociones:version`` en la caché
+   compartida; cada proceso compara esa versión (un GET) y recompila solo si
+   cambió; además recompila cada ``PROMOCIONES_REFRESCO_SEGUNDOS`` (corto
+   sin Redis, donde la versión no se comparte). Las fechas de inicio/fin se
+   revisan al evaluar: una promoción programada empieza y termina a la hora
+   sin recompilar.
+3. **Evaluar.** ``evaluar`` recorre el carrito una vez, sin consultas: a cada
+   línea le toca la MEJOR regla que le aplica (no se acumulan). Una regla con
+   código solo compite si el cliente ingresó ese cupón.
+
+El cupón ingresado vive en la sesión (``SESION``) hasta que se factura, junto
+con la rebaja que mostró el checkout (``SESION_VISTO``): si al facturar la
+evaluación da otra cosa (una promoción terminó, el cupón dejó de aplicar) no
+se cobra y el cliente vuelve al checkout a ver el total nuevo.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from store.models import Promocion
+
+CLAVE_VERSION = "promociones:version"
+SESION = "cupon"
+SESION_VISTO = "descuento_visto"
+CENTAVO = Decimal("0.01")
+
+
+@dataclass(frozen=True)
+class Regla:
+    id: int
+    nombre: str
+    tipo: str
+    valor: Decimal
+    compra: int
+    gratis: int
+    codigo: str
+    inicio: object
+    fin: object
+
+    def vigente(self, ahora):
+        return self.inicio <= ahora and (self.fin is None or ahora < self.fin)
+
+    def descuento(self, precio, cantidad):
+        """Rebaja de una línea (precio unitario ya con el descuento del producto)."""
+        if self.tipo == Promocion.PORCENTAJE:
+            rebaja = precio * cantidad * self.valor / 100
+        elif self.tipo == Promocion.FIJO:
+            rebaja = min(self.valor, precio) * cantidad
+        else:
+            grupo = self.compra + self.gratis
+            rebaja = (cantidad // grupo) * self.gratis * precio if grupo else Decimal("0")
+        return min(rebaja, precio * cantidad).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+@dataclass
+class Indice:
+    por_producto: dict = field(default_factory=dict)  # product_id -> [Regla]
+    por_categoria: dict = field(default_factory=dict)  # category_id -> [Regla]
+    generales: list = field(default_factory=list)
+    cupones: dict = field(default_factory=dict)  # "CODIGO" -> Regla
+
+
+@dataclass
+class Resultado:
+    lineas: dict = field(default_factory=dict)  # clave -> (descuento, nombre de la promoción)
+    descuento: Decimal = Decimal("0")
+    cupon: str = ""  # cupón que efectivamente rebajó algo
+
+    def de(self, clave):
+        return self.lineas.get(clave, (Decimal("0"), ""))
+
+
+def normalizar(codigo):
+    return (codigo or "").strip().upper()
+
+
+# ============================================================
+# 🧩 Compilación (una vez por proceso y por versión)
+# ============================================================
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, int(time.time()), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_promociones():
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, int(time.time()), timeout=None)
+
+
+def compilar(ahora=None):
+    """Arma el Indice con las promociones activas que aún no vencieron."""
+    ahora = ahora or timezone.now()
+    filas = (
+        Promocion.objects.filter(activa=True)
+        .filter(Q(fin__isnull=True) | Q(fin__gt=ahora))
+        .values_list("id", "nombre", "tipo", "valor", "compra", "gratis", "codigo", "inicio", "fin")
+    )
+    reglas = {
+        pid: Regla(pid, nombre, tipo, valor, compra, gratis, normalizar(codigo), inicio, fin)
+        for pid, nombre, tipo, valor, compra, gratis, codigo, inicio, fin in filas
+    }
+    indice = Indice()
+    if not reglas:
+        return indice
+
+    con_alcance = set()
+    for modelo, destino, campo in (
+        (Promocion.productos.through, indice.por_producto, "product_id"),
+        (Promocion.categorias.through, indice.por_categoria, "category_id"),
+    ):
+        for promo_id, objetivo in modelo.objects.filter(promocion_id__in=reglas).values_list("promocion_id", campo):
+            destino.setdefault(objetivo, []).append(reglas[promo_id])
+            con_alcance.add(promo_id)
+
+    indice.generales = [r for pid, r in reglas.items() if pid not in con_alcance]
+    indice.cupones = {r.codigo: r for r in reglas.values() if r.codigo}
+    return indice
+
+
+_lock = threading.Lock()
+_memoria = {"version": None, "compilado": 0.0, "indice": None}
+
+
+def _refresco():
+    # Red de seguridad si una edición no pasó por las señales (update(), caché por proceso)
+    return getattr(settings, "PROMOCIONES_REFRESCO_SEGUNDOS", 60 * 60)
+
+
+def _vencido(version):
+    return (
+        _memoria["indice"] is None
+        or _memoria["version"] != version
+        or time.monotonic() - _memoria["compilado"] > _refresco()
+    )
+
+
+def indice():
+    """Índice vigente del proceso; recompila si otra edición cambió la versión."""
+    version = _version()
+    if _vencido(version):
+        with _lock:
+            if _vencido(version):  # otro hilo pudo recompilar mientras esperábamos
+                _memoria.update(indice=compilar(), version=version, compilado=time.monotonic())
+    return _memoria["indice"]
+
+
+# ============================================================
+# 🏷️ Evaluación del carrito (una pasada, sin consultas)
+# ============================================================
+def cupon_vigente(codigo, ahora=None):
+    """Regla del cupón si existe y está en fecha; None si no."""
+    regla = indice().cupones.get(normalizar(codigo))
+    if regla and regla.vigente(ahora or timezone.now()):
+        return regla
+    return None
+
+
+def evaluar(lineas, codigo="", ahora=None):
+    """
+    ``lineas``: iterable de (clave, product_id, category_id, precio, cantidad).
+    Devuelve un Resultado con la rebaja de cada línea y el total.
+    """
+    ahora = ahora or timezone.now()
+    idx = indice()
+    codigo = normalizar(codigo)
+    resultado = Resultado()
+
+    for clave, product_id, category_id, precio, cantidad in lineas:
+        if cantidad <= 0:
+            continue
+        mejor, ganadora = Decimal("0"), None
+        candidatas = (
+            idx.por_producto.get(product_id, ()),
+            idx.por_categoria.get(category_id, ()),
+            idx.generales,
+        )
+        for grupo in candidatas:
+            for regla in grupo:
+                if regla.codigo and regla.codigo != codigo:
+                    continue
+                if not regla.vigente(ahora):
+                    continue
+                rebaja = regla.descuento(precio, cantidad)
+                if rebaja > mejor:
+                    mejor, ganadora = rebaja, regla
+        if ganadora:
+            resultado.lineas[clave] = (mejor, ganadora.nombre)
+            resultado.descuento += mejor
+            if ganadora.codigo:
+                resultado.cupon = ganadora.codigo
+    return resultado
+
+
+def cupon_de(request):
+    return request.session.get(SESION, "")
+
+
+def guardar_cupon(request, codigo):
+    if codigo:
+        request.session[SESION] = normalizar(codigo)
+    else:
+        request.session.pop(SESION, None)
+        request.session.pop(SESION_VISTO, None)
+
+
+def guardar_visto(request, descuento):
+    """Rebaja que mostró el checkout (solo escribe la sesión si cambió)."""
+    valor = str(descuento)
+    if request.session.get(SESION_VISTO) != valor:
+        request.session[SESION_VISTO] = valor
+
+
+def descuento_visto(request):
+    return Decimal(request.session.get(SESION_VISTO, "0"))
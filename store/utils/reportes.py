@@ -0,0 +1,194 @@
+"""
+Rollups de ventas: por día (categoría, producto, método de pago) y por cliente.
+
+Mantenimiento incremental:
+- Cada vez que se guarda/borra una Factura (señales en store/signals.py) se
+  marca su día en DiaVentasPendiente y el ResumenCliente del dueño como
+  pendiente. Son dos escrituras pequeñas, sin agregaciones.
+- El comando ``actualizar_reportes`` (programado cada noche o cada pocos
+  minutos) recalcula solo esos días y clientes. Recalcular un día lee las
+  facturas de ese rango de fechas (índice factura_fecha_idx) y reemplaza sus
+  filas, así que es idempotente y tolera cambios de estado de pago.
+- El resumen de un cliente también se recalcula al vuelo si está pendiente
+  cuando se abre su dashboard.
+
+Cuenta como venta una factura con estado_pago en ESTADOS_VENTA ("Aprobado"
+es contra entrega confirmada). ``total_pagado`` conserva el criterio anterior
+del dashboard: solo "Pagado".
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from store.models import (
+    DetalleFactura, DiaVentasPendiente, Factura, ResumenCliente,
+    VentaDiariaCategoria, VentaDiariaMetodoPago, VentaDiariaProducto,
+)
+
+ESTADOS_VENTA = ("Pagado", "Aprobado")
+
+
+# ============================================================
+# 🏷️ Marcado (lo llaman las señales de Factura)
+# ============================================================
+def marcar_pendiente(factura):
+    dia = timezone.localdate(factura.fecha) if factura.fecha else timezone.localdate()
+    DiaVentasPendiente.objects.bulk_create([DiaVentasPendiente(dia=dia)], ignore_conflicts=True)
+    ResumenCliente.objects.filter(usuario_id=factura.usuario_id, pendiente=False).update(pendiente=True)
+
+
+# ============================================================
+# 📅 Rollups diarios
+# ============================================================
+def _rango(dia):
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+@transaction.atomic
+def recalcular_dia(dia):
+    """Reemplaza las filas de un día con lo que dicen hoy sus facturas."""
+    inicio, fin = _rango(dia)
+    facturas = Factura.objects.filter(fecha__gte=inicio, fecha__lt=fin, estado_pago__in=ESTADOS_VENTA)
+    detalles = DetalleFactura.objects.filter(
+        factura__fecha__gte=inicio, factura__fecha__lt=fin, factura__estado_pago__in=ESTADOS_VENTA
+    )
+
+    por_categoria = [
+        VentaDiariaCategoria(dia=dia, categoria_id=f["producto__category_id"], facturas=f["n_facturas"],
+                             unidades=f["n_unidades"] or 0, ventas=f["total"] or 0)
+        for f in detalles.values("producto__category_id").annotate(
+            n_facturas=Count("factura_id", distinct=True), n_unidades=Sum("cantidad"), total=Sum("subtotal"),
+        ).order_by()
+    ]
+    por_producto = [
+        VentaDiariaProducto(dia=dia, producto_id=f["producto_id"], unidades=f["n_unidades"] or 0, ventas=f["total"] or 0)
+        for f in detalles.values("producto_id").annotate(n_unidades=Sum("cantidad"), total=Sum("subtotal")).order_by()
+    ]
+    por_metodo = [
+        VentaDiariaMetodoPago(dia=dia, metodo_pago=f["metodo_pago"], facturas=f["n_facturas"], ventas=f["total"] or 0)
+        for f in facturas.values("metodo_pago").annotate(n_facturas=Count("id"), total=Sum("total")).order_by()
+    ]
+
+    for modelo, filas in (
+        (VentaDiariaCategoria, por_categoria),
+        (VentaDiariaProducto, por_producto),
+        (VentaDiariaMetodoPago, por_metodo),
+    ):
+        modelo.objects.filter(dia=dia).delete()
+        modelo.objects.bulk_create(filas)
+
+
+# ============================================================
+# 👤 Resumen por cliente
+# ============================================================
+def _agregados():
+    venta = Q(estado_pago__in=ESTADOS_VENTA)
+    return {
+        "facturas": Count("id"),
+        "compras": Count("id", filter=venta),
+        "total_compras": Coalesce(Sum("total", filter=venta), Value(Decimal("0"))),
+        "total_pagado": Coalesce(Sum("total", filter=Q(estado_pago="Pagado")), Value(Decimal("0"))),
+        "primera_compra": Min("fecha", filter=venta),
+        "ultima_compra": Max("fecha", filter=venta),
+    }
+
+
+def recalcular_cliente(usuario_id):
+    datos = Factura.objects.filter(usuario_id=usuario_id).aggregate(**_agregados())
+    resumen, _ = ResumenCliente.objects.update_or_create(
+        usuario_id=usuario_id, defaults={**datos, "pendiente": False}
+    )
+    return resumen
+
+
+def recalcular_clientes(usuario_ids, lote=2000):
+    """Igual que recalcular_cliente pero agrupado: un SELECT y un upsert por lote."""
+    ids = list(usuario_ids)
+    for i in range(0, len(ids), lote):
+        filas = (
+            Factura.objects.filter(usuario_id__in=ids[i:i + lote])
+            .values("usuario_id").annotate(**_agregados()).order_by()
+        )
+        ResumenCliente.objects.bulk_create(
+            [ResumenCliente(pendiente=False, **f) for f in filas],
+            update_conflicts=True,
+            unique_fields=["usuario"],
+            update_fields=[*_agregados(), "pendiente", "actualizado"],
+        )
+
+
+def resumen_cliente(usuario):
+    """Lectura para el dashboard: 1 consulta si está al día, recalcula si no."""
+    resumen = ResumenCliente.objects.filter(usuario=usuario).first()
+    if resumen is None or resumen.pendiente:
+        resumen = recalcular_cliente(usuario.pk)
+    return resumen
+
+
+# ============================================================
+# 🔁 Procesar pendientes
+# ============================================================
+def procesar_pendientes(dias_extra=()):
+    """
+    Recalcula los días marcados (más ``dias_extra``) y los clientes pendientes o
+    sin resumen que compraron esos días. Devuelve (n_dias, n_clientes).
+    """
+    marcados = list(DiaVentasPendiente.objects.values_list("id", "dia"))
+    # Tomamos los marcados ANTES de recalcular: una factura que llegue mientras
+    # tanto vuelve a marcar su día y lo procesa la siguiente corrida.
+    DiaVentasPendiente.objects.filter(id__in=[i for i, _ in marcados]).delete()
+    dias = sorted({d for _, d in marcados} | set(dias_extra))
+    clientes = set()
+    try:
+        for dia in dias:
+            recalcular_dia(dia)
+            inicio, fin = _rango(dia)
+            clientes.update(
+                Factura.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+                .exclude(usuario__resumen_ventas__pendiente=False)
+                .values_list("usuario_id", flat=True).distinct()
+            )
+    except Exception:
+        DiaVentasPendiente.objects.bulk_create(
+            [DiaVentasPendiente(dia=d) for _, d in marcados], ignore_conflicts=True
+        )
+        raise
+
+    clientes.update(ResumenCliente.objects.filter(pendiente=True).values_list("usuario_id", flat=True))
+    recalcular_clientes(clientes)
+    return len(dias), len(clientes)
+
+
+# ============================================================
+# 📊 Consultas del reporte (solo leen rollups)
+# ============================================================
+def reporte_ventas(desde, hasta):
+    """Totales entre dos fechas (incluidas) para el reporte del admin."""
+    rango = {"dia__gte": desde, "dia__lte": hasta}
+    return {
+        "por_categoria": list(
+            VentaDiariaCategoria.objects.filter(**rango).values("categoria__name")
+            .annotate(facturas=Sum("facturas"), unidades=Sum("unidades"), ventas=Sum("ventas"))
+            .order_by("-ventas")
+        ),
+        "por_metodo": list(
+            VentaDiariaMetodoPago.objects.filter(**rango).values("metodo_pago")
+            .annotate(facturas=Sum("facturas"), ventas=Sum("ventas")).order_by("-ventas")
+        ),
+        "top_productos": list(
+            VentaDiariaProducto.objects.filter(**rango).values("producto__name")
+            .annotate(unidades=Sum("unidades"), ventas=Sum("ventas")).order_by("-ventas")[:20]
+        ),
+        "por_dia": list(
+            VentaDiariaMetodoPago.objects.filter(**rango).values("dia")
+            .annotate(facturas=Sum("facturas"), ventas=Sum("ventas")).order_by("dia")
+        ),
+        "total": VentaDiariaMetodoPago.objects.filter(**rango).aggregate(
+            facturas=Sum("facturas"), ventas=Sum("ventas")
+        ),
+    }
@@ -0,0 +1,170 @@
+"""
+Reservas de stock con vencimiento durante el checkout.
+
+Entre ``checkout`` (que solo leía stock) y ``generar_factura`` /
+``confirmacion_pago`` (que lo descuentan) varios clientes podían ver la
+última unidad. Ahora:
+
+1. Al entrar al checkout se aparta lo que el cliente va a comprar: una
+   ReservaStock por línea con ``expira = ahora + RESERVA_STOCK_MINUTOS``.
+   Volver a entrar reemplaza las reservas del carrito y renueva el plazo.
+2. Disponible = stock − reservas vigentes de OTROS carritos, calculado en la
+   misma consulta que ya traía las variantes (y los productos sin matriz):
+   un ``Sum`` filtrado sobre la relación, sin consultas por línea.
+3. Al pagar, ``descontar`` vuelve a bloquear las filas, compara cada línea
+   contra stock − reservas de OTROS carritos y descuenta con un UPDATE
+   condicionado (``stock >= n``); si algo no alcanza, ``StockInsuficiente``
+   deshace la transacción. El descuento reemplaza la reserva (``liberar``).
+   Si el cliente abandona, la reserva vence y deja de contar sola;
+   ``manage.py liberar_reservas`` borra las vencidas por lotes usando el
+   índice de ``expira``.
+
+No se descuenta stock al agregar al carrito: un carrito abandonado no deja
+productos bloqueados y el bloqueo de filas dura lo que tarda el checkout.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, IntegerField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from store.models import Product, ProductVariant, ReservaStock
+from store.utils.cache import invalidar_producto
+from store.utils.variantes import clave_variante, invalidar_matriz_stock, variantes_por_talla
+
+
+class StockInsuficiente(Exception):
+    """Una línea pide más de lo que queda libre (stock − reservas de otros carritos)."""
+
+    def __init__(self, nombre):
+        super().__init__(nombre)
+        self.nombre = nombre
+
+
+def _minutos():
+    return getattr(settings, "RESERVA_STOCK_MINUTOS", 15)
+
+
+def _reservado(ahora, excluir_cart_id, sin_variante=False):
+    """Sum de las reservas vigentes de otros carritos (0 si no hay)."""
+    vigentes = Q(reservas__expira__gt=ahora)
+    if excluir_cart_id:
+        vigentes &= ~Q(reservas__cart_id=excluir_cart_id)
+    if sin_variante:
+        vigentes &= Q(reservas__variante__isnull=True)
+    return Coalesce(Sum("reservas__cantidad", filter=vigentes), Value(0), output_field=IntegerField())
+
+
+# ============================================================
+# 📦 Stock disponible (stock − reservas vigentes)
+# ============================================================
+def variantes_disponibles(product_ids, excluir_cart_id=None):
+    """
+    Igual que variantes_por_clave pero cada variante trae ``disponible``.
+    Una consulta; las reservas del propio carrito no se descuentan.
+    """
+    qs = (
+        ProductVariant.objects.filter(product_id__in=set(product_ids))
+        .annotate(reservado=_reservado(timezone.now(), excluir_cart_id))
+        .order_by("id")
+    )
+    variantes = {}
+    for v in qs:
+        v.disponible = max(v.stock - v.reservado, 0)
+        variantes.setdefault(clave_variante(v.product_id, v.talla, v.color), v)
+    return variantes
+
+
+def productos_disponibles(product_ids, excluir_cart_id=None):
+    """in_bulk de productos con ``disponible`` para los que no tienen matriz."""
+    productos = Product.objects.annotate(
+        reservado=_reservado(timezone.now(), excluir_cart_id, sin_variante=True)
+    ).in_bulk(set(product_ids))
+    for p in productos.values():
+        p.disponible = max(p.stock - p.reservado, 0)
+    return productos
+
+
+def bloquear(product_ids):
+    """
+    Bloquea hasta el fin de la transacción las filas de stock de estos
+    productos (y sus variantes) para que dos checkouts simultáneos no aparten
+    la misma unidad. Va aparte porque FOR UPDATE no se combina con el GROUP BY
+    del cálculo de disponible.
+    """
+    ids = set(product_ids)
+    list(Product.objects.select_for_update().filter(id__in=ids).values_list("id"))
+    list(ProductVariant.objects.select_for_update().filter(product_id__in=ids).values_list("id"))
+
+
+# ============================================================
+# 📉 Descontar al facturar
+# ============================================================
+def descontar(cart_id, lineas):
+    """
+    Descuenta el stock vendido. ``lineas``: [(product_id, talla, color,
+    cantidad, nombre), ...]. Va dentro de la transacción de la factura: la
+    variante se resuelve igual que en el checkout (talla+color, luego solo
+    talla) y cada línea se compara con lo disponible para ESTE carrito. El
+    UPDATE lleva ``stock >= n`` como guarda por si la base no bloquea filas.
+    """
+    ids = {pid for pid, *_ in lineas}
+    bloquear(ids)
+    variantes = variantes_disponibles(ids, excluir_cart_id=cart_id)
+    por_talla = variantes_por_talla(variantes)
+    productos = productos_disponibles(ids, excluir_cart_id=cart_id)
+    con_matriz = set()
+
+    for pid, talla, color, cantidad, nombre in lineas:
+        talla, color = str(talla or "").strip(), str(color or "").strip()
+        variante = variantes.get(clave_variante(pid, talla, color)) or por_talla.get((int(pid), talla.upper()))
+        fila = variante or productos.get(pid)
+        if fila is None or cantidad > fila.disponible:
+            raise StockInsuficiente(nombre)
+        modelo = ProductVariant if variante else Product
+        if not modelo.objects.filter(pk=fila.pk, stock__gte=cantidad).update(stock=F("stock") - cantidad):
+            raise StockInsuficiente(nombre)
+        fila.disponible -= cantidad  # dos líneas pueden caer en la misma variante
+        if variante:
+            con_matriz.add(pid)
+
+    # update() no dispara señales: total del producto y cachés a mano
+    for pid in con_matriz:
+        productos[pid].actualizar_stock_total()
+    invalidar_matriz_stock(*con_matriz)
+    invalidar_producto(*ids)
+
+
+# ============================================================
+# 📝 Reservar / liberar
+# ============================================================
+def reservar(cart_id, renglones):
+    """
+    Reemplaza las reservas del carrito por ``renglones``:
+    [(product_id, variante_id o None, cantidad), ...]. Devuelve la expiración.
+    """
+    expira = timezone.now() + timedelta(minutes=_minutos())
+    ReservaStock.objects.filter(cart_id=cart_id).delete()
+    ReservaStock.objects.bulk_create([
+        ReservaStock(cart_id=cart_id, product_id=pid, variante_id=vid, cantidad=cantidad, expira=expira)
+        for pid, vid, cantidad in renglones if cantidad > 0
+    ])
+    return expira
+
+
+def liberar(cart_id):
+    if cart_id:
+        ReservaStock.objects.filter(cart_id=cart_id).delete()
+
+
+def barrer(lote=5000):
+    """Borra un lote de reservas vencidas (índice de expira). Devuelve cuántas."""
+    ids = list(
+        ReservaStock.objects.filter(expira__lte=timezone.now())
+        .order_by("expira").values_list("id", flat=True)[:lote]
+    )
+    if not ids:
+        return 0
+    borradas, _ = ReservaStock.objects.filter(id__in=ids).delete()
+    return borradas
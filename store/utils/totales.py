@@ -18,6 +18,9 @@ def calcular_totales(factura):
         subtotal += cost * cantidad
         ahorro_total += (cost - final_price) * cantidad
 
+    # Promociones y cupones aplicados al facturar
+    ahorro_total += Decimal(str(getattr(factura, "descuento", 0) or 0))
+
     # ✅ IVA eliminado, solo se calcula el total con descuento
     total_final = subtotal - ahorro_total
 
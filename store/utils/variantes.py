@@ -0,0 +1,143 @@
+from django.core.cache import cache
+
+from store.models import ProductImage, ProductVariant
+from store.utils.imagenes import url_derivada
+
+MAPA_COLORES_TTL = 60 * 60 * 6  # respaldo: la señal borra la entrada al cambiar una imagen
+
+
+def _mayus(valor):
+    # Equivalente en Python del UPPER() que usa __iexact en PostgreSQL
+    return valor.upper() if valor is not None else None
+
+
+def clave_variante(product_id, talla, color):
+    """Llave para buscar una variante sin distinguir mayúsculas (como __iexact)."""
+    return (int(product_id), _mayus(talla), _mayus(color))
+
+
+def variantes_por_clave(product_ids):
+    """
+    Trae en UNA consulta todas las variantes de los productos indicados.
+    Devuelve {clave_variante: ProductVariant}, conservando la primera por id
+    igual que hacía .filter(...iexact...).first().
+    """
+    variantes = {}
+    qs = ProductVariant.objects.filter(product_id__in=set(product_ids)).order_by("id")
+    for v in qs:
+        variantes.setdefault(clave_variante(v.product_id, v.talla, v.color), v)
+    return variantes
+
+
+def variantes_por_talla(variantes):
+    """
+    Respaldo por talla sin importar el color, a partir de variantes_por_clave:
+    {(product_id, TALLA): ProductVariant} con la de menor id, como
+    .filter(talla__iexact=...).first().
+    """
+    por_talla = {}
+    for (pid, talla, _), variante in sorted(variantes.items(), key=lambda par: par[1].id):
+        por_talla.setdefault((pid, talla), variante)
+    return por_talla
+
+
+def clave_color(color):
+    """Color normalizado para buscar en el mapa de la lupa ("  negro " → "NEGRO")."""
+    return _mayus((color or "").strip())
+
+
+def _clave_mapa(product_id):
+    return f"galeria:colores:{int(product_id)}"
+
+
+def invalidar_mapa_colores(product_id):
+    cache.delete(_clave_mapa(product_id))
+
+
+def mapa_color_imagenes(product_ids):
+    """
+    Mapa de la lupa: {product_id: {COLOR: [url, ...]}} con las imágenes
+    vinculadas a cada color en orden de carga. Se lee de caché por producto y
+    los que faltan se arman en UNA consulta; la señal de ProductImage (y el
+    worker de derivadas) borran la entrada del producto afectado.
+    Las URLs son las mismas que usa la galería (derivada de 960 px u original).
+    """
+    ids = {int(pid) for pid in product_ids if pid}
+    if not ids:
+        return {}
+    en_cache = cache.get_many([_clave_mapa(pid) for pid in ids])
+    mapas = {pid: en_cache[_clave_mapa(pid)] for pid in ids if _clave_mapa(pid) in en_cache}
+
+    faltan = ids - mapas.keys()
+    if faltan:
+        nuevos = {pid: {} for pid in faltan}
+        qs = (
+            ProductImage.objects.filter(product_id__in=faltan, color_vinculado__isnull=False)
+            .exclude(color_vinculado="")
+            .only("product_id", "color_vinculado", "image", "image_derivadas")
+            .order_by("id")
+        )
+        for img in qs:
+            url = url_derivada(img.image, img.image_derivadas, 960)
+            if url:
+                nuevos[img.product_id].setdefault(clave_color(img.color_vinculado), []).append(url)
+        cache.set_many({_clave_mapa(pid): mapa for pid, mapa in nuevos.items()}, MAPA_COLORES_TTL)
+        mapas.update(nuevos)
+    return mapas
+
+
+def imagen_de_color(mapas, product_id, color):
+    """Primera imagen del color elegido, o None si el producto no tiene una vinculada."""
+    if not product_id:
+        return None
+    urls = mapas.get(int(product_id), {}).get(clave_color(color))
+    return urls[0] if urls else None
+
+
+def _clave_matriz(product_id):
+    return f"variantes:matriz:{int(product_id)}"
+
+
+def invalidar_matriz_stock(*product_ids):
+    cache.delete_many([_clave_matriz(pid) for pid in product_ids])
+
+
+def matriz_stock(product_id):
+    """
+    Matriz compacta de stock de un producto armada en UNA consulta y cacheada
+    (la señal de ProductVariant la borra)::
+
+        {"tallas": ["L", "M"], "colores": ["Negro", "Rojo"],
+         "stock": [[0, 3], [5, 0]]}   # stock[i_talla][i_color]
+
+    Tallas y colores se comparan sin mayúsculas (como __iexact) y se muestran
+    con la primera escritura encontrada; si hay duplicados manda la variante
+    de menor id, igual que variantes_por_clave. Una combinación sin variante
+    queda en 0. Sin variantes la matriz viene vacía.
+    """
+    clave = _clave_matriz(product_id)
+    matriz = cache.get(clave)
+    if matriz is not None:
+        return matriz
+
+    tallas, colores, celdas = {}, {}, {}
+    filas = (
+        ProductVariant.objects.filter(product_id=product_id)
+        .order_by("id")
+        .values_list("talla", "color", "stock")
+    )
+    for talla, color, stock in filas:
+        t, c = _mayus(talla or ""), _mayus(color or "")
+        tallas.setdefault(t, talla or "")
+        colores.setdefault(c, color or "")
+        celdas.setdefault((t, c), stock)
+
+    orden_t = sorted(tallas, key=lambda t: tallas[t])
+    orden_c = sorted(colores, key=lambda c: colores[c])
+    matriz = {
+        "tallas": [tallas[t] for t in orden_t],
+        "colores": [colores[c] for c in orden_c],
+        "stock": [[celdas.get((t, c), 0) for c in orden_c] for t in orden_t],
+    }
+    cache.set(clave, matriz, MAPA_COLORES_TTL)
+    return matriz
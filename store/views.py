@@ -1,6 +1,7 @@
 # ============================
 # Librerías estándar de Python
 # ============================
+import json
 from decimal import Decimal
 from io import BytesIO
 
@@ -10,14 +11,20 @@ from io import BytesIO
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date
 from django.utils.timezone import localtime
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import condition, require_POST
 from django.core.mail import EmailMessage
+from django.contrib.admin.views.decorators import staff_member_required
 
 # ============================
 # Modelos propios
@@ -31,6 +38,16 @@ from .forms import CheckoutForm
 from store.utils import formatear_numero
 from store.utils.totales import calcular_totales
 from store.utils.email import enviar_factura   # ✅ Función de correo con SendGrid
+from store.utils.cache import etag_fragmento, fragmento_producto, version_catalogo
+from store.utils import carrito as carrito_db
+from store.utils import flash, promociones, reservas
+from store.utils.variantes import (
+    clave_variante, imagen_de_color, mapa_color_imagenes, matriz_stock, variantes_por_clave,
+    variantes_por_talla,
+)
+from store.utils.exportacion import EXPORTACIONES, codificar, serializar
+from store.instrumentacion import presupuesto_consultas, resumen_metricas
+from store.metricas import CHECKOUT, CONFLICTOS_STOCK, RENDER_PDF, cronometrar, exportar
 
 # ============================
 # Librerías externas (ReportLab para PDF)
@@ -67,7 +84,7 @@ def _precio_final(producto):
 # ============================================================
 def _items_carrito(request):
     """Construye la lista de ítems sincronizando imagen, stock real y variantes."""
-    carrito = request.session.get('carrito', {})
+    carrito = carrito_db.lineas_carrito(request, fresco=True)  # lo que se cobra sale de la base
     items = []
     
     # Obtenemos los productos de la DB
@@ -124,8 +141,12 @@ from store.models import Product, ProductVariant
 # ============================================================
 # 📋 Vista: Ver carrito (HÍBRIDA: MATRIZ + STOCK GENERAL)
 # ============================================================
+@presupuesto_consultas(12)
 def ver_carrito(request):
-    carrito = request.session.get("carrito", {})
+    # Precios que cambiaron desde que se agregó la línea (una consulta; se avisa al cliente)
+    for aviso in carrito_db.avisos_precio(carrito_db.revalidar_precios(request)):
+        messages.warning(request, aviso)
+    carrito = carrito_db.lineas_carrito(request)
     total = Decimal("0")
     productos_carrito = []
     carrito_valido = True 
@@ -133,9 +154,17 @@ def ver_carrito(request):
     if not carrito:
         carrito_valido = False
 
+    # Una sola consulta para productos y otra para variantes (antes: 2 por línea)
+    ids = [item.get("producto_id") for item in carrito.values()]
+    productos_db = Product.objects.in_bulk(ids)
+    variantes = variantes_por_clave(ids)
+    imagenes = mapa_color_imagenes(ids)
+
     for key, item in carrito.items():
         p_id = item.get("producto_id")
-        producto_base = get_object_or_404(Product, id=p_id) # Traemos el producto del admin
+        producto_base = productos_db.get(p_id) # Traemos el producto del admin
+        if producto_base is None:
+            raise Http404("Producto no encontrado")
         
         talla_val = str(item.get("talla", "")).strip()
         color_val = str(item.get("color", "")).strip()
@@ -144,11 +173,7 @@ def ver_carrito(request):
         color_display = None if color_val in ["Única", "Único", "None", ""] else color_val
 
         # 1. Intentamos buscar en la MATRIZ (Variantes)
-        variante = ProductVariant.objects.filter(
-            product_id=p_id, 
-            talla__iexact=talla_val, 
-            color__iexact=color_val
-        ).first()
+        variante = variantes.get(clave_variante(p_id, talla_val, color_val))
 
         # 2. LÓGICA HÍBRIDA DE STOCK
         if variante:
@@ -167,7 +192,8 @@ def ver_carrito(request):
             disponible = True
             if item["cantidad"] > stock_actual:
                 item["cantidad"] = stock_actual
-                request.session.modified = True
+                carrito_db.cambiar_cantidad(request, key, stock_actual)
+                CONFLICTOS_STOCK.labels(vista="ver_carrito").inc()
 
         precio = Decimal(str(item.get("precio", 0)))
         subtotal = precio * item["cantidad"]
@@ -182,7 +208,7 @@ def ver_carrito(request):
             "cantidad": item["cantidad"],
             "talla": talla_display, 
             "color": color_display, 
-            "imagen_url": item.get("imagen_url"),
+            "imagen_url": imagen_de_color(imagenes, p_id, color_val) or item.get("imagen_url"),
             "subtotal": subtotal,
             "disponible": disponible,
             "stock_max": stock_actual
@@ -203,6 +229,8 @@ def ver_carrito(request):
 from django.http import JsonResponse
 
 
+# Primer producto: crea el carrito y la línea (get_or_create); luego basta un UPDATE
+@presupuesto_consultas(12)
 def agregar_al_carrito(request, product_id):
     if request.method == 'POST':
         producto = get_object_or_404(Product, id=product_id)
@@ -216,36 +244,12 @@ def agregar_al_carrito(request, product_id):
         if not imagen_url or imagen_url == "undefined":
             imagen_url = producto.image.url if producto.image else "/static/icons/no-image.png"
 
-        carrito = request.session.get('carrito', {})
-
-        # 2. LLAVE ÚNICA: ID + Talla + Color (Permite variantes separadas)
-        item_key = f"{product_id}|{talla}|{color}"
+        # 2. Una línea por ID + Talla + Color (Permite variantes separadas)
+        carrito_db.agregar(request, producto, talla, color, imagen_url)
 
-        precio = float(producto.final_price)
-
-        if item_key in carrito:
-            carrito[item_key]['cantidad'] += 1
-            carrito[item_key]['subtotal'] = carrito[item_key]['cantidad'] * precio
-        else:
-            carrito[item_key] = {
-                'item_key': item_key,
-                'producto_id': producto.id,
-                'nombre': producto.name,
-                'precio': precio,
-                'talla': talla,
-                'color': color,
-                'imagen_url': imagen_url,
-                'cantidad': 1,
-                'subtotal': precio,
-                'disponible': True # Asegúrate de que tu lógica de stock actualice esto
-            }
-
-        request.session['carrito'] = carrito
-        request.session.modified = True
-        
         return JsonResponse({
             'status': 'ok', 
-            'cart_count': sum(item['cantidad'] for item in carrito.values())
+            'cart_count': carrito_db.contar_unidades(request)
         })
     
     return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=400)
@@ -259,18 +263,15 @@ from django.contrib import messages
 # ============================================================
 def actualizar_cantidad(request, item_key):
     """Suma o resta 1 a la cantidad de un item específico."""
-    carrito = request.session.get('carrito', {})
+    item = carrito_db.lineas_carrito(request).get(item_key)
     accion = request.POST.get('accion')
     
-    if item_key in carrito:
+    if item:
         if accion == 'sumar':
             # Nota: La validación de stock real se hace al renderizar 'ver_carrito'
-            carrito[item_key]['cantidad'] += 1
-        elif accion == 'restar' and carrito[item_key]['cantidad'] > 1:
-            carrito[item_key]['cantidad'] -= 1
-        
-        request.session['carrito'] = carrito
-        request.session.modified = True
+            carrito_db.cambiar_cantidad(request, item_key, item['cantidad'] + 1)
+        elif accion == 'restar' and item['cantidad'] > 1:
+            carrito_db.cambiar_cantidad(request, item_key, item['cantidad'] - 1)
 
     return redirect('store:ver_carrito')
 
@@ -279,13 +280,10 @@ def actualizar_cantidad(request, item_key):
 # ============================================================
 def eliminar_del_carrito(request, item_key):
     """Elimina una combinación específica de producto/talla/color."""
-    carrito = request.session.get("carrito", {})
+    item = carrito_db.lineas_carrito(request).get(item_key)
     
-    if item_key in carrito:
-        nombre_producto = carrito[item_key].get('nombre', 'Producto')
-        del carrito[item_key]
-        request.session["carrito"] = carrito
-        request.session.modified = True
+    if item and carrito_db.eliminar(request, item_key):
+        nombre_producto = item.get('nombre', 'Producto')
         messages.warning(request, f"{nombre_producto} fue eliminado del carrito.")
     else:
         messages.error(request, "El producto que intentas eliminar no existe.")
@@ -295,7 +293,7 @@ def eliminar_del_carrito(request, item_key):
         from django.http import JsonResponse
         return JsonResponse({
             "status": "ok", 
-            "cart_count": sum(i["cantidad"] for i in carrito.values()),
+            "cart_count": carrito_db.contar_unidades(request),
             "message": "Producto eliminado"
         })
     
@@ -307,10 +305,9 @@ def eliminar_del_carrito(request, item_key):
 # ============================================================
 def vaciar_carrito(request):
     """
-    Limpia el carrito de la sesión por completo.
+    Limpia el carrito por completo.
     """
-    request.session['carrito'] = {}
-    request.session.modified = True
+    carrito_db.vaciar(request)
     messages.info(request, "Tu carrito fue vaciado.")
     return redirect('store:ver_carrito')
 
@@ -321,21 +318,26 @@ def vaciar_carrito(request):
 from django.shortcuts import render, get_object_or_404
 from .models import Product
 
+@ensure_csrf_cookie  # el fragmento ya no trae csrf_token; store.js lo lee de la cookie
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=lambda request, product_id: etag_fragmento("carrito_modal", product_id))
 def carrito_modal(request, product_id):
-    # Usamos get_object_or_404 para que si el ID no existe, no explote el servidor
-    producto = get_object_or_404(Product, id=product_id)
-    
-    # Enviamos el producto tal cual. 
-    # La lógica de tallas la manejaremos en el HTML para no romper el Python.
-    return render(request, 'store/vista_carrito.html', {
-        'producto': producto
-    })
+    # Fragmento igual para todos: se sirve prerenderizado y el navegador
+    # revalida con If-None-Match (304 sin tocar la base de datos).
+    def renderizar():
+        # Usamos get_object_or_404 para que si el ID no existe, no explote el servidor
+        producto = get_object_or_404(Product.objects.prefetch_related('images'), id=product_id)
+        # La lógica de tallas la manejaremos en el HTML para no romper el Python.
+        return render_to_string('store/vista_carrito.html', {'producto': producto})
+
+    return HttpResponse(fragmento_producto("carrito_modal", product_id, renderizar))
 
 
 
 # ============================================================
 # 🏬 Vista: tienda principal (store.html)
 # ============================================================
+@presupuesto_consultas(12)
 def store(request):
     """
     Vista principal de la tienda:
@@ -429,7 +431,9 @@ from .models import ProductVariant, ProductImage, Product
 
 @login_required(login_url='/account/login/')
 def checkout(request):
-    carrito_data = request.session.get("carrito", {})
+    for aviso in carrito_db.avisos_precio(carrito_db.revalidar_precios(request)):
+        messages.warning(request, aviso)
+    carrito_data = carrito_db.lineas_carrito(request, fresco=True)
     
     if not carrito_data:
         return redirect('store:ver_carrito')
@@ -437,81 +441,153 @@ def checkout(request):
     items_confirmados = []
     subtotal_acumulado = Decimal("0")
 
-    for key, it in carrito_data.items():
-        p_id = it.get('producto_id')
-        color_val = str(it.get('color', '')).strip()
-        talla_val = str(it.get('talla', '')).strip()
-
-        # 1. 🛡️ VALIDACIÓN DE STOCK HÍBRIDA
-        variante = ProductVariant.objects.filter(
-            product_id=p_id, 
-            talla__iexact=talla_val, 
-            color__iexact=color_val
-        ).first()
-
-        if not variante:
-            variante = ProductVariant.objects.filter(product_id=p_id, talla__iexact=talla_val).first()
-
-        # Determinamos stock disponible
-        if variante:
-            stock_disponible = variante.stock
-        else:
-            producto_base = Product.objects.filter(id=p_id).first()
-            stock_disponible = producto_base.stock if producto_base else 0
+    # Variantes, productos e imágenes por color del carrito completo (antes: hasta 4 consultas por línea)
+    ids = [it.get('producto_id') for it in carrito_data.values()]
 
-        # Si el producto se agotó, lo saltamos
-        if stock_disponible <= 0:
-            continue
+    # ⚡ Productos en venta flash: se entra al checkout con cupo (fila de espera).
+    # Su stock son las fichas mientras estén cargadas, aunque la caché de ventas diga otra cosa.
+    ventas_flash = flash.ventas_activas()
+    for p_id in ids:
+        if p_id in ventas_flash and not flash.admitido(request, p_id):
+            return redirect('store:fila_flash', product_id=p_id)
+    en_fichas = flash.cargadas(ids)
 
-        # 2. 🔎 LÓGICA DE LA LUPA: Imagen por color
-        img_color = ProductImage.objects.filter(
-            product_id=p_id, 
-            color_vinculado__iexact=color_val
-        ).first()
+    cart_id, _ = carrito_db.firma_carrito(request, fresco=True)
+    imagenes = mapa_color_imagenes(ids)
 
-        url_imagen = img_color.image.url if img_color else it.get('imagen_url', '/static/icons/no-image.png')
+    # 🔒 Lectura de stock y reserva en la misma transacción: dos checkouts a la vez
+    # no pueden apartar la misma última unidad (ver store/utils/reservas.py).
+    # Lo que está en venta flash no se bloquea ni se reserva: su stock son fichas.
+    with transaction.atomic():
+        reservas.bloquear([p_id for p_id in ids if p_id not in en_fichas])
+        variantes = reservas.variantes_disponibles(ids, excluir_cart_id=cart_id)
+        por_talla = variantes_por_talla(variantes)
+        productos_db = reservas.productos_disponibles(ids, excluir_cart_id=cart_id)
+        renglones_reserva = []
+        ajustes = []  # (item_key, cantidad, nombre): lo que se recortó se guarda en el carrito
+
+        for key, it in carrito_data.items():
+            p_id = it.get('producto_id')
+            color_val = str(it.get('color', '')).strip()
+            talla_val = str(it.get('talla', '')).strip()
+
+            # 1. 🛡️ VALIDACIÓN DE STOCK HÍBRIDA (stock − reservas de otros clientes)
+            variante = variantes.get(clave_variante(p_id, talla_val, color_val))
+
+            if not variante:
+                variante = por_talla.get((int(p_id), talla_val.upper()))
+
+            # Determinamos stock disponible
+            if p_id in en_fichas:
+                stock_disponible = flash.restantes(p_id, talla_val, color_val)
+            elif variante:
+                stock_disponible = variante.disponible
+            else:
+                producto_base = productos_db.get(p_id)
+                stock_disponible = producto_base.disponible if producto_base else 0
 
-        # 3. Limpieza de nombres (Ocultar "Único/a")
-        talla_display = None if talla_val in ["Única", "Único", "None", ""] else talla_val
-        color_display = None if color_val in ["Única", "Único", "None", ""] else color_val
+            # Si el producto se agotó, lo saltamos
+            if stock_disponible <= 0:
+                CONFLICTOS_STOCK.labels(vista="checkout").inc()
+                ajustes.append((key, 0, it.get('nombre')))
+                continue
 
-        precio = Decimal(str(it.get('precio', 0)))
-        cantidad = it.get('cantidad', 1)
-        
-        if cantidad > stock_disponible:
-            cantidad = stock_disponible
+            # 2. 🔎 LÓGICA DE LA LUPA: Imagen por color
+            url_imagen = imagen_de_color(imagenes, p_id, color_val) or it.get('imagen_url', '/static/icons/no-image.png')
 
-        total_item = precio * cantidad
-        subtotal_acumulado += total_item
+            # 3. Limpieza de nombres (Ocultar "Único/a")
+            talla_display = None if talla_val in ["Única", "Único", "None", ""] else talla_val
+            color_display = None if color_val in ["Única", "Único", "None", ""] else color_val
 
-        items_confirmados.append({
-            'nombre': it.get('nombre'),
-            'cantidad': cantidad,
-            'precio': precio,
-            'total_item': total_item,
-            'talla': talla_display, 
-            'color': color_display, 
-            'imagen': url_imagen
-        })
+            precio = Decimal(str(it.get('precio', 0)))
+            cantidad = it.get('cantidad', 1)
+            
+            if cantidad > stock_disponible:
+                cantidad = stock_disponible
+                CONFLICTOS_STOCK.labels(vista="checkout").inc()
+                ajustes.append((key, cantidad, it.get('nombre')))
+
+            total_item = precio * cantidad
+            subtotal_acumulado += total_item
+            if p_id not in en_fichas:
+                renglones_reserva.append((p_id, variante.id if variante else None, cantidad))
+
+            producto_base = productos_db.get(p_id)
+            items_confirmados.append({
+                'item_key': key,
+                'producto_id': p_id,
+                'categoria_id': producto_base.category_id if producto_base else None,
+                'nombre': it.get('nombre'),
+                'cantidad': cantidad,
+                'precio': precio,
+                'total_item': total_item,
+                'talla': talla_display, 
+                'color': color_display, 
+                'imagen': url_imagen
+            })
+
+        # 4. Apartamos lo confirmado (reemplaza la reserva anterior de este carrito)
+        reserva_expira = reservas.reservar(cart_id, renglones_reserva) if cart_id else None
+
+    # generar_factura cobra lo que quedó en el carrito: debe ser lo que aquí se mostró
+    for key, cantidad, nombre in ajustes:
+        carrito_db.cambiar_cantidad(request, key, cantidad)
+        if cantidad:
+            messages.warning(request, f"Solo quedan {cantidad} unidades de {nombre}; ajustamos tu carrito.")
+        else:
+            messages.warning(request, f"{nombre} se agotó y lo quitamos de tu carrito.")
 
     if not items_confirmados:
-        from django.contrib import messages
         messages.error(request, "Los productos en tu carrito ya no están disponibles.")
+        CHECKOUT.labels(resultado="sin_stock").inc()
         return redirect('store:ver_carrito')
 
+    # 🏷️ Promociones y cupón: todo el carrito en una pasada sobre las reglas compiladas
+    cupon = promociones.cupon_de(request)
+    promo = promociones.evaluar(
+        ((i['item_key'], i['producto_id'], i['categoria_id'], i['precio'], i['cantidad']) for i in items_confirmados),
+        codigo=cupon,
+    )
+    for i in items_confirmados:
+        i['descuento'], i['promocion'] = promo.de(i['item_key'])
+    promociones.guardar_visto(request, promo.descuento)  # generar_factura no cobra otra rebaja
+    if cupon and promo.cupon != cupon:
+        messages.info(request, f"El cupón {cupon} no aplica a los productos de tu carrito.")
+
     # Cálculos finales (SIN IVA)
-    total_final = subtotal_acumulado
+    total_final = subtotal_acumulado - promo.descuento
 
     context = {
         'items': items_confirmados,
         'subtotal': subtotal_acumulado,
-        'total': total_final, # El total es igual al subtotal
+        'descuento_promociones': promo.descuento,
+        'cupon': cupon,
+        'total': total_final,
+        'reserva_expira': reserva_expira,
     }
     
     return render(request, 'store/checkout.html', context)
 
 
 
+# ============================================================
+# 🏷️ Vista: aplicar / quitar cupón
+# ============================================================
+@login_required(login_url='/account/login/')
+@require_POST
+def aplicar_cupon(request):
+    """Guarda el cupón en la sesión; el descuento se calcula en el checkout y al facturar."""
+    codigo = promociones.normalizar(request.POST.get('codigo'))
+    if not codigo or 'quitar' in request.POST:
+        promociones.guardar_cupon(request, None)
+    elif promociones.cupon_vigente(codigo):
+        promociones.guardar_cupon(request, codigo)
+        messages.success(request, f"Cupón {codigo} aplicado.")
+    else:
+        messages.error(request, f"El cupón {codigo} no existe o no está vigente.")
+    return redirect('store:checkout')
+
+
 # ============================================================
 # 🧾 Vista: generar factura (COMPLETA Y COMPATIBLE)
 # ============================================================
@@ -525,13 +601,79 @@ def generar_factura(request):
     if request.method != "POST":
         return redirect("store:checkout")
 
+    # Si un precio cambió mientras pagaba, se vuelve al checkout con el total nuevo
+    cambios = carrito_db.revalidar_precios(request)
+    if cambios:
+        for aviso in carrito_db.avisos_precio(cambios):
+            messages.warning(request, aviso)
+        return redirect("store:checkout")
+
     items_carrito = _items_carrito(request)
     
     if not items_carrito:
         return redirect("store:ver_carrito")
 
     nombre_cliente = request.POST.get("nombre")
-    total_final = sum(item['subtotal'] for item in items_carrito)
+    # 🏷️ Mismas reglas que mostró el checkout; cada detalle guarda su rebaja
+    promo = promociones.evaluar(
+        ((i['item_key'], i['producto_id'], i['producto'].category_id, i['precio'], i['cantidad']) for i in items_carrito),
+        codigo=promociones.cupon_de(request),
+    )
+    for i in items_carrito:
+        i['descuento'], i['promocion'] = promo.de(i['item_key'])
+    # Una promoción terminó o el cupón dejó de aplicar desde el checkout: no se cobra otro total
+    if promo.descuento != promociones.descuento_visto(request):
+        messages.warning(request, "Las promociones de tu carrito cambiaron; revisa el nuevo total antes de pagar.")
+        return redirect("store:checkout")
+    total_final = sum(item['subtotal'] for item in items_carrito) - promo.descuento
+    cart_id, _ = carrito_db.firma_carrito(request, fresco=True)
+
+    # ⚡ Venta flash: primero las fichas (caché, sin bloquear filas); si alguna
+    # no alcanza no se crea la factura y se devuelven las ya tomadas
+    ventas_flash = flash.ventas_activas()
+    en_fichas = flash.cargadas(i['producto_id'] for i in items_carrito)
+    en_flash = [i for i in items_carrito if i['producto_id'] in en_fichas]
+    for i in en_flash:
+        if i['producto_id'] in ventas_flash and not flash.admitido(request, i['producto_id']):
+            return redirect('store:fila_flash', product_id=i['producto_id'])
+    reclamadas = []
+    for i in en_flash:
+        linea = (i['producto_id'], i['talla'], i['color'], i['cantidad'])
+        if not flash.reclamar(*linea):
+            for tomada in reclamadas:
+                flash.devolver(*tomada)
+            messages.error(request, f"{i['nombre']} se agotó en la venta flash.")
+            CHECKOUT.labels(resultado="sin_stock").inc()
+            return redirect("store:ver_carrito")
+        reclamadas.append(linea)
+
+    try:
+        factura = _crear_factura(request, items_carrito, total_final, nombre_cliente, en_fichas, cart_id, promo)
+    except reservas.StockInsuficiente as agotado:
+        # Otro cliente tiene apartadas (o ya compró) esas unidades: el checkout ajusta el pedido
+        for tomada in reclamadas:
+            flash.devolver(*tomada)
+        messages.error(request, f"{agotado.nombre} ya no tiene stock suficiente; revisa tu pedido.")
+        CONFLICTOS_STOCK.labels(vista="generar_factura").inc()
+        CHECKOUT.labels(resultado="sin_stock").inc()
+        return redirect("store:checkout")
+    except Exception:
+        for tomada in reclamadas:
+            flash.devolver(*tomada)
+        raise
+
+    for p_id in {i['producto_id'] for i in en_flash}:
+        flash.salir(request, p_id)
+    carrito_db.vaciar(request)
+    promociones.guardar_cupon(request, None)
+    CHECKOUT.labels(resultado="exito").inc()
+    
+    return render(request, "store/confirmacion_pago.html", {"factura": factura})
+
+
+def _crear_factura(request, items_carrito, total_final, nombre_cliente, en_fichas, cart_id, promo):
+    """Factura, detalles y descuento de stock en una transacción (las líneas flash ya se cobraron en fichas)."""
+    from .models import Factura, DetalleFactura
 
     with transaction.atomic():
         factura = Factura.objects.create(
@@ -544,41 +686,65 @@ def generar_factura(request):
             telefono=request.POST.get("telefono"),
             direccion=request.POST.get("direccion"),
             ciudad=request.POST.get("ciudad"),
-            departamento=request.POST.get("departamento")
+            departamento=request.POST.get("departamento"),
+            descuento=promo.descuento,
+            cupon=promo.cupon,
         )
 
+        # 🔒 Stock − reservas de otros carritos, con las filas bloqueadas; si algo no
+        # alcanza, StockInsuficiente deshace la factura entera.
+        # En venta flash el stock ya salió de las fichas; la base se pone al día con manage.py venta_flash
+        reservas.descontar(cart_id, [
+            (i['producto_id'], i['talla'], i['color'], i['cantidad'], i['nombre'])
+            for i in items_carrito if i['producto_id'] not in en_fichas
+        ])
+
         for i in items_carrito:
             prod = i['producto']
 
-            variante = ProductVariant.objects.filter(
-                product=prod, 
-                talla__iexact=i['talla'], 
-                color__iexact=i['color']
-            ).first()
-
-            if variante:
-                variante.stock -= i["cantidad"]
-                variante.save()
-                prod.actualizar_stock_total()
-            else:
-                Product.objects.filter(id=prod.id).update(stock=models.F('stock') - i["cantidad"])
-
             # 4. Crear Detalle (SIN campos nuevos para evitar el TypeError)
             # Solo usamos los campos que ya existen en tu modelo
             DetalleFactura.objects.create(
                 factura=factura,
                 producto=prod,
                 cantidad=i["cantidad"],
-                subtotal=i["subtotal"],
+                subtotal=i["subtotal"] - i["descuento"],
+                descuento=i["descuento"],
+                promocion=i["promocion"],
                 talla=i['talla'],
                 color=i['color'],
                 imagen_url=i['imagen_url']
             )
 
-    request.session["carrito"] = {}
-    request.session.modified = True
-    
-    return render(request, "store/confirmacion_pago.html", {"factura": factura})
+        # El descuento real de stock reemplaza lo apartado en el checkout
+        reservas.liberar(cart_id)
+    return factura
+
+# ============================================================
+# 🚦 Vista: fila de espera de la venta flash
+# ============================================================
+@login_required(login_url='/account/login/')
+def fila_flash(request, product_id):
+    """
+    Página de espera antes del checkout de un producto en venta flash. La
+    página consulta esta misma URL por AJAX; cada consulta mantiene vivo el
+    turno y devuelve cuántos clientes hay delante.
+    """
+    venta = flash.ventas_activas().get(product_id)
+    if venta is None:
+        return redirect('store:checkout')
+
+    flash.asegurar_fichas(product_id)
+    estado = flash.hacer_fila(request, product_id, venta["cupo"])
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({**estado, "checkout": reverse('store:checkout')})
+    if estado["admitido"]:
+        return redirect('store:checkout')
+
+    producto = get_object_or_404(Product, id=product_id)
+    return render(request, 'store/fila_flash.html', {"producto": producto, "adelante": estado["adelante"]})
+
 
 # ============================================================
 # 🧾 Vista: ver factura
@@ -596,7 +762,7 @@ def ver_factura(request, factura_id):
         "items": factura.detalles.all(),  # ✅ usar related_name
         "subtotal": factura.total - factura.total * Decimal('0.19'),
         "iva": factura.total * Decimal('0.19'),
-        "descuento": Decimal('0.00'),
+        "descuento": factura.descuento,
         "total_final": factura.total,
         "estado_pago": factura.estado_pago,
     }
@@ -610,23 +776,38 @@ from django.core.paginator import Paginator
 @login_required(login_url='/account/login/')
 def mis_facturas(request):
     """
-    Muestra el historial de compras optimizado con precarga de detalles
-    y paginación profesional.
+    Historial de compras paginado. Conteo de líneas y unidades anotados en SQL,
+    y solo las 3 primeras líneas de cada factura precargadas (Prefetch con
+    slice → ROW_NUMBER() por factura). Un solo COUNT (sin los JOIN de las
+    anotaciones) sirve al paginador y a ``total_pedidos``.
     """
     from django.core.paginator import Paginator
-    from .models import Factura
-
-    # Usamos prefetch_related('detalles') para cargar los productos de una vez
-    facturas_list = Factura.objects.filter(usuario=request.user).prefetch_related('detalles').order_by('-fecha')
+    from django.db.models import Count, Prefetch, Sum
+
+    primeros_detalles = Prefetch(
+        'detalles',
+        queryset=DetalleFactura.objects.select_related('producto').only(
+            'id', 'factura_id', 'imagen_url', 'producto__name'
+        ).order_by('id')[:3],
+        to_attr='primeros_detalles',
+    )
+    mis_facturas_qs = Factura.objects.filter(usuario=request.user)
+    facturas_list = (
+        mis_facturas_qs
+        .annotate(n_lineas=Count('detalles'), n_unidades=Sum('detalles__cantidad'))
+        .prefetch_related(primeros_detalles)
+        .order_by('-fecha', '-id')
+    )
 
     # Paginación: 8 por página para que no se vea muy cargado
     paginator = Paginator(facturas_list, 8)
+    paginator.count = mis_facturas_qs.count()  # cached_property: el paginador no vuelve a contar
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
     context = {
         'facturas': page_obj,
-        'total_pedidos': facturas_list.count()
+        'total_pedidos': paginator.count,
     }
 
     return render(request, 'store/mis_facturas.html', context)
@@ -641,10 +822,11 @@ def generar_factura_pdf(request, factura_id):
     from django.utils.timezone import localtime # Aseguramos la importación
     
     factura = get_object_or_404(Factura, id=factura_id, usuario=request.user)
-    detalles = DetalleFactura.objects.filter(factura=factura)
+    detalles = DetalleFactura.objects.filter(factura=factura).select_related("producto")
 
-    # 🧮 Totales (Sincronizados con Checkout: Sin IVA)
-    subtotal = sum(d.subtotal for d in detalles)
+    # 🧮 Totales (Sincronizados con Checkout: Sin IVA). d.subtotal ya viene neto de promociones
+    subtotal = sum(d.subtotal + d.descuento for d in detalles)
+    descuento_promociones = sum(d.descuento for d in detalles)
     
     # El ahorro se calcula sobre el precio base 'cost' vs 'final_price'
     ahorro_total = sum(
@@ -654,7 +836,7 @@ def generar_factura_pdf(request, factura_id):
 
     # IVA en 0.00 según tu requerimiento de no utilizarlo más
     iva = Decimal("0.00")
-    total = subtotal # El total es el subtotal directamente
+    total = subtotal - descuento_promociones
 
     # 🧾 Generar PDF
     buffer = BytesIO()
@@ -683,8 +865,8 @@ def generar_factura_pdf(request, factura_id):
         nombre_final = d.nombre_producto if hasattr(d, 'nombre_producto') and d.nombre_producto else \
                        getattr(d.producto, 'name', getattr(d.producto, 'nombre', 'Producto'))
 
-        # Calculamos el unitario real para evitar discrepancias
-        unitario_real = d.subtotal / d.cantidad if d.cantidad > 0 else 0
+        # Calculamos el unitario real (antes de la promoción) para evitar discrepancias
+        unitario_real = (d.subtotal + d.descuento) / d.cantidad if d.cantidad > 0 else 0
         
         data.append([
             nombre_final.upper(), # Nombre en mayúsculas para que resalte
@@ -692,8 +874,10 @@ def generar_factura_pdf(request, factura_id):
             c_display,
             d.cantidad,
             f"${unitario_real:,.0f}",
-            f"${d.subtotal:,.0f}",
+            f"${d.subtotal + d.descuento:,.0f}",
         ])
+        if d.descuento > 0:
+            data.append([f"   {d.promocion or 'Promoción'}", "", "", "", "", f"-${d.descuento:,.0f}"])
 
     # Configuración de la tabla (Manteniendo tus colWidths)
     table = Table(data, hAlign='LEFT', colWidths=[180, 60, 60, 40, 80, 80])
@@ -718,11 +902,15 @@ def generar_factura_pdf(request, factura_id):
     elements.append(Paragraph(f"<b>Subtotal:</b> ${subtotal:,.0f}", style_right))
     if ahorro_total > 0:
         elements.append(Paragraph(f"<font color='#1a237e'><b>Usted ahorró:</b> ${ahorro_total:,.0f}</font>", style_right))
+    if descuento_promociones > 0:
+        cupon = f" (cupón {factura.cupon})" if factura.cupon else ""
+        elements.append(Paragraph(f"<b>Promociones{cupon}:</b> -${descuento_promociones:,.0f}", style_right))
     
     elements.append(Spacer(1, 5))
     elements.append(Paragraph(f"<font size=14 color='#1a237e'><b>TOTAL A PAGAR:</b> ${total:,.0f}</font>", style_right))
 
-    doc.build(elements)
+    with cronometrar(RENDER_PDF, documento="factura"):
+        doc.build(elements)
     pdf = buffer.getvalue()
     buffer.close()
 
@@ -786,7 +974,7 @@ def enviar_factura_por_correo(factura, usuario, contexto=None):
             "factura": factura,
             "subtotal": subtotal,
             "iva": iva,
-            "descuento": Decimal('0.00'),
+            "descuento": factura.descuento,
             "total_final": factura.total,
             "banco": factura.banco,
             "fecha_local": factura.fecha,
@@ -818,7 +1006,8 @@ def enviar_factura_por_correo(factura, usuario, contexto=None):
     tabla.setStyle(TableStyle([('BACKGROUND', (0,0), (-1,0), colors.grey), ('GRID', (0,0), (-1,-1), 1, colors.black)]))
     elementos.append(tabla)
 
-    doc.build(elementos)
+    with cronometrar(RENDER_PDF, documento="factura_correo"):
+        doc.build(elementos)
     buffer.seek(0)
     
     email = EmailMessage(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [usuario.email])
@@ -826,21 +1015,23 @@ def enviar_factura_por_correo(factura, usuario, contexto=None):
     email.send()
 
 
-@login_required(login_url='/account/login/')
+@ensure_csrf_cookie  # el fragmento ya no trae csrf_token; store.js lo lee de la cookie
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=lambda request, id: etag_fragmento("vista_rapida", id))
 def vista_rapida(request, id):
-    producto = get_object_or_404(Product, id=id)
-    variantes = ProductVariant.objects.filter(product=producto)
-    
-    # 🎯 Aseguramos que los nombres coincidan con tu HTML:
-    talla_list = variantes.values_list('talla', flat=True).distinct().order_by('talla')
-    color_list = variantes.values_list('color', flat=True).distinct().order_by('color')
+    # Abierta también a visitantes: el fragmento no depende del usuario
+    def renderizar():
+        producto = get_object_or_404(Product.objects.prefetch_related('images'), id=id)
+        # 🎯 Tallas, colores y stock por combinación en una sola consulta (cacheada)
+        matriz = matriz_stock(producto.id)
+        return render_to_string('store/vista_rapida.html', {
+            'producto': producto,
+            'talla_list': matriz['tallas'],
+            'color_list': matriz['colores'],
+            'matriz_stock': matriz,
+        })
 
-    context = {
-        'producto': producto,
-        'talla_list': talla_list, # <-- Tu HTML usa producto.talla_list, cámbialo a 'talla_list'
-        'color_list': color_list, # <-- Igual aquí
-    }
-    return render(request, 'store/vista_rapida.html', context)
+    return HttpResponse(fragmento_producto("vista_rapida", id, renderizar))
 
 # ============================================================
 # 🏦 Vista: widget de pago bancario (VERSION ESTABILIZADA)
@@ -904,46 +1095,49 @@ def confirmacion_pago(request):
             # 🛡️ Solo descontamos stock si la factura aún figura como "Pendiente"
             # Esto evita que si el usuario refresca la página, se descuente doble.
             if factura.estado_pago == "Pendiente":
-                with transaction.atomic():
-                    for detalle in factura.detalles.all():
-                        p_id = detalle.producto.id
-                        cantidad = detalle.cantidad
-                        # Intentamos limpiar valores para buscar en la matriz
-                        t_val = detalle.talla.strip() if detalle.talla else ""
-                        c_val = detalle.color.strip() if detalle.color else ""
-
-                        # 1. Buscamos en la matriz (Variantes)
-                        variante = ProductVariant.objects.filter(
-                            product_id=p_id, 
-                            talla__iexact=t_val, 
-                            color__iexact=c_val
-                        ).first()
-
-                        if variante:
-                            # 📉 DESCUENTO DOBLE: Restamos de la variante específica
-                            variante.stock -= cantidad
-                            variante.save()
-                            
-                            # 📉 Y restamos también del Stock General del producto
-                            producto_base = detalle.producto
-                            producto_base.stock -= cantidad
-                            producto_base.save()
-                        else:
-                            # 2. Si no hay matriz (ej. Gym), descontamos solo del Stock General
-                            producto = detalle.producto
-                            producto.stock -= cantidad
-                            producto.save()
-
-                    # Marcar como pagado definitivamente tras descontar stock
-                    factura.estado_pago = "Pagado"
-                    
-                    # 🧹 VACIAR EL CARRITO: Compra exitosa, carrito limpio
-                    if 'carrito' in request.session:
-                        del request.session['carrito']
-                        request.session.modified = True
+                cart_id = carrito_db.firma_carrito(request, fresco=True)[0]
+                lineas = [
+                    (d.producto_id, d.talla, d.color, d.cantidad, d.producto.name)
+                    for d in factura.detalles.select_related("producto")
+                ]
+                en_fichas = flash.cargadas(linea[0] for linea in lineas)
+                reclamadas = []
+                try:
+                    with transaction.atomic():
+                        # ⚡ Lo que está en venta flash sale de las fichas (la base la concilia el comando)
+                        for p_id, talla, color, cantidad, nombre in lineas:
+                            if p_id in en_fichas:
+                                if not flash.reclamar(p_id, talla, color, cantidad):
+                                    raise reservas.StockInsuficiente(nombre)
+                                reclamadas.append((p_id, talla, color, cantidad))
+
+                        # 📉 Mismo descuento que generar_factura: stock − reservas de otros
+                        # carritos, UPDATE condicionado y total del producto recalculado
+                        reservas.descontar(cart_id, [linea for linea in lineas if linea[0] not in en_fichas])
+
+                        # Marcar como pagado definitivamente tras descontar stock
+                        factura.estado_pago = "Pagado"
+                        CHECKOUT.labels(resultado="exito").inc()
+
+                        # 🧹 VACIAR EL CARRITO: Compra exitosa, carrito limpio (y sin reservas)
+                        reservas.liberar(cart_id)
+                        carrito_db.vaciar(request)
+                except reservas.StockInsuficiente as agotado:
+                    for tomada in reclamadas:
+                        flash.devolver(*tomada)
+                    # Cobrado pero sin unidades: queda marcada para que la tienda reembolse
+                    factura.estado_pago = "Sin stock"
+                    messages.error(request, f"{agotado.nombre} se agotó mientras pagabas; te contactaremos para el reembolso.")
+                    CONFLICTOS_STOCK.labels(vista="confirmacion_pago").inc()
+                    CHECKOUT.labels(resultado="sin_stock").inc()
+                except Exception:
+                    for tomada in reclamadas:
+                        flash.devolver(*tomada)
+                    raise
             
         elif estado == "DECLINED":
             factura.estado_pago = "Fallido"
+            CHECKOUT.labels(resultado="rechazado").inc()
         else:
             factura.estado_pago = "Pagado"
 
@@ -966,10 +1160,13 @@ def confirmacion_pago(request):
 
     return render(request, "store/confirmacion_pago.html", {"estado": estado, "referencia": referencia})
 
+@presupuesto_consultas(12)
 def detalle_producto(request, slug):
     producto = get_object_or_404(Product, slug=slug)
     context = {
         'producto': producto,
+        'mapa_colores': mapa_color_imagenes([producto.id]).get(producto.id, {}),
+        'matriz_stock': matriz_stock(producto.id),
         'colors': producto.color_list,
         'video_file': producto.video_file,
         'video_url': producto.video_url,
@@ -979,53 +1176,153 @@ def detalle_producto(request, slug):
 
 
 # ============================================================
-# 🔄 Vista: actualizar cantidad en carrito
+# 🧾 Vista: carrito en JSON (mini-carrito y contador del navbar)
 # ============================================================
-def actualizar_cantidad(request, item_key):
-    carrito = request.session.get('carrito', {})
-    accion = request.POST.get('accion')
-    
-    # Ahora buscamos directamente por la llave (que es ID|TALLA|COLOR)
-    if item_key in carrito:
-        if accion == 'sumar':
-            carrito[item_key]['cantidad'] += 1
-        elif accion == 'restar' and carrito[item_key]['cantidad'] > 1:
-            carrito[item_key]['cantidad'] -= 1
-        
-        request.session['carrito'] = carrito
-        request.session.modified = True
-
-    return redirect('store:ver_carrito')
+def _etag_carrito(request):
+    """Cambia si cambia el carrito (id + versión) o el catálogo (nombres); el modo resumen tiene el suyo."""
+    cart_id, version = carrito_db.firma_carrito(request)
+    modo = "r" if request.GET.get("resumen") else "c"
+    return f'"carrito-{cart_id}-{version}-{version_catalogo()}-{modo}"'
 
 
-# views.py
-from django.http import JsonResponse
+@cache_control(private=True, no_cache=True)  # el navegador revalida con If-None-Match → 304
+@condition(etag_func=_etag_carrito)
 def obtener_carrito_json(request):
-    carrito = request.session.get("carrito", {})
+    """
+    Carrito completo para el side cart o, con ``?resumen=1``, solo unidades y
+    total para refrescar el contador. Con caché compartida las líneas salen de
+    la caché del carrito (ver store/utils/carrito.py) y un 304 no toca la base
+    de datos; sin ella cuesta una consulta.
+    """
+    carrito = carrito_db.lineas_carrito(request)
+    total_acumulado = sum(
+        (Decimal(str(item["precio"])) * item["cantidad"] for item in carrito.values()), Decimal("0")
+    )
+    respuesta = {
+        "total_carrito": formatear_numero(total_acumulado),
+        "cart_count": sum(item["cantidad"] for item in carrito.values()),
+        "status": "ok",
+    }
+    if request.GET.get("resumen"):
+        return JsonResponse(respuesta)
+
     items_listado = []
-    total_acumulado = 0
-    
     for key, item in carrito.items():
-        # Convertimos a float para cálculos seguros
-        precio_num = float(item.get('precio', 0))
-        cantidad = int(item.get('cantidad', 0))
-        subtotal_item = precio_num * cantidad
-        total_acumulado += subtotal_item
-        
-        # Creamos una copia para añadir los campos que el JS necesita
+        # Copia con los campos que el JS necesita (precio_formateado evita el "undefined")
         item_data = item.copy()
-        item_data['item_key'] = key
-        # ESTA VARIABLE ES LA QUE QUITA EL UNDEFINED:
-        item_data['precio_formateado'] = f"{precio_num:,.0f}".replace(",", ".")
+        item_data["item_key"] = key
+        item_data["precio_formateado"] = formatear_numero(item["precio"])
         items_listado.append(item_data)
-    
+    respuesta["carrito_completo"] = items_listado
+    return JsonResponse(respuesta)
+
+
+# ============================================================
+# 🔁 Vista: API JSON del carrito (respuesta delta)
+# ============================================================
+@require_POST
+def carrito_api(request):
+    """
+    Agregar, fijar cantidad, eliminar y vaciar sin recargar la página.
+    Recibe JSON ``{"ops": [{"op": "cantidad", "item_key": "12|M|Negro", "cantidad": 3}, ...]}``
+    (o una sola operación suelta) y responde solo las líneas que cambiaron
+    (``null`` = eliminada) y los totales nuevos. Los formularios de
+    actualizar_cantidad / vaciar_carrito quedan como respaldo sin JavaScript.
+    """
+    try:
+        datos = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "JSON inválido"}, status=400)
+
+    operaciones = datos.get("ops", [datos] if "op" in datos else None) if isinstance(datos, dict) else None
+    if not isinstance(operaciones, list) or not 0 < len(operaciones) <= carrito_db.MAX_OPERACIONES:
+        return JsonResponse({"status": "error", "message": "Operaciones inválidas"}, status=400)
+
+    lineas, stock, tocadas, avisos, ajustes = carrito_db.aplicar_operaciones(request, operaciones)
+    if ajustes:
+        CONFLICTOS_STOCK.labels(vista="carrito_api").inc(ajustes)
+
     return JsonResponse({
-        "carrito_completo": items_listado,
-        "total_carrito": f"{total_acumulado:,.0f}".replace(",", "."),
-        "cart_count": sum(item['cantidad'] for item in carrito.values()),
-        "status": "ok"
+        "status": "ok",
+        "lineas": {
+            key: carrito_db.linea_json(key, lineas[key], stock[key]) if key in lineas else None
+            for key in tocadas
+        },
+        "totales": carrito_db.totales(lineas, stock),
+        "avisos": avisos,
     })
-    
+
+
+# ============================================================
+# ⏱️ Vista: métricas de consultas por vista (solo staff)
+# ============================================================
+@staff_member_required
+def metricas_consultas(request):
+    """
+    Consultas SQL, tiempo en DB y consultas repetidas agregadas por nombre
+    de URL desde que arrancó este proceso (ver store/instrumentacion.py).
+    """
+    return JsonResponse({"vistas": resumen_metricas()})
+
+# ============================================================
+# 📈 Vista: métricas en formato Prometheus
+# ============================================================
+def metricas_prometheus(request):
+    """
+    Exporta las métricas de store/metricas.py. Acceso para staff con sesión
+    o para el scraper con la cabecera 'Authorization: Bearer <METRICAS_TOKEN>'.
+    """
+    token = getattr(settings, "METRICAS_TOKEN", "")
+    autorizado = request.user.is_authenticated and request.user.is_staff
+    if not autorizado and token:
+        autorizado = constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if not autorizado:
+        return HttpResponse("No autorizado", status=403, content_type="text/plain")
+
+    contenido, content_type = exportar()
+    return HttpResponse(contenido, content_type=content_type)
+
+# ============================================================
+# 📤 Vista: exportaciones en streaming (solo staff)
+# ============================================================
+@staff_member_required
+def exportar_datos(request, tipo):
+    """
+    Descarga el catálogo o las ventas en CSV o JSON Lines sin armar el archivo
+    en memoria. Filtros por GET: formato=csv|jsonl, categoria=<slug>,
+    desde/hasta=AAAA-MM-DD (solo ventas) y gzip=1.
+    """
+    if tipo not in EXPORTACIONES:
+        raise Http404("Exportación desconocida")
+    generador, columnas = EXPORTACIONES[tipo]
+
+    formato = request.GET.get("formato", "csv")
+    if formato not in ("csv", "jsonl"):
+        return HttpResponse("Formato no soportado", status=400, content_type="text/plain")
+
+    filtros = {"categoria": request.GET.get("categoria") or None}
+    if tipo == "ventas":
+        for campo in ("desde", "hasta"):
+            valor = request.GET.get(campo)
+            if valor:
+                try:
+                    filtros[campo] = parse_date(valor)
+                except ValueError:
+                    filtros[campo] = None
+                if filtros[campo] is None:
+                    return HttpResponse(f"Fecha inválida en '{campo}'", status=400, content_type="text/plain")
+
+    comprimir = request.GET.get("gzip") in ("1", "true")
+    nombre = f"{tipo}-{localtime().strftime('%Y%m%d-%H%M')}.{formato}" + (".gz" if comprimir else "")
+    content_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson; charset=utf-8"
+
+    respuesta = StreamingHttpResponse(
+        codificar(serializar(generador(**filtros), formato, columnas), comprimir),
+        content_type="application/gzip" if comprimir else content_type,
+    )
+    respuesta["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    return respuesta
+
 # ============================================================
 # 🌐 Vistas informativas
 # ============================================================
@@ -7,9 +7,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy
 from django.contrib.auth.views import PasswordResetView
-
-# 📊 Funciones de agregación para métricas
-from django.db.models import Sum
+from django.core.cache import cache
 
 # 🧾 Formularios personalizados
 from .forms import LoginForm, UserRegistrationForm
@@ -17,10 +15,16 @@ from .forms import LoginForm, UserRegistrationForm
 # 📦 Modelos de pedidos y productos
 from pedidos.models import Order   # ✅ usamos Order, no Pedido
 from store.models import Product, Factura
+from store.utils.reportes import resumen_cliente
+from store.utils.cache import version_catalogo
 
 # 👤 Modelo de usuario activo
 User = get_user_model()
 
+# 📦 Tabla de productos del dashboard
+PRODUCTOS_POR_PAGINA = 25
+CACHE_DASHBOARD_SEGUNDOS = 300
+
 
 # 🏠 Vista principal del sitio (portada en "/")
 def inicio(request):
@@ -51,21 +55,81 @@ def login_view(request):
     return render(request, 'account/login.html', {'form': form})
 
 
+# 📦 Página de productos para el dashboard (keyset por id, cacheada por versión de catálogo)
+def _pagina_productos(despues=None, antes=None):
+    clave = f"dashboard:productos:{version_catalogo()}:{despues}:{antes}"
+    pagina = cache.get(clave)
+    if pagina is not None:
+        return pagina
+
+    qs = Product.objects.filter(is_available=True).only(
+        "id", "name", "image", "image_derivadas", "cost", "discount", "stock", "is_available",
+        "talla", "color", "destacado", "nuevo", "is_tax_exempt",
+    )
+    if antes:
+        productos = list(qs.filter(id__lt=antes).order_by("-id")[:PRODUCTOS_POR_PAGINA + 1])
+        hay_anterior = len(productos) > PRODUCTOS_POR_PAGINA
+        productos = productos[:PRODUCTOS_POR_PAGINA][::-1]
+        hay_siguiente = True
+    else:
+        if despues:
+            qs = qs.filter(id__gt=despues)
+        productos = list(qs.order_by("id")[:PRODUCTOS_POR_PAGINA + 1])
+        hay_siguiente = len(productos) > PRODUCTOS_POR_PAGINA
+        productos = productos[:PRODUCTOS_POR_PAGINA]
+        hay_anterior = bool(despues)
+
+    # Se guardan filas ya resueltas: sin split de talla/color ni image.url por render
+    pagina = {
+        "filas": [
+            {
+                "name": p.name,
+                "image_url": p.image.url if p.image else "",
+                "image_derivadas": p.image_derivadas,
+                "final_price": p.final_price,
+                "discount": p.discount,
+                "stock": p.stock,
+                "is_available": p.is_available,
+                "color_list": p.color_list,
+                "talla_list": p.talla_list,
+                "destacado": p.destacado,
+                "nuevo": p.nuevo,
+                "is_tax_exempt": p.is_tax_exempt,
+            }
+            for p in productos
+        ],
+        "primero": productos[0].id if productos else None,
+        "ultimo": productos[-1].id if productos else None,
+        "hay_anterior": hay_anterior and bool(productos),
+        "hay_siguiente": hay_siguiente and bool(productos),
+    }
+    cache.set(clave, pagina, CACHE_DASHBOARD_SEGUNDOS)
+    return pagina
+
+
+def _entero_o_none(valor):
+    try:
+        return int(valor) if valor else None
+    except ValueError:
+        return None
+
+
 # 🧑‍💼 Vista del dashboard privado con métricas y pedidos
 @login_required
 def dashboard(request):
     usuario = request.user
 
-    # 🔢 Métricas
-    total_pedidos = Factura.objects.filter(usuario=usuario).count()
-    productos_publicados = Product.objects.filter(is_available=True).count()
+    # 🔢 Métricas (desde el rollup del cliente, sin agregar sobre Factura)
+    resumen = resumen_cliente(usuario)
+    total_pedidos = resumen.facturas
+    productos_publicados = cache.get_or_set(
+        f"dashboard:publicados:{version_catalogo()}",
+        lambda: Product.objects.filter(is_available=True).count(),
+        CACHE_DASHBOARD_SEGUNDOS,
+    )
 
     # 💰 Suma total de ventas reales (solo facturas pagadas)
-    total_ventas = (
-        Factura.objects.filter(usuario=usuario, estado_pago="Pagado")
-        .aggregate(total=Sum('total'))['total']
-        or 0
-    )
+    total_ventas = resumen.total_pagado
 
     # 📋 Últimos pedidos (los 5 más recientes)
     pedidos_recientes = (
@@ -73,8 +137,11 @@ def dashboard(request):
         .order_by('-fecha')[:5]
     )
 
-    # 📦 Productos publicados (no tocar color_list aquí)
-    productos = Product.objects.filter(is_available=True)
+    # 📦 Productos publicados, de a PRODUCTOS_POR_PAGINA (?despues=<id> / ?antes=<id>)
+    pagina = _pagina_productos(
+        despues=_entero_o_none(request.GET.get("despues")),
+        antes=_entero_o_none(request.GET.get("antes")),
+    )
 
     context = {
         'section': 'dashboard',
@@ -82,7 +149,8 @@ def dashboard(request):
         'productos_publicados': productos_publicados,
         'total_ventas': total_ventas,
         'pedidos_recientes': pedidos_recientes,
-        'products': productos,  # se usan las @property en la plantilla
+        'products': pagina["filas"],
+        'pagina_productos': pagina,
     }
     return render(request, 'account/dashboard.html', context)
 